@@ -1,12 +1,34 @@
 """
 ASGI config for ableconnect_backend project.
+
+Serves regular HTTP through Django, the badge event stream at /api/events/
+and chat WebSockets at /ws/chat/.
 """
 
 import os
 
 from django.core.asgi import get_asgi_application
+from django.urls import path, re_path
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ableconnect_backend.settings')
 
-application = get_asgi_application()
+# Initialise Django before importing anything that touches models.
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+
+from api.authentication import JWTAuthMiddleware  # noqa: E402
+from api.consumers import ActivityConsumer  # noqa: E402
+from api.routing import websocket_urlpatterns  # noqa: E402
 
+application = ProtocolTypeRouter({
+    'http': URLRouter([
+        path('api/events/', AuthMiddlewareStack(JWTAuthMiddleware(ActivityConsumer.as_asgi()))),
+        re_path(r'', django_asgi_app),
+    ]),
+    'websocket': AllowedHostsOriginValidator(
+        AuthMiddlewareStack(JWTAuthMiddleware(URLRouter(websocket_urlpatterns)))
+    ),
+})
@@ -4,6 +4,7 @@ Django settings for ableconnect_backend project.
 
 from pathlib import Path
 import os
+from corsheaders.defaults import default_headers
 from decouple import config
 import dj_database_url
 from datetime import timedelta
@@ -17,12 +18,14 @@ DEBUG = config('DEBUG', default=True, cast=bool)
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost,127.0.0.1,*', cast=lambda v: [s.strip() for s in v.split(',')])
 
 INSTALLED_APPS = [
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'channels',
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
@@ -64,6 +67,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'ableconnect_backend.wsgi.application'
+ASGI_APPLICATION = 'ableconnect_backend.asgi.application'
 
 DATABASES = {
     'default': {
@@ -91,6 +95,18 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# PBKDF2 with a tunable work factor; stored hashes made with another count are
+# rehashed on the next successful login. `manage.py benchmark_logins` shows
+# what a given count costs per worker.
+PASSWORD_HASH_ITERATIONS = config('PASSWORD_HASH_ITERATIONS', default=600000, cast=int)
+PASSWORD_HASHERS = [
+    'api.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
@@ -123,6 +139,42 @@ if config('USE_CLOUDINARY', default=False, cast=bool):
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Local memory works for a single node and tests; point CACHE_BACKEND at
+# Redis or Memcached (with CACHE_LOCATION) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='ableconnect'),
+    }
+}
+
+FEED_CACHE_ALIAS = 'default'
+FEED_CACHE_TIMEOUT = config('FEED_CACHE_TIMEOUT', default=300, cast=int)
+
+# Chat WebSockets (api/chat.py). The in-process layer only reaches sockets on
+# the same server process; set CHANNEL_REDIS_URL when running several nodes.
+CHANNEL_REDIS_URL = config('CHANNEL_REDIS_URL', default='')
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [CHANNEL_REDIS_URL]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
+# Badge event stream at /api/events/ (api/activity.py)
+ACTIVITY_HEARTBEAT_INTERVAL = 20
+ACTIVITY_LONG_POLL_TIMEOUT = config('ACTIVITY_LONG_POLL_TIMEOUT', default=25, cast=int)
+# Events kept per user for clients that reconnect with Last-Event-ID or `since`
+ACTIVITY_REPLAY_SIZE = 100
+ACTIVITY_REPLAY_TIMEOUT = 600
+
 AUTH_USER_MODEL = 'api.User'
 
 CORS_ALLOWED_ORIGINS = [
@@ -133,12 +185,19 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+# Conditional GETs (api/conditional.py): cross-origin pages send and read the validators.
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match', 'if-modified-since')
+CORS_EXPOSE_HEADERS = ['ETag', 'Last-Modified']
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
@@ -146,6 +205,18 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20
 }
 
+# Gig, service, message and lean feed lists are read with values() and shaped
+# by api/fastpath.py instead of the serializers; set to False to go back.
+FAST_LIST_SERIALIZATION = config('FAST_LIST_SERIALIZATION', default=True, cast=bool)
+
+# CachedJWTAuthentication keeps users in a per-process LRU (api/usercache.py).
+# Saving a user invalidates it here at once; other processes can serve the
+# old row for up to AUTH_USER_CACHE_TTL seconds. Set AUTH_USER_CACHE_ALIAS
+# to a cache alias to share entries between workers.
+AUTH_USER_CACHE_SIZE = config('AUTH_USER_CACHE_SIZE', default=10000, cast=int)
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=30, cast=int)
+AUTH_USER_CACHE_ALIAS = config('AUTH_USER_CACHE_ALIAS', default='') or None
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -160,6 +231,31 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760
-DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760
+# Tubonge media processing (api/media.py)
+MEDIA_PROCESSING_ASYNC = config('MEDIA_PROCESSING_ASYNC', default=True, cast=bool)
+MEDIA_PROCESSING_WORKERS = config('MEDIA_PROCESSING_WORKERS', default=2, cast=int)
+MEDIA_VARIANT_WIDTHS = [320, 640, 1080]
+
+# Gig/service view counting (api/viewcounts.py); set VIEW_COUNT_ASYNC=False to
+# write each view immediately, e.g. in tests
+VIEW_COUNT_ASYNC = config('VIEW_COUNT_ASYNC', default=True, cast=bool)
+VIEW_COUNT_FLUSH_INTERVAL = config('VIEW_COUNT_FLUSH_INTERVAL', default=10, cast=int)
+VIEW_COUNT_FLUSH_THRESHOLD = 500
+VIEW_COUNT_DEDUP_WINDOW = 1800
+
+# Skill-based recommendations (api/recommend.py); each process keeps its own
+# index and picks up other processes' listing changes this often
+RECOMMEND_SYNC_INTERVAL = config('RECOMMEND_SYNC_INTERVAL', default=60, cast=int)
+
+# Largest batch accepted by the bulk gig/service endpoints (api/bulk.py)
+BULK_LISTING_MAX_ITEMS = 500
+
+# Resumable uploads (api/uploads.py); chunk scratch files stay on local disk
+RESUMABLE_UPLOAD_MAX_SIZE = config('RESUMABLE_UPLOAD_MAX_SIZE', default=104857600, cast=int)
+RESUMABLE_UPLOAD_DIR = config('RESUMABLE_UPLOAD_DIR', default='')
+
+# Multipart files above 2.5 MB spool to a temp file instead of worker memory;
+# large files should go through /api/uploads/ instead.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
+DATA_UPLOAD_MAX_MEMORY_SIZE = 2621440
 
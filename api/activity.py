@@ -0,0 +1,148 @@
+"""
+Badge counters pushed to /api/events/ (see api/consumers.py).
+
+Model signals turn writes into compact counter events for the users whose
+badges change:
+
+* `unread`   - keyed by the other user's id; `delta` on a new message,
+               `value: 0` when the thread is read
+* `bids`     - keyed by gig id, sent to the gig's client
+* `bookings` - keyed by service id, sent to the service's client
+
+Events travel over the same channel layer as chat, so the in-process layer
+serves one node and CHANNEL_REDIS_URL fans out across several. Connected
+clients hold no database connection while idle; only the snapshot sent on
+connect reads from the database.
+
+Each user's events are numbered and the last ACTIVITY_REPLAY_SIZE of them are
+kept in the cache for ACTIVITY_REPLAY_TIMEOUT seconds. A client that
+reconnects with `Last-Event-ID` or polls again with `since` is sent what it
+missed; one that is further behind, or whose events have expired, gets a
+fresh snapshot instead.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import Bid, Booking, Conversation
+
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPE = 'activity.event'
+
+
+def get_replay_size():
+    return getattr(settings, 'ACTIVITY_REPLAY_SIZE', 100)
+
+
+def get_replay_timeout():
+    return getattr(settings, 'ACTIVITY_REPLAY_TIMEOUT', 600)
+
+
+def user_group(user_id):
+    return f'activity.user.{user_id}'
+
+
+def _sequence_key(user_id):
+    return f'activity:seq:{user_id}'
+
+
+def _event_key(user_id, event_id):
+    return f'activity:event:{user_id}:{event_id}'
+
+
+def last_event_id(user_id):
+    return cache.get(_sequence_key(user_id), 0)
+
+
+def record(user_id, payload):
+    """Number `payload` and keep it for replay; returns the payload with its `id`"""
+    cache.add(_sequence_key(user_id), 0, timeout=None)
+    event_id = cache.incr(_sequence_key(user_id))
+    payload = dict(payload, id=event_id)
+    cache.set(_event_key(user_id, event_id), payload, get_replay_timeout())
+    return payload
+
+
+def replay(user_id, since, last_id):
+    """The events after `since` up to `last_id`, or None when they are no longer all held"""
+    if since > last_id or last_id - since > get_replay_size():
+        # Ahead of the sequence means it was reset; too far behind means trimmed.
+        return None
+    keys = [_event_key(user_id, event_id) for event_id in range(since + 1, last_id + 1)]
+    found = cache.get_many(keys)
+    if len(found) != len(keys):
+        return None
+    return [found[key] for key in keys]
+
+
+def catch_up(user_id, since=None, initial_snapshot=True):
+    """
+    What a connecting client has missed, as `(last_id, events, snapshot)`.
+
+    With `since` the buffered events after it are returned. A client that is
+    further behind than the buffer, or a new one when `initial_snapshot` is
+    set, gets a snapshot instead; otherwise `snapshot` is None.
+    """
+    last_id = last_event_id(user_id)
+    if since is not None:
+        events = replay(user_id, since, last_id)
+        if events is not None:
+            return last_id, events, None
+    elif not initial_snapshot:
+        return last_id, [], None
+    return last_id, [], snapshot(user_id)
+
+
+def publish(user_id, payload):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        payload = record(user_id, payload)
+        async_to_sync(layer.group_send)(user_group(user_id), {'type': EVENT_TYPE, 'payload': payload})
+    except Exception:
+        logger.exception('Could not publish activity event to user %s', user_id)
+
+
+def counter_delta(user_id, counter, key, delta=1):
+    publish(user_id, {'counter': counter, 'key': key, 'delta': delta})
+
+
+def counter_value(user_id, counter, key, value):
+    publish(user_id, {'counter': counter, 'key': key, 'value': value})
+
+
+def snapshot(user_id):
+    """
+    Current counts for a fresh connection: unread messages per conversation
+    partner, and bids and bookings per open gig and service of the user's.
+    Later `delta` events apply on top of these.
+    """
+    conversations = Conversation.objects.filter(
+        Q(user_low_id=user_id, low_unread__gt=0) | Q(user_high_id=user_id, high_unread__gt=0)
+    ).values_list('user_low_id', 'user_high_id', 'low_unread', 'high_unread')
+    unread = {}
+    for low, high, low_unread, high_unread in conversations:
+        if low == user_id:
+            unread[str(high)] = low_unread
+        else:
+            unread[str(low)] = high_unread
+    bids = (
+        Bid.objects.filter(gig__client_id=user_id, gig__status='open')
+        .values_list('gig_id').annotate(n=Count('*')).order_by()
+    )
+    bookings = (
+        Booking.objects.filter(service__client_id=user_id, service__status='open')
+        .values_list('service_id').annotate(n=Count('*')).order_by()
+    )
+    return {
+        'unread': unread,
+        'bids': {str(gig_id): n for gig_id, n in bids},
+        'bookings': {str(service_id): n for service_id, n in bookings},
+    }
@@ -5,6 +5,23 @@ from .models import (
     User, TubongePost, PostComment, Gig, Service, 
     Bid, Booking, Message
 )
+from . import search
+
+
+class SearchIndexAdminMixin:
+    """Match the admin search box against the full-text index.
+
+    Text columns are looked up through the index; `search_fields` only covers
+    the remaining short columns such as usernames.
+    """
+    search_kind = None
+    
+    def get_search_results(self, request, queryset, search_term):
+        by_fields, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if not search.has_terms(search_term):
+            return by_fields, may_have_duplicates
+        by_text = queryset.filter(pk__in=search.matching_ids(self.search_kind, search_term))
+        return by_fields | by_text, may_have_duplicates
 
 
 @admin.register(User)
@@ -21,11 +38,12 @@ class UserAdmin(BaseUserAdmin):
 
 
 @admin.register(TubongePost)
-class TubongePostAdmin(admin.ModelAdmin):
+class TubongePostAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     """Admin for Tubonge posts with delete privilege"""
     list_display = ['id', 'author', 'text_preview', 'like_count', 'created_at', 'delete_button']
     list_filter = ['created_at', 'author']
-    search_fields = ['text', 'author__username', 'author__email']
+    search_fields = ['author__username', 'author__email']
+    search_kind = 'post'
     readonly_fields = ['created_at', 'updated_at']
     
     def text_preview(self, obj):
@@ -52,11 +70,12 @@ class PostCommentAdmin(admin.ModelAdmin):
 
 
 @admin.register(Gig)
-class GigAdmin(admin.ModelAdmin):
+class GigAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     """Admin for Gigs with delete privilege"""
     list_display = ['id', 'title', 'client', 'price', 'status', 'views', 'created_at', 'delete_button']
     list_filter = ['status', 'created_at', 'client']
-    search_fields = ['title', 'description', 'client__username']
+    search_fields = ['client__username']
+    search_kind = 'gig'
     readonly_fields = ['created_at', 'updated_at', 'views']
     
     def delete_button(self, obj):
@@ -68,11 +87,12 @@ class GigAdmin(admin.ModelAdmin):
 
 
 @admin.register(Service)
-class ServiceAdmin(admin.ModelAdmin):
+class ServiceAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     """Admin for Services with delete privilege"""
     list_display = ['id', 'title', 'client', 'price', 'status', 'views', 'created_at', 'delete_button']
     list_filter = ['status', 'created_at', 'client']
-    search_fields = ['title', 'description', 'client__username']
+    search_fields = ['client__username']
+    search_kind = 'service'
     readonly_fields = ['created_at', 'updated_at', 'views']
     
     def delete_button(self, obj):
@@ -100,11 +120,19 @@ class BookingAdmin(admin.ModelAdmin):
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     """Admin for Messages with ability to initiate chat"""
-    list_display = ['id', 'sender', 'recipient', 'text_preview', 'is_read', 'created_at', 'initiate_chat_button']
-    list_filter = ['is_read', 'created_at']
+    list_display = ['id', 'sender', 'recipient', 'text_preview', 'read_status', 'created_at', 'initiate_chat_button']
+    list_filter = ['created_at']
     search_fields = ['text', 'sender__username', 'recipient__username']
     readonly_fields = ['created_at']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_read_state()
+    
+    def read_status(self, obj):
+        return obj.is_read
+    read_status.boolean = True
+    read_status.short_description = 'Read'
+    
     def text_preview(self, obj):
         return obj.text[:50] + '...' if len(obj.text) > 50 else obj.text
     text_preview.short_description = 'Text'
@@ -0,0 +1,70 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+
+from . import usercache
+
+
+class CachedUserModel:
+    """
+    The user model as JWTAuthentication.get_user sees it. That method only
+    calls `objects.get(<USER_ID_FIELD>=<id>)` and catches `DoesNotExist`, so
+    the lookup is answered from api/usercache.py and falls back to the
+    model's own manager on a miss.
+    """
+    
+    def __init__(self, model):
+        self.model = model
+        self.DoesNotExist = model.DoesNotExist
+        self.objects = self
+    
+    def get(self, **lookup):
+        (field, value), = lookup.items()
+        return usercache.get_user(value, lambda user_id: self.model._default_manager.get(**{field: user_id}))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user through api/usercache.py,
+    so warm requests make no user query. simplejwt's own get_user still runs
+    its active and revoked-token checks on every request against the cached row.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_model = CachedUserModel(self.user_model)
+
+
+@database_sync_to_async
+def get_user_for_token(raw_token):
+    authentication = CachedJWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Authenticate Channels connections from a `Bearer` Authorization header or
+    a `?token=<access token>` query parameter, since browsers cannot set
+    headers on a WebSocket or EventSource. Connections without a token keep
+    the session user set by AuthMiddleware.
+    """
+    
+    async def __call__(self, scope, receive, send):
+        token = None
+        authorization = dict(scope.get('headers', [])).get(b'authorization', b'').decode('latin1').split()
+        if len(authorization) == 2 and authorization[0] == 'Bearer':
+            token = authorization[1]
+        else:
+            tokens = parse_qs(scope.get('query_string', b'').decode()).get('token')
+            if tokens:
+                token = tokens[-1]
+        if token:
+            scope = dict(scope, user=await get_user_for_token(token))
+        return await super().__call__(scope, receive, send)
@@ -0,0 +1,142 @@
+"""
+Bulk create, update and close for gig and service listings.
+
+A batch is validated with the listing serializer in `many=True` mode and
+written inside one transaction with one statement per step: `bulk_create`
+for new rows, `bulk_update` for edits and a single `UPDATE ... WHERE id IN`
+for closing. Batches are all or nothing. If any item is invalid or names a
+listing the caller does not own, nothing is written and the error lists the
+failing items by index.
+
+Bulk writes send no model signals, so the search entries and recommendation
+index that api/signals.py normally maintains are updated here.
+
+`manage.py benchmark_bulk_listings` times a batch against the same items
+saved one at a time through the serializer.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import recommend, search, uploads
+
+
+SEARCHABLE_FIELDS = {'title', 'description', 'requirements'}
+
+
+class BulkError(Exception):
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.errors = errors or []
+
+
+def get_max_items():
+    return getattr(settings, 'BULK_LISTING_MAX_ITEMS', 500)
+
+
+def _check_batch(data):
+    if not isinstance(data, list) or not data:
+        raise BulkError('Expected a non-empty list of items.')
+    if len(data) > get_max_items():
+        raise BulkError(f'At most {get_max_items()} items can be sent at once.')
+
+
+def _item_errors(errors):
+    """Turn ListSerializer errors into [{'index', 'errors'}] for the failing items"""
+    return [{'index': index, 'errors': item} for index, item in enumerate(errors) if item]
+
+
+def _check_ids(ids):
+    """Validate a list of listing ids, reporting bad or repeated entries by index"""
+    errors = []
+    seen = set()
+    for index, pk in enumerate(ids):
+        if not isinstance(pk, int) or isinstance(pk, bool) or pk <= 0:
+            errors.append({'index': index, 'errors': {'id': ['Must be a listing id.']}})
+        elif pk in seen:
+            errors.append({'index': index, 'errors': {'id': ['Listed more than once.']}})
+        seen.add(pk)
+    if errors:
+        raise BulkError('Some items are invalid.', errors)
+
+
+def _check_owned(ids, owned):
+    missing = [
+        {'index': index, 'errors': {'id': ['Not found.']}}
+        for index, pk in enumerate(ids) if pk not in owned
+    ]
+    if missing:
+        raise BulkError('Some items are invalid.', missing)
+
+
+def create_listings(serializer_class, data, client, context):
+    """Validate and insert a list of new listings; returns the saved instances"""
+    _check_batch(data)
+    serializer = serializer_class(data=data, many=True, context=context)
+    if not serializer.is_valid():
+        raise BulkError('Some items are invalid.', _item_errors(serializer.errors))
+
+    model = serializer.child.Meta.model
+    instances = [model(client=client, **attrs) for attrs in serializer.validated_data]
+    with transaction.atomic():
+        instances = model.objects.bulk_create(instances)
+        search.index_instances(instances)
+        uploads.mark_attached(getattr(serializer, 'claimed_uploads', []))
+    transaction.on_commit(lambda: recommend.refresh_listings(model, [obj.pk for obj in instances]))
+    return instances
+
+
+def update_listings(serializer_class, queryset, data, client, context):
+    """
+    Apply partial edits to several of the client's listings.
+
+    Every item needs an `id`; the remaining keys are validated like a PATCH.
+    Returns the updated instances, re-read from `queryset`.
+    """
+    _check_batch(data)
+    if not all(isinstance(item, dict) for item in data):
+        raise BulkError('Every item must be an object.')
+    ids = [item.get('id') for item in data]
+    _check_ids(ids)
+
+    serializer = serializer_class(
+        data=[{key: value for key, value in item.items() if key != 'id'} for item in data],
+        many=True, partial=True, context=context,
+    )
+    if not serializer.is_valid():
+        raise BulkError('Some items are invalid.', _item_errors(serializer.errors))
+
+    model = queryset.model
+    now = timezone.now()
+    with transaction.atomic():
+        instances = model.objects.select_for_update().filter(client=client).in_bulk(ids)
+        _check_owned(ids, instances)
+        fields = {'updated_at'}
+        for pk, attrs in zip(ids, serializer.validated_data):
+            instance = instances[pk]
+            for field, value in attrs.items():
+                setattr(instance, field, value)
+            instance.updated_at = now
+            fields.update(attrs)
+        model.objects.bulk_update(instances.values(), sorted(fields))
+        if fields & SEARCHABLE_FIELDS:
+            search.index_instances(list(instances.values()))
+        uploads.mark_attached(getattr(serializer, 'claimed_uploads', []))
+    transaction.on_commit(lambda: recommend.refresh_listings(model, ids))
+    updated = queryset.in_bulk(ids)
+    return [updated[pk] for pk in ids if pk in updated]
+
+
+def close_listings(model, ids, client):
+    """Close the client's listings with one UPDATE; returns how many changed"""
+    _check_batch(ids)
+    _check_ids(ids)
+    with transaction.atomic():
+        owned = set(model.objects.filter(client=client, pk__in=ids).values_list('pk', flat=True))
+        _check_owned(ids, owned)
+        closed = model.objects.filter(pk__in=ids, client=client).exclude(status='closed').update(
+            status='closed', updated_at=timezone.now(),
+        )
+    transaction.on_commit(lambda: recommend.refresh_listings(model, ids))
+    return closed
@@ -0,0 +1,122 @@
+"""
+Versioned response cache for the Tubonge feed and comment threads.
+
+Cached bodies are stored under keys that embed a version number. Writes never
+delete keys; they bump the version (see api/signals.py) so every later read
+misses once and repopulates, while older entries simply expire. Only the part
+of a response that is the same for every viewer and changes when a post is
+created, edited or deleted is cached. Counters, comment previews and per-user
+fields such as `liked_by_me` are layered on top after a hit (see api/feed.py).
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+
+FEED_NAMESPACE = 'tubonge:feed'
+COMMENTS_NAMESPACE = 'tubonge:comments'
+
+
+def get_cache():
+    return caches[getattr(settings, 'FEED_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'FEED_CACHE_TIMEOUT', 300)
+
+
+class CacheStats:
+    """Per-process hit and miss counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+stats = CacheStats()
+
+
+def _version_key(namespace):
+    return f'{namespace}:version'
+
+
+def get_version(namespace):
+    cache = get_cache()
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted counter never reuses an old version.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(namespace):
+    cache = get_cache()
+    key = _version_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+
+
+def bump_version(namespace):
+    _bump(namespace)
+    if connection.in_atomic_block:
+        # A read between the write and its commit can store the old rows under
+        # the new version, so bump once more when they become visible.
+        transaction.on_commit(lambda: _bump(namespace))
+
+
+def comments_namespace(post_id):
+    return f'{COMMENTS_NAMESPACE}:{post_id}'
+
+
+def invalidate_feed():
+    bump_version(FEED_NAMESPACE)
+
+
+def invalidate_comments(post_id):
+    bump_version(comments_namespace(post_id))
+
+
+def request_key(namespace, request, *parts):
+    """Key a response by namespace version, extra parts and the full request URL"""
+    url = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    prefix = ':'.join(str(part) for part in parts)
+    return f'{namespace}:v{get_version(namespace)}:{prefix}:{url}'
+
+
+def fetch(key):
+    data = get_cache().get(key)
+    stats.record(data is not None)
+    return data
+
+
+def store(key, data):
+    get_cache().set(key, data, get_timeout())
@@ -0,0 +1,59 @@
+"""
+Real-time chat delivery over the channel layer.
+
+Every connected socket joins its user's group (see api/consumers.py). New
+messages, read receipts and typing events are sent to the groups of both
+participants, so a user's other tabs stay in step too. Publishing happens
+after commit and never fails the request: a client that misses an event
+catches up from `/messages/with_user/` on its next load.
+
+With the in-process layer only sockets served by the same process receive
+events; set CHANNEL_REDIS_URL to fan out across nodes.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from . import activity
+from .models import Conversation
+from .serializers import MessageSerializer
+
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPE = 'chat.event'
+
+
+def user_group(user_id):
+    return f'chat.user.{user_id}'
+
+
+def group_event(payload):
+    return {'type': EVENT_TYPE, 'payload': payload}
+
+
+def publish(user_ids, payload):
+    """Send `payload` to every socket of the given users"""
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    for user_id in set(user_ids):
+        try:
+            async_to_sync(layer.group_send)(user_group(user_id), group_event(payload))
+        except Exception:
+            logger.exception('Could not publish chat event to user %s', user_id)
+
+
+def publish_message(message):
+    payload = {'type': 'message', 'message': MessageSerializer(message).data}
+    publish([message.sender_id, message.recipient_id], payload)
+
+
+def mark_read(reader_id, other_id):
+    """Advance the reader's watermark and send a receipt to both sides"""
+    updated = Conversation.mark_read(reader_id, other_id)
+    if updated:
+        publish([reader_id, other_id], {'type': 'read', 'reader': reader_id, 'user': other_id})
+        activity.counter_value(reader_id, 'unread', other_id, 0)
+    return updated
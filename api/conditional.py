@@ -0,0 +1,79 @@
+"""
+Conditional GETs (ETag / Last-Modified) for gigs, services and Tubonge posts.
+
+Validators are read from the rows themselves, so no write has to keep them
+current and every worker derives the same ones. A detail's come from its
+row's `updated_at` and its owner's, whose summary the row embeds. A list's
+come from one aggregate over the rows its filters select: the newest
+`updated_at` among them and their owners, and the row count, which moves
+when a row is deleted. The aggregate runs before a page is queried or
+serialized. The ETag also hashes the request URL, the user (liked_by_me
+differs per viewer) and the renderer; Last-Modified is the newest stamp.
+
+Counters (likes, comments, bids, bookings and views) are left out. They
+change far more often than the rows, and following them would resend every
+list after each like or view flush. The ETags are weak for that reason: a
+304 may stand for a body whose counts have since moved, which clients pick
+up when the rows next change.
+
+If-None-Match and If-Modified-Since are evaluated by Django's
+get_conditional_response, so If-None-Match wins when both are sent, and a
+match is answered with an empty 304. Responses are marked private and
+no-cache, so caches keep them but always revalidate.
+"""
+import functools
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def _validators(request, parts, stamps):
+    renderer = getattr(request, 'accepted_renderer', None)
+    parts = [
+        request.get_full_path(), request.user.pk, renderer.format if renderer is not None else '',
+        *parts, *[stamp.isoformat() if stamp is not None else '' for stamp in stamps],
+    ]
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest}"', max(filter(None, stamps), default=None)
+
+
+def list_validators(request, queryset, owner):
+    """(etag, last_modified) for a list of `queryset`'s rows, each embedding the user named by `owner`"""
+    state = queryset.order_by().aggregate(
+        count=Count('pk'), changed=Max('updated_at'), owner_changed=Max(f'{owner}__updated_at'),
+    )
+    return _validators(request, [state['count']], [state['changed'], state['owner_changed']])
+
+
+def detail_validators(request, instance, owner):
+    """(etag, last_modified) for one row, which embeds the user named by `owner`"""
+    return _validators(request, [instance.pk], [instance.updated_at, getattr(instance, owner).updated_at])
+
+
+def respond(request, validators, render):
+    """A 304 if `request`'s conditional headers match `validators`, otherwise `render()`, stamped either way"""
+    etag, last_modified = validators
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = render()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def list_action(method):
+    """Serve a viewset's list() conditionally on its get_validator_queryset() and `owner_field`"""
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        return respond(
+            request, list_validators(request, view.get_validator_queryset(), view.owner_field),
+            lambda: method(view, request, *args, **kwargs),
+        )
+    return wrapper
+
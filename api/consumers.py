@@ -0,0 +1,208 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.http import AsyncHttpConsumer
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from . import activity, chat
+from .models import Conversation
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Per-user chat socket.
+
+    Server events: `message` (a new Message), `read` (a read receipt) and
+    `typing`. Clients may send `{"type": "typing", "user": <id>}` and
+    `{"type": "read", "user": <id>}` for users they already have a
+    conversation with; new messages still go through POST /api/messages/.
+    """
+    
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        self.user_id = user.pk
+        self.group_name = chat.user_group(user.pk)
+        self.peers = set()
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+    
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+    
+    async def receive_json(self, content, **kwargs):
+        event_type = content.get('type') if isinstance(content, dict) else None
+        if event_type not in ('typing', 'read'):
+            await self.send_json({'type': 'error', 'error': 'Unknown event type'})
+            return
+        try:
+            peer_id = int(content.get('user'))
+        except (TypeError, ValueError):
+            await self.send_json({'type': 'error', 'error': 'user is required'})
+            return
+        if not await self.can_reach(peer_id):
+            await self.send_json({'type': 'error', 'error': 'No conversation with that user'})
+            return
+        
+        if event_type == 'typing':
+            payload = {'type': 'typing', 'user': self.user_id}
+            await self.channel_layer.group_send(chat.user_group(peer_id), chat.group_event(payload))
+        else:
+            await database_sync_to_async(chat.mark_read)(self.user_id, peer_id)
+    
+    async def can_reach(self, peer_id):
+        if peer_id not in self.peers:
+            if not await database_sync_to_async(self._conversation_exists)(peer_id):
+                return False
+            self.peers.add(peer_id)
+        return True
+    
+    def _conversation_exists(self, peer_id):
+        low, high = Conversation.pair(self.user_id, peer_id)
+        return Conversation.objects.filter(user_low_id=low, user_high_id=high).exists()
+    
+    async def chat_event(self, event):
+        await self.send_json(event['payload'])
+
+
+class ActivityConsumer(AsyncHttpConsumer):
+    """
+    Badge counter stream at /api/events/.
+    
+    By default the response is a Server-Sent Events stream: a `snapshot`
+    event, then a `counter` event per change and a comment line as a
+    heartbeat. Every event carries an id, so a reconnecting EventSource sends
+    `Last-Event-ID` and is replayed what it missed instead of a snapshot.
+    With `?mode=poll` it is a long poll that answers with
+    `{"events": [...], "last_event_id": n}` as soon as something happens or
+    after a timeout; pass that id back as `since` to receive the events in
+    between, and add `snapshot=1` to get current counts straight away.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.group_name = None
+        self.timer = None
+        self.events = []
+        self.last_id = 0
+        self.finished = False
+    
+    async def http_request(self, message):
+        # Unlike a plain HTTP consumer, stay alive after handle() so channel
+        # layer events can still be dispatched to this response.
+        if message.get('more_body'):
+            return
+        await self.handle(b'')
+    
+    def cors_headers(self):
+        headers = dict(self.scope.get('headers', []))
+        origin = headers.get(b'origin', b'').decode('latin1')
+        if origin and origin in getattr(settings, 'CORS_ALLOWED_ORIGINS', []):
+            return [
+                (b'Access-Control-Allow-Origin', origin.encode('latin1')),
+                (b'Access-Control-Allow-Credentials', b'true'),
+                (b'Vary', b'Origin'),
+            ]
+        return []
+    
+    async def send_json_response(self, status, data):
+        self.finished = True
+        headers = [(b'Content-Type', b'application/json'), (b'Cache-Control', b'no-store')]
+        await self.send_response(status, json.dumps(data).encode(), headers=headers + self.cors_headers())
+    
+    def requested_since(self, params):
+        """The last event id the client holds, from Last-Event-ID or `since`"""
+        headers = dict(self.scope.get('headers', []))
+        value = headers.get(b'last-event-id', b'').decode('latin1') or params.get('since', [''])[-1]
+        return int(value) if value.isdigit() else None
+    
+    async def handle(self, body):
+        if self.scope.get('method') != 'GET':
+            await self.send_json_response(405, {'error': 'Method not allowed'})
+            return
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.send_json_response(401, {'error': 'Authentication credentials were not provided.'})
+            return
+        
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        self.polling = params.get('mode', [''])[-1] == 'poll'
+        # Join before catching up, so nothing published in between is lost;
+        # events already replayed are skipped by id.
+        self.group_name = activity.user_group(user.pk)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        initial_snapshot = not self.polling or params.get('snapshot', [''])[-1] == '1'
+        self.last_id, missed, counts = await database_sync_to_async(activity.catch_up)(
+            user.pk, self.requested_since(params), initial_snapshot
+        )
+        
+        if self.polling:
+            if counts is not None or missed:
+                data = {'events': missed, 'last_event_id': self.last_id}
+                if counts is not None:
+                    data['snapshot'] = counts
+                await self.send_json_response(200, data)
+                await self.leave()
+                return
+            timeout = getattr(settings, 'ACTIVITY_LONG_POLL_TIMEOUT', 25)
+            self.timer = asyncio.ensure_future(self.finish_poll(timeout))
+            return
+        
+        headers = [
+            (b'Content-Type', b'text/event-stream'),
+            (b'Cache-Control', b'no-cache'),
+            # Stop nginx and similar proxies from buffering the stream.
+            (b'X-Accel-Buffering', b'no'),
+        ]
+        await self.send_headers(headers=headers + self.cors_headers())
+        body = b'retry: 3000\n\n'
+        if counts is not None:
+            body += self.format_event('snapshot', counts, self.last_id)
+        for event in missed:
+            body += self.format_event('counter', event, event['id'])
+        await self.send_body(body, more_body=True)
+        self.timer = asyncio.ensure_future(self.heartbeat())
+    
+    def format_event(self, name, data, event_id):
+        return f'id: {event_id}\nevent: {name}\ndata: {json.dumps(data)}\n\n'.encode()
+    
+    async def heartbeat(self):
+        interval = getattr(settings, 'ACTIVITY_HEARTBEAT_INTERVAL', 20)
+        while True:
+            await asyncio.sleep(interval)
+            await self.send_body(b': ping\n\n', more_body=True)
+    
+    async def finish_poll(self, delay):
+        await asyncio.sleep(delay)
+        await self.send_json_response(200, {'events': self.events, 'last_event_id': self.last_id})
+        await self.leave()
+    
+    async def activity_event(self, event):
+        payload = event['payload']
+        if self.finished or payload['id'] <= self.last_id:
+            return
+        self.last_id = payload['id']
+        if not self.polling:
+            await self.send_body(self.format_event('counter', payload, payload['id']), more_body=True)
+            return
+        self.events.append(payload)
+        # Give events published by the same write a moment to arrive together.
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = asyncio.ensure_future(self.finish_poll(0.05))
+    
+    async def leave(self):
+        if self.group_name is not None:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            self.group_name = None
+    
+    async def disconnect(self):
+        if self.timer is not None and self.timer is not asyncio.current_task():
+            self.timer.cancel()
+        await self.leave()
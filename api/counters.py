@@ -0,0 +1,150 @@
+"""
+Denormalized counters on TubongePost.
+
+`like_count` and `comments_count` live on the post row so feed reads never
+join or aggregate. They are adjusted with atomic F() updates whenever likes or
+comments change (see api/signals.py), and `reconcile_post_counters` repairs
+any drift left behind by raw SQL or interrupted writes.
+"""
+from django.db import connection, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import PostComment, TubongePost
+
+
+LikeThrough = TubongePost.likes.through
+
+_TOGGLE_LIKE_SQL = """
+WITH removed AS (
+    DELETE FROM {through}
+    WHERE {post_col} = %(post)s AND {user_col} = %(user)s
+    RETURNING 1
+), added AS (
+    INSERT INTO {through} ({post_col}, {user_col})
+    SELECT %(post)s, %(user)s
+    WHERE NOT EXISTS (SELECT 1 FROM removed)
+      AND EXISTS (SELECT 1 FROM {post} WHERE {post_pk} = %(post)s)
+    ON CONFLICT DO NOTHING
+    RETURNING 1
+)
+UPDATE {post}
+SET {like_count} = {like_count} + (SELECT COUNT(*) FROM added) - (SELECT COUNT(*) FROM removed)
+WHERE {post_pk} = %(post)s
+RETURNING NOT EXISTS (SELECT 1 FROM removed), {like_count}
+"""
+
+
+def _toggle_like_sql():
+    qn = connection.ops.quote_name
+    return _TOGGLE_LIKE_SQL.format(
+        through=qn(LikeThrough._meta.db_table),
+        post_col=qn(LikeThrough._meta.get_field('tubongepost').column),
+        user_col=qn(LikeThrough._meta.get_field('user').column),
+        post=qn(TubongePost._meta.db_table),
+        post_pk=qn(TubongePost._meta.pk.column),
+        like_count=qn(TubongePost._meta.get_field('like_count').column),
+    )
+
+
+def toggle_like(post_id, user_id):
+    """
+    Like or unlike a post for a user and return `(liked, like_count)`.
+
+    On PostgreSQL this is a single statement: data-modifying CTEs delete the
+    like if present, otherwise insert it, and the counter is adjusted in the
+    same round trip. Other backends run the equivalent steps in a transaction.
+    Raises TubongePost.DoesNotExist if the post is missing.
+
+    `liked` is the state after the call. When two taps race, the loser's
+    insert meets the winner's row and does nothing, but the like still exists.
+    """
+    return _toggle_like(post_id, user_id)
+
+
+def _toggle_like(post_id, user_id):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(_toggle_like_sql(), {'post': post_id, 'user': user_id})
+            row = cursor.fetchone()
+        if row is None:
+            raise TubongePost.DoesNotExist
+        return bool(row[0]), row[1]
+
+    with transaction.atomic():
+        posts = TubongePost.objects.filter(pk=post_id)
+        removed, _ = LikeThrough.objects.filter(tubongepost_id=post_id, user_id=user_id).delete()
+        if removed:
+            delta = -removed
+        else:
+            if not posts.exists():
+                raise TubongePost.DoesNotExist
+            LikeThrough.objects.bulk_create(
+                [LikeThrough(tubongepost_id=post_id, user_id=user_id)], ignore_conflicts=True
+            )
+            delta = 1
+        posts.update(like_count=F('like_count') + delta)
+        like_count = posts.values_list('like_count', flat=True).get()
+    return delta > 0, like_count
+
+
+def adjust_like_count(post_ids, delta):
+    TubongePost.objects.filter(pk__in=post_ids).update(like_count=F('like_count') + delta)
+
+
+def adjust_comments_count(post_id, delta):
+    TubongePost.objects.filter(pk=post_id).update(comments_count=F('comments_count') + delta)
+
+
+def _actual_like_count():
+    likes = (
+        LikeThrough.objects.filter(tubongepost_id=OuterRef('pk'))
+        .order_by().values('tubongepost_id').annotate(n=Count('*')).values('n')
+    )
+    return Coalesce(Subquery(likes, output_field=IntegerField()), 0)
+
+
+def _actual_comments_count():
+    comments = (
+        PostComment.objects.filter(post_id=OuterRef('pk'))
+        .order_by().values('post_id').annotate(n=Count('*')).values('n')
+    )
+    return Coalesce(Subquery(comments, output_field=IntegerField()), 0)
+
+
+def recount_likes(post_ids):
+    """Recompute like_count from the likes table for the given posts."""
+    TubongePost.objects.filter(pk__in=post_ids).update(like_count=_actual_like_count())
+
+
+def reconcile_post_counters(batch_size=1000):
+    """
+    Walk TubongePost in primary-key batches and rewrite drifted counters.
+
+    Each batch finds its drifted rows with one query and fixes them with one
+    UPDATE, so the table is never locked as a whole. Returns the number of
+    posts that were corrected.
+    """
+    fixed = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            TubongePost.objects.filter(pk__gt=last_pk)
+            .order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return fixed
+        last_pk = batch[-1]
+        drifted = list(
+            TubongePost.objects.filter(pk__in=batch)
+            .annotate(actual_likes=_actual_like_count(), actual_comments=_actual_comments_count())
+            .filter(~Q(like_count=F('actual_likes')) | ~Q(comments_count=F('actual_comments')))
+            .values_list('pk', flat=True)
+        )
+        if drifted:
+            with transaction.atomic():
+                TubongePost.objects.filter(pk__in=drifted).update(
+                    like_count=_actual_like_count(),
+                    comments_count=_actual_comments_count(),
+                )
+            fixed += len(drifted)
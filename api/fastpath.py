@@ -0,0 +1,214 @@
+"""
+Fast path for the hot list endpoints.
+
+A list page normally builds a model instance per row and runs every DRF
+field on it. A `Shape` reads the same page with `values()` instead and turns
+each row into the dict the serializer would have produced. The converters
+are compiled once from the serializer's own fields, so the output keeps the
+serializer's keys, order and formatting. Nested users are rendered once per
+page, as UserSummarySerializer does.
+
+Shapes are compiled at import time and refuse fields they cannot reproduce,
+such as method fields or nested lists, unless the field is listed as
+`computed`. Computed fields are left as None for the view to fill in from
+its own page-level lookups. Sparse requests (`?fields=`, see api/sparse.py)
+get a shape compiled from the cut-down serializer, cached per fieldset; if
+that cannot be compiled the request goes through the serializer instead.
+
+Setting FAST_LIST_SERIALIZATION to False sends every list back through the
+serializers. FastPathTests in api/tests.py check that both paths give
+identical JSON, and `manage.py benchmark_fast_serializers` compares their
+speed.
+"""
+from operator import itemgetter
+
+from django.conf import settings
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from . import sparse
+from .serializers import (
+    GigSerializer, MessageSerializer, ServiceSerializer, TubongeFeedSerializer, UserSummarySerializer,
+)
+
+
+class ShapeError(Exception):
+    pass
+
+
+def enabled():
+    return getattr(settings, 'FAST_LIST_SERIALIZATION', True)
+
+
+def _present(convert):
+    """Wrap `convert` so None passes through, as Serializer.to_representation does"""
+    def get(value):
+        return None if value is None else convert(value)
+    return get
+
+
+def _datetime(field):
+    """DateTimeField.to_representation for ISO 8601 output, resolving the timezone once per page"""
+    if getattr(field, 'format', api_settings.DATETIME_FORMAT) != ISO_8601:
+        return lambda context: _present(field.to_representation)
+
+    def make(context):
+        tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if tz is None:
+            return _present(field.to_representation)
+
+        def convert(value):
+            if value.tzinfo is None:
+                return field.to_representation(value)
+            text = value.astimezone(tz).isoformat()
+            return text[:-6] + 'Z' if text.endswith('+00:00') else text
+        return _present(convert)
+    return make
+
+
+def _file(field, model_field):
+    """FileField.to_representation from the stored name alone"""
+    storage = model_field.storage
+    use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+
+    def make(context):
+        request = context['request']
+
+        def convert(name):
+            if not name:
+                return None
+            if not use_url:
+                return name
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+        return convert
+    return make
+
+
+def _converter(field, model):
+    """A per-page converter factory for one serializer field, or None for an identity field"""
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime(field)
+    if isinstance(field, serializers.FileField):
+        return _file(field, model._meta.get_field(field.source))
+    if isinstance(field, (serializers.DecimalField, serializers.DateField, serializers.FloatField)):
+        return lambda context: _present(field.to_representation)
+    if isinstance(field, serializers.BooleanField):
+        return lambda context: _present(bool)
+    if isinstance(field, (
+        serializers.IntegerField, serializers.CharField, serializers.ChoiceField,
+        serializers.JSONField, serializers.ReadOnlyField, serializers.PrimaryKeyRelatedField,
+    )):
+        return None
+    raise ShapeError(f'{type(field).__name__} {field.field_name!r} has no fast-path converter.')
+
+
+class Shape:
+    """The compiled row-to-dict form of one list serializer"""
+
+    def __init__(self, serializer, computed=()):
+        if isinstance(serializer, type):
+            serializer = serializer()
+        self.serializer_class = type(serializer)
+        self.computed = frozenset(computed)
+        self.columns = []
+        self.steps = self._compile(serializer, '')
+        if self.computed:
+            # Views fill computed fields in by primary key.
+            self._column(serializer.Meta.model._meta.pk.name)
+        for name in self.computed:
+            for column in serializer.sparse_requires.get(name, ()):
+                self._column(column)
+
+    def _column(self, lookup):
+        if lookup not in self.columns:
+            self.columns.append(lookup)
+        return lookup
+
+    def _compile(self, serializer, prefix):
+        model = serializer.Meta.model
+        steps = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if not prefix and name in self.computed:
+                steps.append((name, 'computed', None))
+            elif isinstance(field, UserSummarySerializer):
+                nested_prefix = f'{prefix}{field.source}__'
+                key = self._column(nested_prefix + 'id')
+                steps.append((name, 'user', (key, self._compile(field, nested_prefix))))
+            elif isinstance(field, serializers.BaseSerializer):
+                raise ShapeError(f'Nested {type(field).__name__} {name!r} cannot be compiled.')
+            else:
+                key = self._column(prefix + field.source)
+                steps.append((name, 'value', (key, _converter(field, model))))
+        return steps
+
+    def values(self, queryset, extra=()):
+        """`queryset` narrowed to the columns this shape reads, plus `extra`"""
+        return queryset.values(*self.columns, *(column for column in extra if column not in self.columns))
+
+    def _bind(self, steps, context):
+        getters = []
+        for name, kind, spec in steps:
+            if kind == 'computed':
+                getters.append((name, lambda row: None))
+            elif kind == 'user':
+                key, nested = spec
+                getters.append((name, self._bind_user(key, self._bind(nested, context), context)))
+            else:
+                key, make = spec
+                if make is None:
+                    getters.append((name, itemgetter(key)))
+                else:
+                    convert = make(context)
+                    getters.append((name, lambda row, key=key, convert=convert: convert(row[key])))
+        return getters
+
+    def _bind_user(self, key, getters, context):
+        memo = context['user_summaries']
+
+        def get(row):
+            pk = row[key]
+            if pk is None:
+                return None
+            data = memo.get(pk)
+            if data is None:
+                data = memo[pk] = {name: getter(row) for name, getter in getters}
+            return data
+        return get
+
+    def render(self, rows, request=None):
+        """Shape `values()` rows into the serializer's output, one dict per row"""
+        getters = self._bind(self.steps, {'request': request, 'user_summaries': {}})
+        return [{name: getter(row) for name, getter in getters} for row in rows]
+
+
+GIGS = Shape(GigSerializer)
+SERVICES = Shape(ServiceSerializer)
+MESSAGES = Shape(MessageSerializer)
+LEAN_FEED = Shape(TubongeFeedSerializer, computed=['media_srcset', 'liked_by_me', 'comments'])
+
+_sparse_shapes = {}
+SPARSE_SHAPE_LIMIT = 256
+
+
+def shape_for(shape, serializer, request):
+    """
+    The shape to serve `request` with: `shape` itself, one compiled for the
+    request's sparse fieldset from `serializer`, or None to use the serializer.
+    """
+    if not enabled():
+        return None
+    fields, expand = sparse.requested(request)
+    if fields is None:
+        return shape
+    key = (shape, fields, expand)
+    if key not in _sparse_shapes:
+        if len(_sparse_shapes) >= SPARSE_SHAPE_LIMIT:
+            _sparse_shapes.clear()
+        try:
+            _sparse_shapes[key] = Shape(serializer, computed=shape.computed & fields)
+        except ShapeError:
+            _sparse_shapes[key] = None
+    return _sparse_shapes[key]
@@ -0,0 +1,80 @@
+"""
+Page-level lookups for the lean Tubonge feed.
+
+A feed page is serialized from a fixed number of queries however many posts,
+likes or comments it holds: one for the posts, one for which of them the
+viewer liked and one windowed query for the latest comments on every post.
+
+The feed cache (api/cache.py) keeps a page only until a post is created,
+edited or deleted. Counters, liker lists, comment previews and
+`liked_by_me` change with every like and comment, so they are stored blank
+and read afresh for the page with `live_fields` on every hit.
+"""
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+
+from .models import PostComment, TubongePost
+
+
+COMMENT_PREVIEW_SIZE = 3
+
+# The full post representation embeds a post's first comments.
+FULL_COMMENTS_SIZE = 10
+
+LIVE_FIELDS = ('like_count', 'comments_count', 'likes', 'comments', 'liked_by_me')
+
+
+def liked_post_ids(posts, user):
+    """Return the ids of `posts` that `user` has liked, in one query"""
+    if not user or not user.is_authenticated:
+        return set()
+    return set(
+        TubongePost.likes.through.objects.filter(
+            user_id=user.pk, tubongepost_id__in=[post.pk for post in posts]
+        ).values_list('tubongepost_id', flat=True)
+    )
+
+
+def comment_previews(posts, size=COMMENT_PREVIEW_SIZE):
+    """Map post id to its latest `size` comments (oldest first), in one query"""
+    previews = {post.pk: [] for post in posts}
+    if not previews or size <= 0:
+        return previews
+    comments = (
+        PostComment.objects.filter(post_id__in=previews)
+        .select_related('author')
+        .annotate(position=Window(
+            RowNumber(),
+            partition_by=F('post_id'),
+            order_by=[F('created_at').desc(), F('id').desc()],
+        ))
+        .filter(position__lte=size)
+        .order_by('post_id', 'created_at', 'id')
+    )
+    for comment in comments:
+        previews[comment.post_id].append(comment)
+    return previews
+
+
+def prefetch_comments(size=FULL_COMMENTS_SIZE):
+    """Prefetch each post's first `size` comments as `first_comments`, in one query"""
+    return Prefetch(
+        'comments', queryset=PostComment.objects.select_related('author')[:size], to_attr='first_comments'
+    )
+
+
+def build_feed_context(posts, user):
+    posts = list(posts)
+    return {
+        'liked_post_ids': liked_post_ids(posts, user),
+        'comment_previews': comment_previews(posts),
+    }
+
+
+def live_fields(serializer, posts):
+    """Map post id to the LIVE_FIELDS that `serializer` renders for it"""
+    fields = [(name, field) for name, field in serializer.fields.items() if name in LIVE_FIELDS]
+    return {
+        post.pk: {name: field.to_representation(field.get_attribute(post)) for name, field in fields}
+        for post in posts
+    }
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    Django's PBKDF2-SHA256 hasher with the work factor set by
+    PASSWORD_HASH_ITERATIONS. It keeps the `pbkdf2_sha256` algorithm name, so
+    existing hashes still verify, and a hash made with a different iteration
+    count is replaced on the user's next successful login.
+    """
+    
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
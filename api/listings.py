@@ -0,0 +1,104 @@
+"""
+Filtering, ordering and facet counts for gig and service listings.
+
+The list, `mine`, `recommended` and `facets` actions all read the same query
+parameters (see ListingFilterSerializer). Every supported ordering is backed
+by two indexes declared on the models: a plain one for queries across all
+statuses and a smaller partial one over `status = 'open'` rows, which is what
+the marketplace browses. On PostgreSQL, ListingPlanTests in api/tests.py
+explains each supported filter combination and fails if any of them falls
+back to a sequential scan of the listing table.
+
+Facets are counted in one aggregate query. Each facet honours every filter
+except its own, so the status counts ignore `status` and the price buckets
+ignore the price range, and a client can offer the other choices with their
+counts.
+"""
+from django.db.models import Count, Q
+
+
+# Every ordering ends in `id` in the same direction so pages are stable and a
+# (column, id) index can be scanned forwards or backwards to produce it.
+ORDERINGS = {
+    '-created_at': ('-created_at', '-id'),
+    'created_at': ('created_at', 'id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    '-views': ('-views', '-id'),
+}
+
+DEFAULT_ORDERING = '-created_at'
+
+# Price facet buckets in KES; the upper bound is exclusive and None is open-ended.
+PRICE_BUCKETS = [
+    (0, 1000),
+    (1000, 5000),
+    (5000, 10000),
+    (10000, 50000),
+    (50000, None),
+]
+
+
+def status_q(filters):
+    status = filters.get('status')
+    return Q(status=status) if status else Q()
+
+
+def price_q(filters):
+    q = Q()
+    if filters.get('min_price') is not None:
+        q &= Q(price__gte=filters['min_price'])
+    if filters.get('max_price') is not None:
+        q &= Q(price__lte=filters['max_price'])
+    return q
+
+
+def base_q(filters):
+    """Conditions every facet shares: owner and creation-time range"""
+    q = Q()
+    if filters.get('client') is not None:
+        q &= Q(client_id=filters['client'])
+    if filters.get('created_after') is not None:
+        q &= Q(created_at__gte=filters['created_after'])
+    if filters.get('created_before') is not None:
+        q &= Q(created_at__lt=filters['created_before'])
+    return q
+
+
+def ordering(filters):
+    """The ORDERINGS entry for validated filters"""
+    return ORDERINGS[filters.get('ordering') or DEFAULT_ORDERING]
+
+
+def filter_listings(queryset, filters):
+    """Apply validated filters and the requested ordering to a listing queryset"""
+    queryset = queryset.filter(base_q(filters), status_q(filters), price_q(filters))
+    return queryset.order_by(*ordering(filters))
+
+
+def bucket_label(low, high):
+    return f'{low}+' if high is None else f'{low}-{high}'
+
+
+def bucket_q(low, high):
+    q = Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def facet_counts(model, filters):
+    """Counts per status and per price bucket for `model`, in a single query"""
+    aggregates = {}
+    for value, _ in model.STATUS_CHOICES:
+        aggregates[f'status_{value}'] = Count('pk', filter=Q(status=value) & price_q(filters))
+    for n, (low, high) in enumerate(PRICE_BUCKETS):
+        aggregates[f'price_{n}'] = Count('pk', filter=bucket_q(low, high) & status_q(filters))
+    counts = model.objects.filter(base_q(filters)).aggregate(**aggregates)
+    return {
+        'status': {value: counts[f'status_{value}'] for value, _ in model.STATUS_CHOICES},
+        'price': [
+            {'bucket': bucket_label(low, high), 'min': low, 'max': high, 'count': counts[f'price_{n}']}
+            for n, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+    }
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.rollups import backfill
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily analytics rollups from existing bids, bookings and view counts'
+
+    def handle(self, *args, **options):
+        counts = backfill()
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {counts['bids']} listing-day(s) of bids, {counts['bookings']} of bookings "
+            f"and unrolled views for {counts['views']} listing(s)"
+        ))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from api.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = 'Build or refresh Conversation rows from existing messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of conversations to write per batch (default: 1000)')
+
+    def handle(self, *args, **options):
+        pairs = (
+            Message.objects.order_by()
+            .annotate(low=Least('sender_id', 'recipient_id'), high=Greatest('sender_id', 'recipient_id'))
+            .values('low', 'high')
+            .annotate(
+                last_message_id=Max('id'),
+                last_activity=Max('created_at'),
+            )
+        )
+
+        written = 0
+        batch = []
+        for row in pairs.iterator():
+            batch.append(Conversation(
+                user_low_id=row['low'], user_high_id=row['high'],
+                last_message_id=row['last_message_id'], last_activity=row['last_activity'],
+            ))
+            if len(batch) >= options['batch_size']:
+                written += self._write(batch)
+                batch = []
+        if batch:
+            written += self._write(batch)
+        self._recount_unread()
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {written} conversation(s)'))
+
+    def _write(self, batch):
+        Conversation.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['user_low', 'user_high'],
+            # Read watermarks are left alone; unread counts are derived from them below.
+            update_fields=['last_message', 'last_activity'],
+        )
+        return len(batch)
+
+    def _recount_unread(self):
+        for side, other in (('low', 'high'), ('high', 'low')):
+            unread = (
+                Message.objects.filter(
+                    recipient_id=OuterRef(f'user_{side}_id'),
+                    sender_id=OuterRef(f'user_{other}_id'),
+                    id__gt=OuterRef(f'{side}_last_read_message_id'),
+                )
+                .exclude(sender_id=F('recipient_id'))
+                .order_by().values('recipient_id').annotate(n=Count('*')).values('n')
+            )
+            Conversation.objects.update(**{
+                f'{side}_unread': Coalesce(Subquery(unread, output_field=IntegerField()), 0),
+            })
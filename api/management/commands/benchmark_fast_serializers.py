@@ -0,0 +1,104 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api import fastpath
+from api.models import Gig, Message, PostComment, Service, TubongePost, User
+from api.renderers import FastJSONRenderer
+from api.serializers import GigSerializer, MessageSerializer, ServiceSerializer, TubongeFeedSerializer
+
+
+SERIALIZERS = {
+    'gigs': (GigSerializer, fastpath.GIGS, lambda: Gig.objects.select_related('client').with_bid_count()),
+    'services': (
+        ServiceSerializer, fastpath.SERVICES, lambda: Service.objects.select_related('client').with_booking_count(),
+    ),
+    'messages': (
+        MessageSerializer, fastpath.MESSAGES,
+        lambda: Message.objects.select_related('sender', 'recipient').with_read_state(),
+    ),
+    # Comment previews and likes come from page-level lookups shared by both paths.
+    'feed': (TubongeFeedSerializer, fastpath.LEAN_FEED, lambda: TubongePost.objects.select_related('author')),
+}
+
+
+class Command(BaseCommand):
+    help = ('Compare rows serialized per second by the serializers and the fast list path; '
+            'seeded rows are rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000,
+                            help='Rows of each kind to seed and to serialize when timing (default: 1000)')
+        parser.add_argument('--existing', action='store_true',
+                            help='Use the rows already in the database instead of seeding')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timing runs per path; the best is reported (default: 5)')
+
+    def seed(self, count):
+        users = User.objects.bulk_create([
+            User(username=f'fastpath-{n}', email=f'fastpath-{n}@example.com',
+                 user_type='client' if n % 2 else 'pwd', profile_picture=f'profiles/{n}.png' if n % 3 else '')
+            for n in range(20)
+        ])
+        clients = users[1::2]
+        text = 'Caption recorded interviews — accessible formats, “plain” language.'
+        Gig.objects.bulk_create([
+            Gig(client=clients[n % len(clients)], title=f'Gig {n}', description=text, price=Decimal('1500.50'),
+                timeframe='2 weeks', requirements='Transcription',
+                document='gig_documents/brief.pdf' if n % 4 else '')
+            for n in range(count)
+        ])
+        Service.objects.bulk_create([
+            Service(client=clients[n % len(clients)], title=f'Service {n}', description=text, price=Decimal('800'),
+                    duration='1 hour', requirements='Sign language')
+            for n in range(count)
+        ])
+        for n in range(count):
+            Message.objects.create(sender=users[n % 2], recipient=users[1 - n % 2], text=f'{text} {n}')
+        posts = TubongePost.objects.bulk_create([
+            TubongePost(author=users[n % len(users)], text=f'{text} {n}', link='',
+                        media_variants={'webp': {'320': f'tubonge_media/{n}.webp'}} if n % 5 == 0 else {})
+            for n in range(count)
+        ])
+        for post in posts[-60:]:
+            post.likes.add(*users[post.pk % 3:post.pk % 3 + 4])
+            PostComment.objects.bulk_create([
+                PostComment(post=post, author=users[(post.pk + n) % len(users)], text=f'Comment {n}')
+                for n in range(post.pk % 5)
+            ])
+
+    def best(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    def benchmark(self, name, rows, repeat):
+        serializer_class, shape, queryset = SERIALIZERS[name]
+        request = APIRequestFactory().get('/')
+        instances = list(queryset().order_by('-id')[:rows])
+        values = list(shape.values(queryset().order_by('-id'))[:rows])
+        count = len(instances)
+        slow = self.best(repeat, lambda: JSONRenderer().render(
+            serializer_class(instances, many=True, context={'request': request}).data
+        ))
+        fast = self.best(repeat, lambda: FastJSONRenderer().render(shape.render(values, request)))
+        self.stdout.write(
+            f'{name:<10} {count:6d} rows  serializer {count / slow:9.0f} rows/s  '
+            f'fast path {count / fast:9.0f} rows/s  {slow / fast:5.1f}x'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if not options['existing']:
+                self.seed(options['rows'])
+
+            for name in SERIALIZERS:
+                self.benchmark(name, options['rows'], options['repeat'])
+            transaction.set_rollback(True)
@@ -0,0 +1,91 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.models import User
+from api.serializers import LoginSerializer
+
+
+PASSWORD = 'benchmark-password'
+
+
+class Command(BaseCommand):
+    help = ('Measure email logins per second for one worker against a large user table; '
+            'the users are created in a transaction that is rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000,
+                            help='Users in the table while measuring (default: 1000000)')
+        parser.add_argument('--logins', type=int, default=50,
+                            help='Full logins to time; each pays one password hash (default: 50)')
+        parser.add_argument('--lookups', type=int, default=2000,
+                            help='Email lookups to time without hashing (default: 2000)')
+
+    def create_users(self, count):
+        # One user made through the ORM, copied server-side under new names:
+        # bulk_create spends minutes building a million instances, and one
+        # shared hash saves hashing a million passwords.
+        User.objects.create(
+            username='login-benchmark-0', email='Login.Benchmark.0@Example.com',
+            password=make_password(PASSWORD),
+        )
+        qn = connection.ops.quote_name
+        generated = {
+            'username': "'login-benchmark-' || n",
+            'email': "'Login.Benchmark.' || n || '@Example.com'",
+        }
+        columns = [field.column for field in User._meta.concrete_fields if not field.primary_key]
+        values = [generated.get(column, qn(column)) for column in columns]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n + 1 < %s) '
+                f'INSERT INTO {qn(User._meta.db_table)} ({", ".join(map(qn, columns))}) '
+                f'SELECT {", ".join(values)} FROM {qn(User._meta.db_table)}, seq '
+                f'WHERE {qn("username")} = %s',
+                [count, 'login-benchmark-0'],
+            )
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE ' + qn(User._meta.db_table))
+
+    def report(self, label, timings):
+        timings = sorted(timings)
+        p50 = statistics.median(timings) * 1000
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+        per_second = len(timings) / sum(timings)
+        self.stdout.write(f'{label:<16} p50 {p50:8.2f} ms  p99 {p99:8.2f} ms  {per_second:9.1f}/s')
+
+    def handle(self, *args, **options):
+        count = options['users']
+        hasher = get_hasher()
+        self.stdout.write(f'{hasher.algorithm}, {getattr(hasher, "iterations", "-")} iterations')
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.create_users(count)
+            self.stdout.write(f'{User.objects.count()} users (created in {time.perf_counter() - started:.1f} s)')
+            emails = [f'login.benchmark.{random.randrange(count)}@example.COM' for _ in range(options['lookups'])]
+
+            timings = []
+            for email in emails:
+                started = time.perf_counter()
+                User.objects.by_email(email).first()
+                timings.append(time.perf_counter() - started)
+            self.report('email lookup', timings)
+
+            timings = []
+            for email in emails[:options['logins']]:
+                started = time.perf_counter()
+                serializer = LoginSerializer(data={'email': email, 'password': PASSWORD})
+                serializer.is_valid(raise_exception=True)
+                timings.append(time.perf_counter() - started)
+            self.report('login', timings)
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            'Logins are CPU-bound on the hash: size workers for peak logins divided by the '
+            'per-worker rate above, or lower PASSWORD_HASH_ITERATIONS.'
+        )
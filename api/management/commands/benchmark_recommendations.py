@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.recommend import ListingIndex, skill_terms
+
+
+SKILLS = [
+    'data entry', 'transcription', 'graphic design', 'web development', 'python',
+    'javascript', 'customer support', 'bookkeeping', 'translation', 'sign language',
+    'copywriting', 'social media', 'video editing', 'photography', 'tutoring',
+    'accounting', 'excel', 'illustration', 'voice over', 'research',
+]
+
+FILLER = [
+    'remote', 'flexible', 'hours', 'project', 'client', 'deliver', 'weekly', 'quality',
+    'experience', 'team', 'deadline', 'accessible', 'screen', 'reader', 'friendly',
+    'long', 'term', 'contract', 'nairobi', 'mombasa', 'kisumu', 'urgent', 'part', 'time',
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure recommendation top-k latency over a synthetic in-memory listing index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100000,
+                            help='Number of open listings to index (default: 100000)')
+        parser.add_argument('--queries', type=int, default=500,
+                            help='Number of recommendation queries to time (default: 500)')
+        parser.add_argument('--k', type=int, default=20,
+                            help='Results per query (default: 20)')
+        parser.add_argument('--updates', type=int, default=5000,
+                            help='Number of incremental updates to time (default: 5000)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def _listing(self, rng, vocabulary):
+        skills = rng.sample(SKILLS, 2)
+        words = rng.sample(vocabulary, 25)
+        return {
+            'title': f'{skills[0]} {" ".join(words[:3])}',
+            'requirements': f'{skills[1]} {" ".join(words[3:8])}',
+            'description': ' '.join(words[8:] + [skills[0]]),
+        }
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Filler words dilute the text so skill terms are not in every listing.
+        vocabulary = FILLER + [f'term{n}' for n in range(5000)]
+        listings = [(pk, self._listing(rng, vocabulary)) for pk in range(1, options['listings'] + 1)]
+
+        index = ListingIndex()
+        started = time.perf_counter()
+        index.load(listings)
+        build = time.perf_counter() - started
+        indexed = len(index)
+
+        k = options['k']
+        queries = [skill_terms(rng.sample(SKILLS, rng.randint(1, 4))) for _ in range(options['queries'])]
+        index.top(queries[0], k)
+        timings = []
+        for terms in queries:
+            started = time.perf_counter()
+            index.top(terms, k)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        for _ in range(options['updates']):
+            pk = rng.randint(1, options['listings'])
+            if rng.random() < 0.2:
+                index.remove(pk)
+            else:
+                index.upsert(pk, self._listing(rng, vocabulary))
+        updates = time.perf_counter() - started
+
+        timings.sort()
+        self.stdout.write(f'Indexed {indexed} listings in {build:.2f}s')
+        self.stdout.write(
+            f'top-{k} over {len(timings)} queries: '
+            f'p50 {statistics.median(timings):.2f} ms, '
+            f'p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms, '
+            f'p99 {timings[int(len(timings) * 0.99) - 1]:.2f} ms, '
+            f'max {timings[-1]:.2f} ms'
+        )
+        self.stdout.write(
+            f'{options["updates"]} incremental updates: '
+            f'{updates / max(options["updates"], 1) * 1e6:.1f} us each'
+        )
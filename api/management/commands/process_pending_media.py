@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.media import process_post_media
+from api.models import TubongePost
+
+
+class Command(BaseCommand):
+    help = 'Process Tubonge media left in the processing state (e.g. after a restart)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true',
+                            help='Also process older uploads that have no variants yet')
+
+    def handle(self, *args, **options):
+        posts = TubongePost.objects.filter(media_status='processing')
+        if options['backfill']:
+            posts = posts | TubongePost.objects.filter(media_status='ready', media_variants={})
+        processed = 0
+        for post_id in posts.values_list('id', flat=True).iterator():
+            process_post_media(post_id)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed media for {processed} post(s)'))
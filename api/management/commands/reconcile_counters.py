@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import reconcile_post_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute drifted like_count and comments_count values on Tubonge posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of posts to check per batch (default: 1000)')
+
+    def handle(self, *args, **options):
+        fixed = reconcile_post_counters(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Reconciled counters on {fixed} post(s)'))
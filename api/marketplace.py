@@ -0,0 +1,44 @@
+"""
+The homepage marketplace: open gigs and services as one stream, newest first.
+
+Each kind is read straight into dicts with `values()`, so no model instances
+or nested serializers are built, and long descriptions and requirements are
+cut down in the database. Both querysets run on the open-only (created_at, id) indexes and
+are merged by MergedKeysetPagination, so a page costs two short index scans
+however many listings exist.
+"""
+from django.db.models import F
+from django.db.models.functions import Substr
+
+from .models import Gig, Service
+from .search import SNIPPET_LENGTH, snippet
+
+
+KINDS = {
+    'gig': (Gig, 'timeframe'),
+    'service': (Service, 'duration'),
+}
+
+
+def streams(kinds=None):
+    """Open listings per kind, as `values()` querysets for MergedKeysetPagination"""
+    result = {}
+    for kind, (model, term_field) in KINDS.items():
+        if kinds and kind not in kinds:
+            continue
+        result[kind] = model.objects.filter(status='open').values(
+            'id', 'title', 'price', 'client_id', 'created_at', term_field,
+            client_name=F('client__username'),
+            # One character over the limit so snippet() knows to add an ellipsis.
+            summary=Substr('description', 1, SNIPPET_LENGTH + 1),
+            requirements_summary=Substr('requirements', 1, SNIPPET_LENGTH + 1),
+        )
+    return result
+
+
+def compact(row):
+    """Finish a merged row for the response"""
+    row['price'] = str(row['price'])
+    row['summary'] = snippet(row['summary'])
+    row['requirements'] = snippet(row.pop('requirements_summary'))
+    return row
@@ -0,0 +1,254 @@
+"""
+Off-request processing for Tubonge media uploads.
+
+Uploads are stored as-is and the post is marked `processing`. Once the
+transaction commits, the post id is handed to a small thread pool which:
+
+* sniffs the real media type from the file contents,
+* re-encodes images, animated GIF and WebP included, without EXIF or other
+  metadata, and remuxes videos without their container and stream metadata
+  (GPS and device atoms) when ffmpeg is available,
+* renders resized WebP and JPEG variants (and a poster frame for videos
+  when ffmpeg is available),
+
+then records the variant storage names in `media_variants` and marks the post
+`ready` (or `failed`). Posts left in `processing` by a restart are picked up
+again by the `process_pending_media` management command.
+"""
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import TubongePost
+
+
+logger = logging.getLogger(__name__)
+
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Originals are re-encoded in their own format with these options; any other
+# image format is re-encoded as PNG. Pillow writes EXIF, XMP and text chunks
+# only when asked to, but GIF carries its comment over unless it is blanked.
+STRIP_FORMATS = {
+    'JPEG': {'quality': 95},
+    'PNG': {},
+    'GIF': {'comment': b''},
+    'WEBP': {'quality': 95},
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_variant_widths():
+    return getattr(settings, 'MEDIA_VARIANT_WIDTHS', [320, 640, 1080])
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'MEDIA_PROCESSING_WORKERS', 2),
+                thread_name_prefix='media',
+            )
+        return _executor
+
+
+def schedule(post_id):
+    """Queue a post for processing once the current transaction commits"""
+    transaction.on_commit(lambda: _submit(post_id))
+
+
+def _submit(post_id):
+    if getattr(settings, 'MEDIA_PROCESSING_ASYNC', True):
+        get_executor().submit(_run, post_id)
+    else:
+        process_post_media(post_id)
+
+
+def _run(post_id):
+    try:
+        process_post_media(post_id)
+    except Exception:
+        logger.exception('Media processing crashed for post %s', post_id)
+    finally:
+        close_old_connections()
+
+
+def sniff_media_type(path):
+    """Return 'image' or 'video' based on file contents, or None"""
+    with open(path, 'rb') as fh:
+        head = fh.read(16)
+    # ISO base media (mp4/mov) carries 'ftyp' at offset 4; AVI is a RIFF container.
+    if head[4:8] == b'ftyp' or (head[:4] == b'RIFF' and head[8:12] == b'AVI '):
+        return 'video'
+    try:
+        with Image.open(path) as img:
+            img.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        return None
+    return 'image'
+
+
+def _variant_name(post, label, extension):
+    return f'tubonge_media/variants/{post.pk}/{label}.{extension}'
+
+
+def render_variants(post, image):
+    """Save resized WebP and JPEG copies of `image`; return {format: {width: name}}"""
+    widths = [width for width in get_variant_widths() if width < image.width] or [image.width]
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    variants = {key: {} for key in VARIANT_FORMATS}
+    for width in widths:
+        resized = image.copy()
+        resized.thumbnail((width, width * 10), Image.LANCZOS)
+        for key, (fmt, options) in VARIANT_FORMATS.items():
+            frame = resized.convert('RGB') if fmt == 'JPEG' else resized
+            buffer = io.BytesIO()
+            frame.save(buffer, fmt, **options)
+            name = default_storage.save(_variant_name(post, width, key), ContentFile(buffer.getvalue()))
+            variants[key][str(width)] = name
+    return variants
+
+
+def _replace_original(post, content, name):
+    old_name = post.media_file.name
+    post.media_file.save(name, content, save=False)
+    if post.media_file.name != old_name:
+        default_storage.delete(old_name)
+
+
+def strip_metadata(post, original, image):
+    """
+    Replace an image original with a re-encoded copy carrying no metadata.
+
+    `image` is the orientation-corrected first frame. Animated GIF and WebP
+    keep every frame, so they are re-encoded from `original` as they are.
+    """
+    name = os.path.basename(post.media_file.name)
+    fmt = original.format
+    if fmt not in STRIP_FORMATS:
+        fmt = 'PNG'
+        name = os.path.splitext(name)[0] + '.png'
+    options = dict(STRIP_FORMATS[fmt])
+    if getattr(original, 'is_animated', False) and fmt in ('GIF', 'WEBP'):
+        image = original
+        options['save_all'] = True
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    _replace_original(post, ContentFile(buffer.getvalue()), name)
+
+
+def strip_video_metadata(post, path):
+    """Replace a video original with a remux of its audio and video streams and no metadata"""
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        logger.warning('ffmpeg is not installed; the video for post %s keeps its metadata', post.pk)
+        return
+    name = os.path.basename(post.media_file.name)
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(name)[1]) as output:
+        # Data streams such as GoPro telemetry are dropped with the metadata.
+        result = subprocess.run(
+            [ffmpeg, '-v', 'error', '-y', '-i', path, '-map', '0:v', '-map', '0:a?',
+             '-map_metadata', '-1', '-map_chapters', '-1', '-c', 'copy', output.name],
+            capture_output=True, timeout=300,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode(errors='replace').strip() or 'ffmpeg remux failed')
+        _replace_original(post, File(output), name)
+
+
+def extract_poster(path):
+    """Grab a frame from a video with ffmpeg; returns JPEG bytes or None"""
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        return None
+    result = subprocess.run(
+        [ffmpeg, '-v', 'error', '-ss', '1', '-i', path, '-frames:v', '1', '-f', 'image2', '-c:v', 'mjpeg', '-'],
+        capture_output=True, timeout=60,
+    )
+    if result.returncode != 0 or not result.stdout:
+        # Clips shorter than a second have no frame at 1s; fall back to the first one.
+        result = subprocess.run(
+            [ffmpeg, '-v', 'error', '-i', path, '-frames:v', '1', '-f', 'image2', '-c:v', 'mjpeg', '-'],
+            capture_output=True, timeout=60,
+        )
+    return result.stdout or None
+
+
+def process_post_media(post_id):
+    """Detect, clean and resize a post's media; runs on the worker pool"""
+    try:
+        post = TubongePost.objects.get(pk=post_id)
+    except TubongePost.DoesNotExist:
+        return
+    if not post.media_file:
+        return
+
+    suffix = os.path.splitext(post.media_file.name)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as local:
+        with post.media_file.open('rb') as source:
+            for chunk in source.chunks():
+                local.write(chunk)
+        local.flush()
+
+        try:
+            media_type = sniff_media_type(local.name)
+            variants = {}
+            if media_type == 'image':
+                with Image.open(local.name) as original:
+                    # Bake in the EXIF orientation before the tag is dropped.
+                    image = ImageOps.exif_transpose(original)
+                    strip_metadata(post, original, image)
+                    variants = render_variants(post, image)
+            elif media_type == 'video':
+                strip_video_metadata(post, local.name)
+                poster = extract_poster(local.name)
+                if poster:
+                    with Image.open(io.BytesIO(poster)) as frame:
+                        variants = render_variants(post, frame)
+                    variants['poster'] = variants['jpeg'][max(variants['jpeg'], key=int)]
+        except Exception:
+            logger.exception('Media processing failed for post %s', post_id)
+            media_type, variants = None, {}
+
+    post.media_type = media_type
+    post.media_variants = variants
+    post.media_status = 'ready' if media_type else 'failed'
+    post.save(update_fields=['media_file', 'media_type', 'media_variants', 'media_status', 'updated_at'])
+
+
+def variant_urls(post, request=None):
+    """Turn stored variant names into a srcset-style map of absolute URLs"""
+    return srcset(post.media_variants, request)
+
+
+def srcset(variants, request=None):
+    """variant_urls() for a raw `media_variants` value"""
+    def absolute(name):
+        url = default_storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    urls = {}
+    for key, value in (variants or {}).items():
+        if isinstance(value, dict):
+            urls[key] = {width: absolute(name) for width, name in value.items()}
+        else:
+            urls[key] = absolute(value)
+    return urls
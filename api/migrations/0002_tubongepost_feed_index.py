@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='tubongepost',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name': 'Tubonge Post', 'verbose_name_plural': 'Tubonge Posts'},
+        ),
+        migrations.AddIndex(
+            model_name='tubongepost',
+            index=models.Index(fields=['-created_at', '-id'], name='api_tubonge_created_089d62_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:06
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    TubongePost = apps.get_model('api', 'TubongePost')
+    PostComment = apps.get_model('api', 'PostComment')
+    LikeThrough = TubongePost.likes.through
+    likes = (
+        LikeThrough.objects.filter(tubongepost_id=OuterRef('pk'))
+        .order_by().values('tubongepost_id').annotate(n=Count('*')).values('n')
+    )
+    comments = (
+        PostComment.objects.filter(post_id=OuterRef('pk'))
+        .order_by().values('post_id').annotate(n=Count('*')).values('n')
+    )
+    TubongePost.objects.update(
+        like_count=Coalesce(Subquery(likes, output_field=IntegerField()), 0),
+        comments_count=Coalesce(Subquery(comments, output_field=IntegerField()), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_tubongepost_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tubongepost',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tubongepost',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
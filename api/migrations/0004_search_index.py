@@ -0,0 +1,112 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE api_searchentry ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(body, '')), 'B')
+    ) STORED
+    """,
+    'CREATE INDEX api_searchentry_vector_gin ON api_searchentry USING gin (search_vector)',
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE api_searchentry_fts USING fts5(
+        title, body, content='api_searchentry', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER api_searchentry_fts_insert AFTER INSERT ON api_searchentry BEGIN
+        INSERT INTO api_searchentry_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER api_searchentry_fts_delete AFTER DELETE ON api_searchentry BEGIN
+        INSERT INTO api_searchentry_fts (api_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER api_searchentry_fts_update AFTER UPDATE ON api_searchentry BEGIN
+        INSERT INTO api_searchentry_fts (api_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO api_searchentry_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS api_searchentry_fts_insert',
+    'DROP TRIGGER IF EXISTS api_searchentry_fts_delete',
+    'DROP TRIGGER IF EXISTS api_searchentry_fts_update',
+    'DROP TABLE IF EXISTS api_searchentry_fts',
+]
+
+
+def create_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_text_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_BACKWARD:
+            schema_editor.execute(sql)
+
+
+def backfill_entries(apps, schema_editor):
+    SearchEntry = apps.get_model('api', 'SearchEntry')
+    TubongePost = apps.get_model('api', 'TubongePost')
+    Gig = apps.get_model('api', 'Gig')
+    Service = apps.get_model('api', 'Service')
+    entries = [
+        SearchEntry(kind='post', object_id=post.pk, title='', body=post.text, created_at=post.created_at)
+        for post in TubongePost.objects.iterator()
+    ]
+    for kind, model in (('gig', Gig), ('service', Service)):
+        entries.extend(
+            SearchEntry(
+                kind=kind, object_id=obj.pk, title=obj.title,
+                body=f"{obj.description}\n{obj.requirements}", created_at=obj.created_at,
+            )
+            for obj in model.objects.iterator()
+        )
+    SearchEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_tubongepost_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Post'), ('gig', 'Gig'), ('service', 'Service')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(blank=True, max_length=200)),
+                ('body', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Search Entry',
+                'verbose_name_plural': 'Search Entries',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_entry'),
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+        migrations.RunPython(backfill_entries, migrations.RunPython.noop),
+    ]
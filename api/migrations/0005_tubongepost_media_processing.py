@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+def mark_existing_media_ready(apps, schema_editor):
+    # Older uploads keep serving their originals until process_pending_media --backfill.
+    TubongePost = apps.get_model('api', 'TubongePost')
+    TubongePost.objects.exclude(media_file='').exclude(media_file__isnull=True).update(media_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tubongepost',
+            name='media_status',
+            field=models.CharField(choices=[('none', 'No media'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='tubongepost',
+            name='media_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(mark_existing_media_ready, migrations.RunPython.noop),
+    ]
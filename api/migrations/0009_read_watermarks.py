@@ -0,0 +1,93 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:22
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Greatest, Least
+
+
+def is_read_to_watermarks(apps, schema_editor):
+    """Fold Message.is_read into per-side watermarks and unread counts.
+
+    A side's watermark becomes the newest message it had read, so an older
+    message still flagged unread below it is treated as read from here on.
+    """
+    Message = apps.get_model('api', 'Message')
+    Conversation = apps.get_model('api', 'Conversation')
+    pairs = (
+        Message.objects.order_by()
+        .annotate(low=Least('sender_id', 'recipient_id'), high=Greatest('sender_id', 'recipient_id'))
+        .values('low', 'high')
+        .annotate(
+            last_message_id=Max('id'),
+            last_activity=Max('created_at'),
+            low_read=Max('id', filter=Q(is_read=True, recipient_id=F('low'))),
+            high_read=Max('id', filter=Q(is_read=True, recipient_id=F('high'))),
+            low_unread=Count('id', filter=Q(is_read=False, recipient_id=F('low')) & ~Q(sender_id=F('low'))),
+            high_unread=Count('id', filter=Q(is_read=False, recipient_id=F('high')) & ~Q(sender_id=F('high'))),
+        )
+    )
+    batch = []
+    for row in pairs.iterator():
+        batch.append(Conversation(
+            user_low_id=row['low'], user_high_id=row['high'],
+            last_message_id=row['last_message_id'], last_activity=row['last_activity'],
+            low_unread=row['low_unread'], high_unread=row['high_unread'],
+            low_last_read_message_id=row['low_read'] or 0,
+            high_last_read_message_id=row['high_read'] or 0,
+        ))
+        if len(batch) >= 1000:
+            _upsert(Conversation, batch)
+            batch = []
+    if batch:
+        _upsert(Conversation, batch)
+
+
+def _upsert(Conversation, batch):
+    Conversation.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=['user_low', 'user_high'],
+        update_fields=[
+            'last_message', 'last_activity', 'low_unread', 'high_unread',
+            'low_last_read_message_id', 'high_last_read_message_id',
+        ],
+    )
+
+
+def watermarks_to_is_read(apps, schema_editor):
+    Message = apps.get_model('api', 'Message')
+    Conversation = apps.get_model('api', 'Conversation')
+    for conversation in Conversation.objects.iterator():
+        Message.objects.filter(
+            recipient_id=conversation.user_low_id, sender_id=conversation.user_high_id,
+            id__lte=conversation.low_last_read_message_id,
+        ).update(is_read=True)
+        Message.objects.filter(
+            recipient_id=conversation.user_high_id, sender_id=conversation.user_low_id,
+            id__lte=conversation.high_last_read_message_id,
+        ).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_message_thread_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='high_last_read_message_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='low_last_read_message_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(is_read_to_watermarks, watermarks_to_is_read),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
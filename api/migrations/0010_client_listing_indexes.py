@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gig',
+            index=models.Index(fields=['client', 'status', '-created_at'], name='api_gig_client__7a8079_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['client', 'status', '-created_at'], name='api_service_client__39fe7d_idx'),
+        ),
+    ]
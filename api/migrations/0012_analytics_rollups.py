@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_listing_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('bids', models.PositiveIntegerField(default=0)),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Client Daily Stats',
+                'verbose_name_plural': 'Client Daily Stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='ListingDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('gig', 'Gig'), ('service', 'Service')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('date', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('bids', models.PositiveIntegerField(default=0)),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listing_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Listing Daily Stats',
+                'verbose_name_plural': 'Listing Daily Stats',
+                'indexes': [models.Index(fields=['client', 'date'], name='api_listing_client__21d40d_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='listingdailystats',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id', 'date'), name='unique_listing_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='clientdailystats',
+            constraint=models.UniqueConstraint(fields=('client', 'date'), name='unique_client_day'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:43
+
+import api.models
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+import django.db.models.functions.text
+
+
+def check_duplicate_emails(apps, schema_editor):
+    User = apps.get_model('api', 'User')
+    duplicates = list(
+        User.objects.exclude(email='').annotate(email_lower=Lower('email'))
+        .order_by().values('email_lower').annotate(n=Count('*')).filter(n__gt=1)
+        .values_list('email_lower', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'Users share these emails apart from letter case; merge or change them before '
+            'migrating: ' + ', '.join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', api.models.UserManager()),
+            ],
+        ),
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), condition=models.Q(('email', ''), _negated=True), name='api_user_email_lower_uniq', violation_error_message='A user with this email already exists.'),
+        ),
+    ]
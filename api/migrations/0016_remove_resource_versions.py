@@ -0,0 +1,16 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:01
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_resource_versions'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='ResourceVersion',
+        ),
+    ]
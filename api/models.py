@@ -1,8 +1,22 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
+import uuid
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import (
+    BooleanField, Case, Count, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest, Least, Lower
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
 from django.core.validators import FileExtensionValidator
 
 
+class UserManager(BaseUserManager):
+    
+    def by_email(self, email):
+        """Users whose email matches case-insensitively, via the lower(email) unique index"""
+        # The blank-email exclusion repeats the index condition so the planner can use it.
+        return self.alias(email_lower=Lower('email')).filter(email_lower=email.lower()).exclude(email='')
+
+
 class User(AbstractUser):
     """Custom user model for both PWD and Client users"""
     USER_TYPE_CHOICES = [
@@ -24,9 +38,18 @@ class User(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = UserManager()
+    
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        constraints = [
+            # Accounts without an email (e.g. from createsuperuser) are left out.
+            models.UniqueConstraint(
+                Lower('email'), name='api_user_email_lower_uniq', condition=~Q(email=''),
+                violation_error_message='A user with this email already exists.',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.username} ({self.get_user_type_display()})"
@@ -34,6 +57,13 @@ class User(AbstractUser):
 
 class TubongePost(models.Model):
     """Posts in the Tubonge social feed"""
+    MEDIA_STATUS_CHOICES = [
+        ('none', 'No media'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tubonge_posts')
     text = models.TextField()
     media_file = models.FileField(
@@ -43,22 +73,28 @@ class TubongePost(models.Model):
         validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'gif', 'mp4', 'mov', 'avi'])]
     )
     media_type = models.CharField(max_length=10, choices=[('image', 'Image'), ('video', 'Video')], blank=True, null=True)
+    media_status = models.CharField(max_length=10, choices=MEDIA_STATUS_CHOICES, default='none')
+    # Storage names of resized copies: {'webp': {'320': name, ...}, 'jpeg': {...}, 'poster': name}
+    media_variants = models.JSONField(default=dict, blank=True, editable=False)
     link = models.URLField(blank=True, null=True)
     likes = models.ManyToManyField(User, related_name='liked_posts', blank=True)
+    # Denormalized counters, maintained with F() updates (see api/counters.py)
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
         verbose_name = 'Tubonge Post'
         verbose_name_plural = 'Tubonge Posts'
+        indexes = [
+            # Serves the keyset-paginated feed: ORDER BY created_at DESC, id DESC.
+            models.Index(fields=['-created_at', '-id']),
+        ]
     
     def __str__(self):
         return f"Post by {self.author.username} - {self.text[:50]}"
-    
-    @property
-    def like_count(self):
-        return self.likes.count()
 
 
 class PostComment(models.Model):
@@ -77,6 +113,27 @@ class PostComment(models.Model):
         return f"Comment by {self.author.username} on post {self.post.id}"
 
 
+def _related_count(model, fk_name):
+    """Correlated COUNT of `model` rows pointing at the outer row, 0 when none"""
+    rows = (
+        model.objects.filter(**{f'{fk_name}_id': OuterRef('pk')})
+        .order_by().values(f'{fk_name}_id').annotate(n=Count('*')).values('n')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+class GigQuerySet(models.QuerySet):
+    
+    def with_bid_count(self):
+        return self.annotate(bid_count=_related_count(Bid, 'gig'))
+
+
+class ServiceQuerySet(models.QuerySet):
+    
+    def with_booking_count(self):
+        return self.annotate(booking_count=_related_count(Booking, 'service'))
+
+
 class Gig(models.Model):
     """Gigs posted by clients"""
     STATUS_CHOICES = [
@@ -101,10 +158,26 @@ class Gig(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = GigQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Gig'
         verbose_name_plural = 'Gigs'
+        indexes = [
+            # Owner dashboards: one client's posts, optionally by status, newest first.
+            models.Index(fields=['client', 'status', '-created_at']),
+            # Marketplace orderings (api/listings.py). Each column is indexed with
+            # id as the tie-breaker, once for every status and once open-only.
+            models.Index(fields=['created_at', 'id'], name='api_gig_created_idx'),
+            models.Index(fields=['price', 'id'], name='api_gig_price_idx'),
+            models.Index(fields=['views', 'id'], name='api_gig_views_idx'),
+            models.Index(fields=['created_at', 'id'], name='api_gig_open_created_idx', condition=Q(status='open')),
+            models.Index(fields=['price', 'id'], name='api_gig_open_price_idx', condition=Q(status='open')),
+            models.Index(fields=['views', 'id'], name='api_gig_open_views_idx', condition=Q(status='open')),
+            # Recommendation index syncs poll for rows changed since a timestamp.
+            models.Index(fields=['updated_at'], name='api_gig_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} by {self.client.username}"
@@ -134,10 +207,26 @@ class Service(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ServiceQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Service'
         verbose_name_plural = 'Services'
+        indexes = [
+            # Owner dashboards: one client's posts, optionally by status, newest first.
+            models.Index(fields=['client', 'status', '-created_at']),
+            # Marketplace orderings (api/listings.py). Each column is indexed with
+            # id as the tie-breaker, once for every status and once open-only.
+            models.Index(fields=['created_at', 'id'], name='api_service_created_idx'),
+            models.Index(fields=['price', 'id'], name='api_service_price_idx'),
+            models.Index(fields=['views', 'id'], name='api_service_views_idx'),
+            models.Index(fields=['created_at', 'id'], name='api_service_open_created_idx', condition=Q(status='open')),
+            models.Index(fields=['price', 'id'], name='api_service_open_price_idx', condition=Q(status='open')),
+            models.Index(fields=['views', 'id'], name='api_service_open_views_idx', condition=Q(status='open')),
+            # Recommendation index syncs poll for rows changed since a timestamp.
+            models.Index(fields=['updated_at'], name='api_service_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} by {self.client.username}"
@@ -188,22 +277,291 @@ class Booking(models.Model):
         return f"Booking by {self.booker.username} for {self.service.title}"
 
 
+class MessageQuerySet(models.QuerySet):
+    
+    def with_read_state(self):
+        """Annotate `is_read` from the recipient's watermark on the conversation"""
+        read_upto = Conversation.objects.filter(
+            user_low_id=Least(OuterRef('sender_id'), OuterRef('recipient_id')),
+            user_high_id=Greatest(OuterRef('sender_id'), OuterRef('recipient_id')),
+        ).annotate(
+            read_upto=Case(
+                When(user_low_id=OuterRef('recipient_id'), then=F('low_last_read_message_id')),
+                default=F('high_last_read_message_id'),
+            )
+        ).values('read_upto')[:1]
+        return self.annotate(is_read=ExpressionWrapper(
+            Q(id__lte=Coalesce(Subquery(read_upto), Value(0))), output_field=BooleanField()
+        ))
+
+
 class Message(models.Model):
     """Chat messages between users"""
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
     text = models.TextField()
-    is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Read state lives on Conversation as a per-side watermark; querysets and
+    # views fill this in (see with_read_state and Conversation.is_read).
+    is_read = False
+    
+    objects = MessageQuerySet.as_manager()
+    
     class Meta:
         ordering = ['created_at']
         verbose_name = 'Message'
         verbose_name_plural = 'Messages'
         indexes = [
             models.Index(fields=['sender', 'recipient', 'created_at']),
+            # Both directions of a pair share one (low, high) key, so a thread is
+            # a single index range ordered by id.
+            models.Index(
+                Least('sender', 'recipient'), Greatest('sender', 'recipient'), F('id').desc(),
+                name='api_message_thread_idx',
+            ),
         ]
     
     def __str__(self):
         return f"Message from {self.sender.username} to {self.recipient.username}"
+    
+    @classmethod
+    def thread(cls, user_a_id, user_b_id):
+        """Messages between two users, in either direction, via the thread index"""
+        low, high = Conversation.pair(user_a_id, user_b_id)
+        return cls.objects.alias(
+            thread_low=Least('sender', 'recipient'),
+            thread_high=Greatest('sender', 'recipient'),
+        ).filter(thread_low=low, thread_high=high)
+    
+    def save(self, *args, **kwargs):
+        creating = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if creating:
+                Conversation.record_message(self)
+
+
+class Conversation(models.Model):
+    """Inbox row for a pair of users, maintained alongside Message inserts.
+
+    The pair is stored canonically (user_low.id < user_high.id) so each pair
+    has exactly one row. Each side has its own unread counter and a read
+    watermark: every message to that side with an id at or below
+    `*_last_read_message_id` has been read.
+    """
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_activity = models.DateTimeField()
+    low_unread = models.PositiveIntegerField(default=0)
+    high_unread = models.PositiveIntegerField(default=0)
+    low_last_read_message_id = models.PositiveBigIntegerField(default=0)
+    high_last_read_message_id = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-last_activity', '-id']
+        verbose_name = 'Conversation'
+        verbose_name_plural = 'Conversations'
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_conversation_pair'),
+        ]
+        indexes = [
+            # One index per side serves "my inbox, most recent first".
+            models.Index(fields=['user_low', '-last_activity', '-id']),
+            models.Index(fields=['user_high', '-last_activity', '-id']),
+        ]
+    
+    def __str__(self):
+        return f"Conversation between {self.user_low_id} and {self.user_high_id}"
+    
+    @staticmethod
+    def pair(user_a_id, user_b_id):
+        return (user_a_id, user_b_id) if user_a_id <= user_b_id else (user_b_id, user_a_id)
+    
+    def other_user(self, user):
+        return self.user_high if self.user_low_id == user.id else self.user_low
+    
+    def unread_for(self, user):
+        return self.low_unread if self.user_low_id == user.id else self.high_unread
+    
+    def last_read_for(self, user_id):
+        return self.low_last_read_message_id if self.user_low_id == user_id else self.high_last_read_message_id
+    
+    def is_read(self, message):
+        return message.id <= self.last_read_for(message.recipient_id)
+    
+    @classmethod
+    def unread_field(cls, conversation_pair, reader_id):
+        return 'low_unread' if conversation_pair[0] == reader_id else 'high_unread'
+    
+    @classmethod
+    def last_read_field(cls, conversation_pair, reader_id):
+        return 'low_last_read_message_id' if conversation_pair[0] == reader_id else 'high_last_read_message_id'
+    
+    @classmethod
+    def record_message(cls, message):
+        """Fold a new message into its conversation row (call inside the insert's transaction)"""
+        low, high = cls.pair(message.sender_id, message.recipient_id)
+        changes = {
+            # Messages committed out of order must not move the conversation backwards.
+            'last_message': Case(
+                When(last_activity__lte=message.created_at, then=Value(message.pk)),
+                default=F('last_message'),
+                output_field=models.BigIntegerField(),
+            ),
+            'last_activity': Greatest(F('last_activity'), Value(message.created_at)),
+        }
+        if message.sender_id != message.recipient_id:
+            unread = cls.unread_field((low, high), message.recipient_id)
+            changes[unread] = F(unread) + 1
+        
+        conversations = cls.objects.filter(user_low_id=low, user_high_id=high)
+        if conversations.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    user_low_id=low, user_high_id=high,
+                    last_message=message, last_activity=message.created_at,
+                    **{field: 1 for field in changes if field.endswith('_unread')},
+                )
+        except IntegrityError:
+            # Another transaction created the row first.
+            conversations.update(**changes)
+    
+    @classmethod
+    def mark_read(cls, reader_id, other_id):
+        """
+        Move the reader's watermark up to the conversation's last message.
+        
+        A single guarded UPDATE on the conversation row; when nothing is unread
+        it matches no rows and writes nothing. Returns the number of rows changed.
+        """
+        pair = cls.pair(reader_id, other_id)
+        unread = cls.unread_field(pair, reader_id)
+        last_read = cls.last_read_field(pair, reader_id)
+        return cls.objects.filter(
+            Q(**{f'{unread}__gt': 0}) | Q(**{f'{last_read}__lt': F('last_message_id')}),
+            user_low_id=pair[0], user_high_id=pair[1],
+        ).update(**{
+            unread: 0,
+            last_read: Greatest(F(last_read), Coalesce(F('last_message_id'), F(last_read))),
+        })
+
+
+
+class SearchEntry(models.Model):
+    """Full-text search document for a Tubonge post, gig or service.
+
+    The text index itself lives outside the ORM: a generated tsvector column
+    with a GIN index on PostgreSQL, or an FTS5 shadow table on SQLite
+    (see api/search.py and migration 0004).
+    """
+    KIND_CHOICES = [
+        ('post', 'Post'),
+        ('gig', 'Gig'),
+        ('service', 'Service'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=200, blank=True)
+    body = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        verbose_name = 'Search Entry'
+        verbose_name_plural = 'Search Entries'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_entry'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.object_id}"
+
+
+class Upload(models.Model):
+    """Resumable upload session.
+
+    Chunks are streamed to scratch files on local disk (see api/uploads.py)
+    and, once complete and checksummed, moved into `file` in media storage.
+    Posts, gigs, bids and bookings can then reference the upload by id.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('complete', 'Complete'),
+        ('attached', 'Attached'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    file = models.FileField(upload_to='uploads/', blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Upload'
+        verbose_name_plural = 'Uploads'
+    
+    def __str__(self):
+        return f"Upload {self.id} by {self.owner.username} ({self.offset}/{self.size})"
+
+
+class ListingDailyStats(models.Model):
+    """Views, bids and bookings for one gig or service on one day.
+
+    Maintained incrementally by api/rollups.py; `client` is copied from the
+    listing so a dashboard reads its rows by (client, date) alone.
+    """
+    KIND_CHOICES = [
+        ('gig', 'Gig'),
+        ('service', 'Service'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listing_stats')
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    bids = models.PositiveIntegerField(default=0)
+    bookings = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Listing Daily Stats'
+        verbose_name_plural = 'Listing Daily Stats'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id', 'date'], name='unique_listing_day'),
+        ]
+        indexes = [
+            models.Index(fields=['client', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.object_id} on {self.date}"
+
+
+class ClientDailyStats(models.Model):
+    """Totals across all of a client's listings for one day (api/rollups.py)"""
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    bids = models.PositiveIntegerField(default=0)
+    bookings = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Client Daily Stats'
+        verbose_name_plural = 'Client Daily Stats'
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'date'], name='unique_client_day'),
+        ]
+    
+    def __str__(self):
+        return f"{self.client.username} on {self.date}"
 
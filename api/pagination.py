@@ -0,0 +1,378 @@
+import heapq
+from base64 import b64decode, b64encode
+from itertools import islice
+from urllib import parse
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError as DRFValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek-based pagination over a unique, indexed key such as (created_at, id).
+
+    Pages are located with a row comparison against the last key seen instead
+    of an OFFSET, and no COUNT(*) is ever issued, so page N costs the same as
+    page one. Rows inserted while a client is paging sort ahead of the cursor
+    and cannot shift the window, so nothing is duplicated or skipped.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    # Every field is sorted in the same direction; the last one must be unique.
+    ordering = ('-created_at', '-id')
+    # Parsers for cursor values that are annotations rather than model fields.
+    cursor_value_parsers = {}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request, view)
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        Paginate the union of disjoint querysets over the same model.
+
+        Each queryset is seeked and limited on its own, so it can use its own
+        index, and the runs are merged on the key. An OR across two indexed
+        columns becomes two short range scans instead of one scan that has
+        to filter both sides.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.descending = self.ordering[0].startswith('-')
+        self.key_fields = [field.lstrip('-') for field in self.ordering]
+
+        cursor = self.decode_cursor(request, querysets[0].model)
+        reverse = cursor is not None and cursor[0]
+
+        # Walking backwards flips the sort so the rows nearest the cursor come first.
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        runs = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*[prefix + field for field in self.key_fields])
+            if cursor is not None:
+                queryset = queryset.filter(self.seek_filter(cursor[1], descending))
+            runs.append(list(queryset[:self.page_size + 1]))
+
+        if len(runs) == 1:
+            results = runs[0]
+        else:
+            merged = heapq.merge(*runs, key=self.position_of, reverse=descending)
+            results = list(islice(merged, self.page_size + 1))
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        if reverse:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def seek_filter(self, position, descending):
+        """
+        Build `(a, b) < (x, y)` as `a <= x AND (a < x OR (a = x AND b < y))`.
+
+        The OR chain alone is exact, but the planner cannot start an index
+        range from it. The redundant bound on the leading key gives the scan
+        its start, so it reads only the rows past the cursor.
+        """
+        lookup = 'lt' if descending else 'gt'
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.key_fields, position):
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        leading = Q(**{f'{self.key_fields[0]}__{lookup}e': position[0]})
+        return leading & condition
+
+    def position_of(self, item):
+        if isinstance(item, dict):
+            return [item[field] for field in self.key_fields]
+        return [getattr(item, field) for field in self.key_fields]
+
+    def encode_cursor(self, reverse, position):
+        tokens = {'p': [self._format_value(value) for value in position]}
+        if reverse:
+            tokens['r'] = '1'
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            raw_position = tokens['p']
+            if len(raw_position) != len(self.key_fields):
+                raise ValueError
+            position = [
+                self._parse_value(model, field, value)
+                for field, value in zip(self.key_fields, raw_position)
+            ]
+        except (TypeError, ValueError, KeyError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return tokens.get('r', ['0'])[0] == '1', position
+
+    def _format_value(self, value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return str(value)
+
+    def _parse_value(self, model, field_name, value):
+        if field_name in self.cursor_value_parsers:
+            return self.cursor_value_parsers[field_name](value)
+        try:
+            field = model._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.position_of(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(True, self.position_of(self.page[0]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class FeedPagination(KeysetPagination):
+    """Keyset pagination for the Tubonge feed, newest first."""
+    ordering = ('-created_at', '-id')
+
+
+class SearchPagination(KeysetPagination):
+    """Keyset pagination for full-text results, best match first."""
+    ordering = ('-rank', '-id')
+    cursor_value_parsers = {'rank': float}
+
+
+class ListingPagination(KeysetPagination):
+    """Keyset pagination for gig and service listings, newest first unless told otherwise."""
+    ordering = ('-created_at', '-id')
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+
+class InboxPagination(KeysetPagination):
+    """
+    Keyset pagination for the conversation inbox, most recent first.
+
+    Pass one queryset per side of the pair to paginate_querysets.
+    """
+    ordering = ('-last_activity', '-id')
+
+
+class MergedKeysetPagination(BasePagination):
+    """
+    Keyset pagination over several querysets merged into one stream, newest first.
+
+    Each queryset is tagged with a kind and yields dicts. The merged stream is
+    ordered by (created_at, kind, id) descending, so a cursor holding those
+    three values names exactly one row across every queryset. A page reads at
+    most `page_size + 1` rows from each queryset, seeking past the cursor on
+    its (created_at, id) index, and interleaves them with a k-way merge.
+    Only forward (`next`) links are produced.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    kind_key = 'type'
+
+    def paginate_streams(self, streams, request):
+        """Return one page of rows from `streams`, a {kind: queryset} mapping"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request, streams)
+
+        runs = []
+        for kind, queryset in streams.items():
+            if cursor is not None:
+                queryset = queryset.filter(self.seek_filter(kind, cursor))
+            rows = list(queryset.order_by('-created_at', '-id')[:self.page_size + 1])
+            for row in rows:
+                row[self.kind_key] = kind
+            runs.append(rows)
+
+        merged = list(islice(heapq.merge(*runs, key=self.position_of, reverse=True), self.page_size + 1))
+        self.has_next = len(merged) > self.page_size
+        self.page = merged[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def position_of(self, row):
+        return row['created_at'], row[self.kind_key], row['id']
+
+    def seek_filter(self, kind, cursor):
+        """Rows of `kind` that sort after the cursor position"""
+        created_at, cursor_kind, cursor_id = cursor
+        if kind < cursor_kind:
+            # Same-timestamp rows of a lower kind still follow the cursor.
+            return Q(created_at__lte=created_at)
+        if kind == cursor_kind:
+            return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=cursor_id)
+        return Q(created_at__lt=created_at)
+
+    def encode_cursor(self, position):
+        created_at, kind, pk = position
+        querystring = parse.urlencode({'t': created_at.isoformat(), 'k': kind, 'i': pk})
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, streams):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = dict(parse.parse_qsl(querystring, keep_blank_values=True))
+            created_at = parse_datetime(tokens['t'])
+            kind = tokens['k']
+            pk = int(tokens['i'])
+            if created_at is None or kind not in streams:
+                raise ValueError
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, kind, pk
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.position_of(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ThreadPagination(BasePagination):
+    """
+    Id-keyed windows over a single message thread.
+
+    With no parameters the newest `limit` messages are returned. `before_id`
+    pages back through history and `since_id` returns only messages newer than
+    the last one the client holds. Rows always come back oldest first, and
+    `has_more` says whether another window exists in the direction asked for.
+    """
+    limit = 50
+    limit_query_param = 'limit'
+    max_limit = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        before_id = self.get_id(request, 'before_id')
+        since_id = self.get_id(request, 'since_id')
+        limit = self.get_limit(request)
+
+        if before_id is not None:
+            queryset = queryset.filter(id__lt=before_id)
+        if since_id is not None:
+            queryset = queryset.filter(id__gt=since_id)
+        # Delta syncs walk forward from since_id; everything else walks back from the newest row.
+        forward = since_id is not None
+        queryset = queryset.order_by('id' if forward else '-id')
+
+        results = list(queryset[:limit + 1])
+        self.has_more = len(results) > limit
+        self.page = results[:limit]
+        if not forward:
+            self.page.reverse()
+        return self.page
+
+    def get_id(self, request, param):
+        value = request.query_params.get(param)
+        if value is None:
+            return None
+        if not value.isdigit():
+            raise DRFValidationError({param: 'Must be a message id.'})
+        return int(value)
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.limit
+        if limit <= 0:
+            return self.limit
+        return min(limit, self.max_limit)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'has_more': self.has_more,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'results': schema,
+                'has_more': {'type': 'boolean'},
+            },
+        }
@@ -0,0 +1,363 @@
+"""
+Skill-based recommendations for open gigs and services.
+
+Each listing kind has an in-process inverted index over the text of its open
+listings. A listing occupies a slot; every term maps to NumPy arrays of the
+slots it appears in and a BM25 term weight per slot, with title terms counting
+double and requirement terms one and a half times. Ranking a user's skills
+concatenates the postings of the query terms, sums `idf * weight` per slot
+with `np.unique` and `np.bincount`, and takes the top k with an
+argpartition, so its cost follows the postings touched rather than the
+number of listings.
+
+The index is built from the database on first use. Saves and deletes update
+it incrementally once their transaction commits (see api/signals.py): a
+changed listing is tombstoned and re-added in a new slot, a closed or deleted
+one is only tombstoned, and dead slots are compacted away once they outnumber
+the live ones. Listings written by other processes are picked up by a sync on
+the indexed `updated_at` column every RECOMMEND_SYNC_INTERVAL seconds. Callers re-read the ranked
+ids with `status='open'`, so writes that reach no index (e.g.
+`QuerySet.update`) can never surface a closed or deleted listing.
+"""
+import math
+import re
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+
+from .models import Gig, Service
+
+
+MODELS = {
+    'gig': Gig,
+    'service': Service,
+}
+
+FIELD_WEIGHTS = {
+    'title': 2.0,
+    'requirements': 1.5,
+    'description': 1.0,
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+TOKEN = re.compile(r'\w+')
+
+
+def get_sync_interval():
+    return getattr(settings, 'RECOMMEND_SYNC_INTERVAL', 60)
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall((text or '').lower()) if len(token) > 1]
+
+
+def skill_terms(skills):
+    """Distinct query terms from a user's `skills` list"""
+    if not isinstance(skills, list):
+        return []
+    terms = []
+    for skill in skills:
+        if isinstance(skill, str):
+            terms.extend(tokenize(skill))
+    return list(dict.fromkeys(terms))
+
+
+def weighted_terms(fields):
+    """Map each term of a listing to its field-weighted frequency; also return the length"""
+    frequencies = {}
+    length = 0.0
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(fields.get(field)):
+            frequencies[token] = frequencies.get(token, 0.0) + weight
+            length += weight
+    return frequencies, length
+
+
+class Postings:
+    """Slots and weights for one term; appends are buffered until the next read"""
+    __slots__ = ('slots', 'weights', 'new_slots', 'new_weights')
+
+    def __init__(self):
+        self.slots = np.empty(0, dtype=np.int32)
+        self.weights = np.empty(0, dtype=np.float32)
+        self.new_slots = []
+        self.new_weights = []
+
+    def append(self, slot, weight):
+        self.new_slots.append(slot)
+        self.new_weights.append(weight)
+
+    def arrays(self):
+        if self.new_slots:
+            self.slots = np.concatenate([self.slots, np.asarray(self.new_slots, dtype=np.int32)])
+            self.weights = np.concatenate([self.weights, np.asarray(self.new_weights, dtype=np.float32)])
+            self.new_slots, self.new_weights = [], []
+        return self.slots, self.weights
+
+
+class ListingIndex:
+    """Inverted index over the open listings of one kind"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clear()
+        self.built = False
+        self.synced_at = None
+        self.checked_at = 0.0
+
+    def _clear(self):
+        self.postings = {}
+        self.doc_freq = {}
+        self.slot_of = {}
+        self.slot_terms = []
+        self.ids = np.empty(1024, dtype=np.int64)
+        self.active = np.zeros(1024, dtype=bool)
+        self.size = 0
+        self.avg_length = None
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def _grow(self):
+        capacity = len(self.ids) * 2
+        ids = np.empty(capacity, dtype=np.int64)
+        ids[:self.size] = self.ids[:self.size]
+        active = np.zeros(capacity, dtype=bool)
+        active[:self.size] = self.active[:self.size]
+        self.ids, self.active = ids, active
+
+    def _add(self, pk, fields):
+        frequencies, length = weighted_terms(fields)
+        if not frequencies:
+            return
+        if self.size == len(self.ids):
+            self._grow()
+        slot = self.size
+        self.size += 1
+        self.ids[slot] = pk
+        self.active[slot] = True
+        self.slot_of[pk] = slot
+        self.slot_terms.append(tuple(frequencies))
+        # Length normalization uses the average fixed at the last (re)build.
+        norm = K1 * (1 - B + B * length / (self.avg_length or length))
+        for term, tf in frequencies.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = Postings()
+            postings.append(slot, tf * (K1 + 1) / (tf + norm))
+            self.doc_freq[term] = self.doc_freq.get(term, 0) + 1
+
+    def _remove(self, pk):
+        slot = self.slot_of.pop(pk, None)
+        if slot is None:
+            return
+        self.active[slot] = False
+        for term in self.slot_terms[slot]:
+            self.doc_freq[term] -= 1
+        self.slot_terms[slot] = ()
+
+    def load(self, rows):
+        """Rebuild from `(pk, fields)` pairs of open listings"""
+        rows = list(rows)
+        with self._lock:
+            self._clear()
+            lengths = [weighted_terms(fields)[1] for _, fields in rows]
+            lengths = [length for length in lengths if length]
+            self.avg_length = sum(lengths) / len(lengths) if lengths else None
+            for pk, fields in rows:
+                self._add(pk, fields)
+            self.built = True
+
+    def upsert(self, pk, fields, is_open=True):
+        with self._lock:
+            self._remove(pk)
+            if is_open:
+                self._add(pk, fields)
+            self._maybe_compact()
+
+    def remove(self, pk):
+        with self._lock:
+            self._remove(pk)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        dead = self.size - len(self.slot_of)
+        if dead > 1024 and dead > len(self.slot_of):
+            self.compact()
+
+    def compact(self):
+        """Drop tombstoned slots by rebuilding the postings from the live ones"""
+        with self._lock:
+            live = {}
+            for term, postings in self.postings.items():
+                slots, weights = postings.arrays()
+                keep = self.active[slots]
+                if keep.any():
+                    live[term] = (slots[keep], weights[keep])
+            order = np.flatnonzero(self.active[:self.size])
+            remap = np.full(self.size, -1, dtype=np.int32)
+            remap[order] = np.arange(len(order), dtype=np.int32)
+
+            ids = self.ids[order]
+            slot_terms = [self.slot_terms[slot] for slot in order]
+            avg_length = self.avg_length
+            self._clear()
+            self.avg_length = avg_length
+            while len(self.ids) < len(ids):
+                self._grow()
+            self.size = len(ids)
+            self.ids[:self.size] = ids
+            self.active[:self.size] = True
+            self.slot_terms = slot_terms
+            self.slot_of = {int(pk): slot for slot, pk in enumerate(ids)}
+            for term, (slots, weights) in live.items():
+                postings = self.postings[term] = Postings()
+                postings.slots = remap[slots]
+                postings.weights = weights
+                self.doc_freq[term] = len(slots)
+
+    def top(self, terms, k):
+        """Return up to `k` `(pk, score)` pairs for `terms`, best first"""
+        with self._lock:
+            live = len(self.slot_of)
+            if not live:
+                return []
+            slot_runs, weight_runs = [], []
+            for term in terms:
+                postings = self.postings.get(term)
+                doc_freq = self.doc_freq.get(term, 0)
+                if postings is None or doc_freq <= 0:
+                    continue
+                idf = math.log(1 + (live - doc_freq + 0.5) / (doc_freq + 0.5))
+                slots, weights = postings.arrays()
+                slot_runs.append(slots)
+                weight_runs.append(np.float32(idf) * weights)
+            if not slot_runs:
+                return []
+            slots, positions = np.unique(np.concatenate(slot_runs), return_inverse=True)
+            scores = np.bincount(positions, weights=np.concatenate(weight_runs)).astype(np.float32)
+            # Postings still hold tombstoned slots until the next compaction.
+            keep = self.active[slots] & (scores > 0)
+            slots, scores = slots[keep], scores[keep]
+            order = np.arange(len(slots))
+            if len(order) > k:
+                order = np.argpartition(-scores, k - 1)[:k]
+            order = order[np.argsort(-scores[order], kind='stable')]
+            return [(int(self.ids[slots[i]]), float(scores[i])) for i in order]
+
+
+_indexes = {kind: ListingIndex() for kind in MODELS}
+
+
+def get_index(kind):
+    """The index for `kind`, built or synced against the database as needed"""
+    index = _indexes[kind]
+    with index._lock:
+        if not index.built:
+            _build(kind, index)
+        elif time.monotonic() - index.checked_at >= get_sync_interval():
+            _sync(kind, index)
+    return index
+
+
+def _fields(row):
+    return {field: row[field] for field in FIELD_WEIGHTS}
+
+
+def _build(kind, index):
+    columns = ['pk', 'updated_at', *FIELD_WEIGHTS]
+    rows = MODELS[kind].objects.filter(status='open').order_by().values(*columns)
+    synced_at = None
+    pairs = []
+    for row in rows.iterator(chunk_size=2000):
+        pairs.append((row['pk'], _fields(row)))
+        if synced_at is None or row['updated_at'] > synced_at:
+            synced_at = row['updated_at']
+    index.load(pairs)
+    index.synced_at = synced_at
+    index.checked_at = time.monotonic()
+
+
+def _sync(kind, index):
+    """Apply listings changed since the last sync, including other processes' writes"""
+    index.checked_at = time.monotonic()
+    if index.synced_at is None:
+        _build(kind, index)
+        return
+    # Overlap by a second so rows committed out of timestamp order are not missed.
+    since = index.synced_at - timedelta(seconds=1)
+    columns = ['pk', 'status', 'updated_at', *FIELD_WEIGHTS]
+    for row in MODELS[kind].objects.filter(updated_at__gte=since).order_by().values(*columns).iterator():
+        index.upsert(row['pk'], _fields(row), is_open=row['status'] == 'open')
+        index.synced_at = max(index.synced_at, row['updated_at'])
+
+
+def _kind_of_model(model):
+    return 'gig' if issubclass(model, Gig) else 'service'
+
+
+def _kind_of(instance):
+    return _kind_of_model(type(instance))
+
+
+def index_listing(instance):
+    """Reflect a saved gig or service in this process's index"""
+    index = _indexes[_kind_of(instance)]
+    if not index.built:
+        return
+    fields = {field: getattr(instance, field) for field in FIELD_WEIGHTS}
+    index.upsert(instance.pk, fields, is_open=instance.status == 'open')
+
+
+def refresh_listings(model, pks):
+    """Re-read listings changed by bulk writes, which send no signals"""
+    index = _indexes[_kind_of_model(model)]
+    if not index.built or not pks:
+        return
+    columns = ['pk', 'status', *FIELD_WEIGHTS]
+    for row in model.objects.filter(pk__in=pks).order_by().values(*columns):
+        index.upsert(row['pk'], _fields(row), is_open=row['status'] == 'open')
+
+
+def unindex_listing(instance):
+    index = _indexes[_kind_of(instance)]
+    if index.built:
+        index.remove(instance.pk)
+
+
+def recommend(queryset, skills, limit=20):
+    """
+    Open listings from `queryset` ranked against `skills`, as `(instance, score)` pairs.
+
+    Candidates are over-fetched from the index and re-read through `queryset`.
+    When stale or filtered-out entries leave the page short, the next batch
+    of candidates is read, so `limit` results come back whenever that many
+    match.
+    """
+    terms = skill_terms(skills)
+    if not terms:
+        return []
+    index = get_index(_kind_of_model(queryset.model))
+    k = limit * 2 + 10
+    results = []
+    seen = set()
+    while True:
+        ranked = index.top(terms, k)
+        fresh = [(pk, score) for pk, score in ranked if pk not in seen]
+        instances = queryset.filter(status='open').in_bulk([pk for pk, _ in fresh])
+        for pk, score in fresh:
+            seen.add(pk)
+            instance = instances.get(pk)
+            if instance is not None:
+                results.append((instance, score))
+                if len(results) == limit:
+                    return results
+        if len(ranked) < k:
+            return results
+        k *= 2
@@ -0,0 +1,46 @@
+from decimal import Decimal
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+def _has_numbers_to_format(data):
+    """Whether `data` holds a float or Decimal anywhere"""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, (float, Decimal)):
+            return True
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it can match DRF's output:
+    compact, unescaped UTF-8 with datetimes and lazy strings handed to DRF's
+    own encoder. orjson writes some floats in another form (0.00001 rather
+    than 1e-05) and NaN or infinity as null where DRF's strict mode raises,
+    so data holding floats or decimals goes through the standard renderer,
+    as do indented output, ASCII-only settings and anything orjson rejects.
+    The hot list endpoints send decimals as strings and carry no floats.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            data is None or not self.compact or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+            or _has_numbers_to_format(data)
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Match JSONRenderer, which escapes these for embedding in JavaScript.
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
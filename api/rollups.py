@@ -0,0 +1,251 @@
+"""
+Daily analytics rollups for client dashboards.
+
+ListingDailyStats keeps views, bids and bookings per listing per day, and
+ClientDailyStats keeps the same totals per client per day. Both tables are
+bumped in place as activity happens. New bids and bookings are counted in
+the transaction that saves them (see api/signals.py), and view counts are
+added when api/viewcounts.py flushes its buffer. Each update is one multi-row
+`INSERT ... ON CONFLICT DO UPDATE` per table, written the same way for
+PostgreSQL and SQLite.
+
+/api/analytics/ reads only these tables through the (client, date) keys.
+A dashboard therefore costs the days and listings it shows, whatever the
+size of the Bid, Booking or listing tables. `manage.py backfill_analytics`
+rebuilds the rollups from existing rows.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Bid, Booking, ClientDailyStats, Gig, ListingDailyStats, Service
+
+
+COUNTERS = ('views', 'bids', 'bookings')
+MODELS = {
+    'gig': Gig,
+    'service': Service,
+}
+# Rows per INSERT, kept well under SQLite's bound-parameter limit.
+BATCH_SIZE = 100
+
+
+def _upsert_sql(model, key_fields, conflict_fields, rows):
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    keys = [qn(model._meta.get_field(field).column) for field in key_fields]
+    conflict = [qn(model._meta.get_field(field).column) for field in conflict_fields]
+    counters = [qn(field) for field in COUNTERS]
+    values = ', '.join(['(' + ', '.join(['%s'] * (len(keys) + len(counters))) + ')'] * rows)
+    updates = ', '.join(f'{column} = {table}.{column} + EXCLUDED.{column}' for column in counters)
+    return (
+        f'INSERT INTO {table} ({", ".join(keys + counters)}) VALUES {values} '
+        f'ON CONFLICT ({", ".join(conflict)}) DO UPDATE SET {updates}'
+    )
+
+
+def _bump(model, key_fields, conflict_fields, deltas):
+    """Add `deltas` ({key tuple: Counter}) to `model` rows, creating missing ones"""
+    items = [(key, counts) for key, counts in deltas.items() if any(counts.values())]
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), BATCH_SIZE):
+            batch = items[start:start + BATCH_SIZE]
+            params = []
+            for key, counts in batch:
+                params.extend(key)
+                params.extend(counts[field] for field in COUNTERS)
+            cursor.execute(_upsert_sql(model, key_fields, conflict_fields, len(batch)), params)
+
+
+def record(events):
+    """
+    Apply activity to both rollup tables.
+
+    `events` is an iterable of `(kind, object_id, client_id, date, counter, n)`.
+    Events for the same row are merged first, since one statement may not
+    touch a row twice.
+    """
+    listing_deltas = defaultdict(Counter)
+    client_deltas = defaultdict(Counter)
+    for kind, object_id, client_id, date, counter, n in events:
+        listing_deltas[kind, object_id, date, client_id][counter] += n
+        client_deltas[client_id, date][counter] += n
+    if not listing_deltas:
+        return
+    with transaction.atomic():
+        _bump(
+            ListingDailyStats, ['kind', 'object_id', 'date', 'client'], ['kind', 'object_id', 'date'],
+            listing_deltas,
+        )
+        _bump(ClientDailyStats, ['client', 'date'], ['client', 'date'], client_deltas)
+
+
+def record_bid(bid):
+    record([('gig', bid.gig_id, bid.gig.client_id, timezone.localdate(bid.created_at), 'bids', 1)])
+
+
+def record_booking(booking):
+    record([(
+        'service', booking.service_id, booking.service.client_id,
+        timezone.localdate(booking.created_at), 'bookings', 1,
+    )])
+
+
+def record_views(increments, date=None):
+    """Roll up flushed view counts, given as {(kind, object_id): n}"""
+    date = date or timezone.localdate()
+    by_kind = defaultdict(list)
+    for kind, object_id in increments:
+        by_kind[kind].append(object_id)
+    events = []
+    for kind, object_ids in by_kind.items():
+        owners = MODELS[kind].objects.filter(pk__in=object_ids).values_list('pk', 'client_id')
+        for object_id, client_id in owners:
+            events.append((kind, object_id, client_id, date, 'views', increments[kind, object_id]))
+    record(events)
+
+
+def rebuild_client_totals(client_ids=None):
+    """Recompute ClientDailyStats from ListingDailyStats, overwriting what is there"""
+    listing_rows = ListingDailyStats.objects.all()
+    client_rows = ClientDailyStats.objects.all()
+    if client_ids is not None:
+        listing_rows = listing_rows.filter(client_id__in=client_ids)
+        client_rows = client_rows.filter(client_id__in=client_ids)
+    totals = (
+        listing_rows.order_by().values('client_id', 'date')
+        .annotate(**{f'total_{field}': Sum(field) for field in COUNTERS})
+    )
+    with transaction.atomic():
+        client_rows.delete()
+        ClientDailyStats.objects.bulk_create(
+            [
+                ClientDailyStats(
+                    client_id=row['client_id'], date=row['date'],
+                    **{field: row[f'total_{field}'] for field in COUNTERS},
+                )
+                for row in totals.iterator()
+            ],
+            batch_size=1000,
+        )
+
+
+def backfill_activity(model, fk_name, kind, counter):
+    """Overwrite one counter in ListingDailyStats from Bid or Booking history"""
+    per_day = (
+        model.objects.order_by()
+        .annotate(date=TruncDate('created_at'))
+        .values(f'{fk_name}_id', f'{fk_name}__client_id', 'date')
+        .annotate(n=Count('*'))
+    )
+    written = 0
+    with transaction.atomic():
+        ListingDailyStats.objects.filter(kind=kind).update(**{counter: 0})
+        batch = []
+        for row in per_day.iterator():
+            batch.append(ListingDailyStats(
+                kind=kind, object_id=row[f'{fk_name}_id'], client_id=row[f'{fk_name}__client_id'],
+                date=row['date'], **{counter: row['n']},
+            ))
+            if len(batch) >= 1000:
+                written += _overwrite(batch, counter)
+                batch = []
+        written += _overwrite(batch, counter)
+    return written
+
+
+def _overwrite(rows, counter):
+    ListingDailyStats.objects.bulk_create(
+        rows, update_conflicts=True,
+        unique_fields=['kind', 'object_id', 'date'], update_fields=[counter],
+    )
+    return len(rows)
+
+
+def backfill_views(kind):
+    """
+    Roll up views that predate the rollups.
+
+    Only a listing's running `views` total exists for that period, so whatever
+    the rollups have not seen yet is counted on the day the listing was created.
+    """
+    model = MODELS[kind]
+    rolled_up = dict(
+        ListingDailyStats.objects.filter(kind=kind).order_by()
+        .values('object_id').annotate(n=Sum('views')).values_list('object_id', 'n')
+    )
+    events = []
+    for pk, client_id, views, created_at in (
+        model.objects.filter(views__gt=0).values_list('pk', 'client_id', 'views', 'created_at').iterator()
+    ):
+        missing = views - rolled_up.get(pk, 0)
+        if missing > 0:
+            events.append((kind, pk, client_id, timezone.localdate(created_at), 'views', missing))
+    record(events)
+    return len(events)
+
+
+def backfill():
+    """Rebuild bid and booking rollups from history and add unrolled views"""
+    counts = {
+        'bids': backfill_activity(Bid, 'gig', 'gig', 'bids'),
+        'bookings': backfill_activity(Booking, 'service', 'service', 'bookings'),
+        'views': sum(backfill_views(kind) for kind in MODELS),
+    }
+    rebuild_client_totals()
+    return counts
+
+
+def _series(rows, start, end):
+    """Zero-filled per-day counters between start and end, inclusive"""
+    by_date = {row['date']: row for row in rows}
+    series = []
+    day = start
+    while day <= end:
+        row = by_date.get(day, {})
+        series.append({'date': day, **{field: row.get(field, 0) for field in COUNTERS}})
+        day += timedelta(days=1)
+    return series
+
+
+def dashboard(client_id, start, end, listing=None):
+    """
+    A client's activity between `start` and `end`, read from the rollups only.
+
+    `daily` covers every day in the range, for one `(kind, object_id)` listing
+    when given and otherwise for all of the client's listings; `listings`
+    totals the range per listing, busiest first.
+    """
+    listing_rows = ListingDailyStats.objects.filter(client_id=client_id, date__range=(start, end))
+    if listing is not None:
+        kind, object_id = listing
+        daily = listing_rows.filter(kind=kind, object_id=object_id).values('date', *COUNTERS)
+    else:
+        daily = ClientDailyStats.objects.filter(client_id=client_id, date__range=(start, end)).values(
+            'date', *COUNTERS
+        )
+    series = _series(daily, start, end)
+
+    per_listing = (
+        listing_rows.order_by().values('kind', 'object_id')
+        .annotate(**{f'total_{field}': Sum(field) for field in COUNTERS})
+    )
+    listings = sorted(
+        (
+            {'type': row['kind'], 'id': row['object_id'], **{field: row[f'total_{field}'] for field in COUNTERS}}
+            for row in per_listing
+        ),
+        key=lambda item: (item['views'] + item['bids'] + item['bookings'], item['id']),
+        reverse=True,
+    )
+    return {
+        'start': start,
+        'end': end,
+        'totals': {field: sum(day[field] for day in series) for field in COUNTERS},
+        'daily': series,
+        'listings': listings,
+    }
@@ -0,0 +1,132 @@
+"""
+Full-text search over Tubonge posts, gigs and services.
+
+Every searchable row has a SearchEntry holding its title and body. The entry
+is upserted from post_save and removed on post_delete (see api/signals.py).
+The database maintains the actual index: a generated `search_vector`
+tsvector column with a GIN index on PostgreSQL, or the `api_searchentry_fts`
+FTS5 table kept in sync by triggers on SQLite. Both are created by migration
+0004.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from .models import Gig, SearchEntry, Service, TubongePost
+
+
+SEARCH_CONFIG = 'english'
+SNIPPET_LENGTH = 200
+
+KINDS = {
+    TubongePost: 'post',
+    Gig: 'gig',
+    Service: 'service',
+}
+
+
+def build_document(instance):
+    """Return `(title, body)` for a searchable model instance"""
+    if isinstance(instance, TubongePost):
+        return '', instance.text or ''
+    return instance.title, f"{instance.description}\n{instance.requirements}"
+
+
+def index_instance(instance):
+    title, body = build_document(instance)
+    SearchEntry.objects.update_or_create(
+        kind=KINDS[type(instance)],
+        object_id=instance.pk,
+        defaults={'title': title, 'body': body, 'created_at': instance.created_at},
+    )
+
+
+def index_instances(instances):
+    """Upsert entries for many rows of one model in two statements; bulk writes skip signals"""
+    if not instances:
+        return
+    kind = KINDS[type(instances[0])]
+    entries = []
+    for instance in instances:
+        title, body = build_document(instance)
+        entries.append(SearchEntry(
+            kind=kind, object_id=instance.pk, title=title, body=body, created_at=instance.created_at,
+        ))
+    SearchEntry.objects.filter(kind=kind, object_id__in=[instance.pk for instance in instances]).delete()
+    SearchEntry.objects.bulk_create(entries)
+
+
+def unindex_instance(instance):
+    SearchEntry.objects.filter(kind=KINDS[type(instance)], object_id=instance.pk).delete()
+
+
+def _fts5_query(text):
+    """Quote every term so user input can never be parsed as FTS5 syntax"""
+    terms = re.findall(r'\w+', text)
+    return ' '.join('"%s"' % term for term in terms)
+
+
+def _match_and_rank(text):
+    table = SearchEntry._meta.db_table
+    if connection.vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        match = RawSQL(f'"{table}"."search_vector" @@ {tsquery}', [text], output_field=BooleanField())
+        rank = RawSQL(f'ts_rank_cd("{table}"."search_vector", {tsquery})', [text], output_field=FloatField())
+        return match, rank
+    if connection.vendor == 'sqlite':
+        query = _fts5_query(text)
+        fts = f'{table}_fts'
+        match = RawSQL(
+            f'"{table}"."id" IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)',
+            [query], output_field=BooleanField(),
+        )
+        # bm25() is lower-is-better; negate it so both backends rank descending.
+        rank = RawSQL(
+            f'(SELECT -bm25({fts}, 2.0, 1.0) FROM {fts} WHERE {fts} MATCH %s AND rowid = "{table}"."id")',
+            [query], output_field=FloatField(),
+        )
+        return match, rank
+    raise NotImplementedError(f'Full-text search is not supported on {connection.vendor}')
+
+
+def has_terms(text):
+    return bool(re.search(r'\w', text or ''))
+
+
+def search_entries(text, kinds=None):
+    """SearchEntry rows matching `text`, annotated with a descending `rank`"""
+    match, rank = _match_and_rank(text)
+    # ts_rank_cd() returns a float4. Cursors carry the rank as a Python float
+    # and compare it as a float8, so a float4 rank would never equal the
+    # cursor and ties at a page boundary would be skipped.
+    queryset = SearchEntry.objects.filter(match).annotate(rank=Cast(rank, FloatField()))
+    if kinds:
+        queryset = queryset.filter(kind__in=kinds)
+    return queryset
+
+
+def matching_ids(kind, text):
+    """Primary keys of `kind` objects matching `text`, as a raw subquery"""
+    table = SearchEntry._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = (
+            f'SELECT object_id FROM "{table}" WHERE kind = %s '
+            f"AND search_vector @@ websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        )
+        return RawSQL(sql, [kind, text])
+    if connection.vendor == 'sqlite':
+        sql = (
+            f'SELECT object_id FROM "{table}" WHERE kind = %s '
+            f'AND id IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s)'
+        )
+        return RawSQL(sql, [kind, _fts5_query(text)])
+    raise NotImplementedError(f'Full-text search is not supported on {connection.vendor}')
+
+
+def snippet(body):
+    if len(body) <= SNIPPET_LENGTH:
+        return body
+    return body[:SNIPPET_LENGTH].rstrip() + '...'
@@ -1,12 +1,89 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from django.db import IntegrityError, transaction
 from .models import (
     User, TubongePost, PostComment, Gig, Service,
-    Bid, Booking, Message
+    Bid, Booking, Message, SearchEntry, Upload
 )
+from . import sparse, uploads
+from .feed import FULL_COMMENTS_SIZE
+from .listings import ORDERINGS, DEFAULT_ORDERING
+from .media import variant_urls
+from .search import snippet
 
 
-class UserSerializer(serializers.ModelSerializer):
+EMAIL_CONSTRAINT = 'api_user_email_lower_uniq'
+
+
+class UploadReferenceMixin:
+    """Accept the id of a finalized Upload in place of a multipart file.
+
+    `upload_fields` maps a write-only `<name>_upload_id` field to the model
+    file field it fills, e.g. {'document_upload_id': 'document'}.
+    """
+    upload_fields = {}
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        for reference in self.upload_fields:
+            fields[reference] = serializers.UUIDField(write_only=True, required=False)
+        return fields
+    
+    def to_internal_value(self, data):
+        attrs = super().to_internal_value(data)
+        self._claimed_uploads = []
+        request = self.context.get('request')
+        for reference, field_name in self.upload_fields.items():
+            upload_id = attrs.pop(reference, None)
+            if upload_id is None:
+                continue
+            if request is None:
+                raise serializers.ValidationError({reference: 'Uploads require an authenticated request.'})
+            try:
+                upload = uploads.claim(upload_id, request.user, self.Meta.model, field_name)
+            except uploads.UploadError as exc:
+                raise serializers.ValidationError({reference: exc.message})
+            attrs[field_name] = upload.file
+            self._claimed_uploads.append(upload)
+        if isinstance(self.parent, serializers.ListSerializer):
+            # many=True validates every item with one child, so keep all claims on the list.
+            self.parent.claimed_uploads = getattr(self.parent, 'claimed_uploads', []) + self._claimed_uploads
+        return attrs
+    
+    def save(self, **kwargs):
+        instance = super().save(**kwargs)
+        uploads.mark_attached(getattr(self, '_claimed_uploads', []))
+        return instance
+
+
+class SparseFieldsMixin:
+    """Apply `?fields=` and `?expand=` (see api/sparse.py) when this is the response's top-level serializer.
+
+    `sparse_requires` maps a method field to the model fields it reads, so a
+    narrowed queryset still loads them.
+    """
+    sparse_requires = {}
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+        return sparse.select(fields, self.context.get('request'))
+
+
+def nested_data(serializer, field_name, parent):
+    """
+    Render `serializer` as a field of `parent` from inside one of its method
+    fields: it shares the parent's context and is not cut to `?fields=`.
+    """
+    serializer.bind(field_name, parent)
+    return serializer.data
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for User model"""
     class Meta:
         model = User
@@ -15,6 +92,27 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+class UserSummarySerializer(serializers.ModelSerializer):
+    """
+    Compact user for nesting inside other objects. Each user is rendered once
+    per response and reused, since a page often names the same few people
+    many times; the memo lives in the root serializer's context.
+    """
+    avatar = serializers.ImageField(source='profile_picture', read_only=True)
+    
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'user_type', 'avatar']
+        read_only_fields = fields
+    
+    def to_representation(self, instance):
+        memo = self.context.setdefault('user_summaries', {})
+        data = memo.get(instance.pk)
+        if data is None:
+            data = memo[instance.pk] = super().to_representation(instance)
+        return data
+
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     """Serializer for user registration"""
     password = serializers.CharField(write_only=True, min_length=8)
@@ -31,15 +129,30 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return attrs
     
     def validate_email(self, value):
-        if User.objects.filter(email=value).exists():
+        if value and User.objects.by_email(value).exists():
             raise serializers.ValidationError("A user with this email already exists.")
         return value
     
     def create(self, validated_data):
         validated_data.pop('password_confirm')
         password = validated_data.pop('password')
-        user = User.objects.create_user(password=password, **validated_data)
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(password=password, **validated_data)
+        except IntegrityError as exc:
+            # A concurrent signup took the email or username after validation.
+            raise serializers.ValidationError(self.duplicate_errors(exc))
         return user
+    
+    def duplicate_errors(self, exc):
+        """Field errors for the unique constraint that `exc` reports, re-raising anything else"""
+        # PostgreSQL names the constraint in the error details; SQLite only in the message.
+        constraint = getattr(getattr(exc.__cause__, 'diag', None), 'constraint_name', None) or str(exc)
+        if EMAIL_CONSTRAINT in constraint:
+            return {'email': ['A user with this email already exists.']}
+        if 'username' in constraint:
+            return {'username': [User._meta.get_field('username').error_messages['unique']]}
+        raise exc
 
 
 class LoginSerializer(serializers.Serializer):
@@ -53,41 +166,53 @@ class LoginSerializer(serializers.Serializer):
         password = attrs.get('password')
         
         if email and password:
-            try:
-                user = User.objects.get(email=email)
-                if not user.check_password(password):
-                    raise serializers.ValidationError('Invalid email or password.')
-                if not user.is_active:
-                    raise serializers.ValidationError('User account is disabled.')
-                attrs['user'] = user
-            except User.DoesNotExist:
+            user = User.objects.by_email(email).first()
+            if user is None:
+                # Hash anyway so unknown emails take as long as wrong passwords.
+                User().set_password(password)
                 raise serializers.ValidationError('Invalid email or password.')
+            # check_password also rehashes and saves a hash made with an old work factor.
+            if not user.check_password(password):
+                raise serializers.ValidationError('Invalid email or password.')
+            if not user.is_active:
+                raise serializers.ValidationError('User account is disabled.')
+            attrs['user'] = user
         else:
             raise serializers.ValidationError('Must include email and password.')
         
         return attrs
 
 
-class TubongePostSerializer(serializers.ModelSerializer):
+class TubongePostSerializer(SparseFieldsMixin, UploadReferenceMixin, serializers.ModelSerializer):
     """Serializer for Tubonge posts"""
-    author = UserSerializer(read_only=True)
+    upload_fields = {'media_upload_id': 'media_file'}
+    author = UserSummarySerializer(read_only=True)
     author_id = serializers.IntegerField(write_only=True, required=False)
     like_count = serializers.IntegerField(read_only=True)
     comments_count = serializers.IntegerField(read_only=True)
     text = serializers.CharField(required=False, allow_blank=True)
-    likes = UserSerializer(many=True, read_only=True)
+    likes = UserSummarySerializer(many=True, read_only=True)
     comments = serializers.SerializerMethodField()
+    media_srcset = serializers.SerializerMethodField()
+    sparse_requires = {'media_srcset': ['media_variants']}
     
     class Meta:
         model = TubongePost
-        fields = ['id', 'author', 'author_id', 'text', 'media_file', 'media_type', 
-                  'link', 'like_count', 'comments_count', 'likes', 'comments', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = ['id', 'author', 'author_id', 'text', 'media_file', 'media_type', 'media_status',
+                  'media_srcset', 'link', 'like_count', 'comments_count', 'likes', 'comments',
+                  'created_at', 'updated_at']
+        # media_type is detected from the upload by api.media, not trusted from the client
+        read_only_fields = ['id', 'media_type', 'media_status', 'created_at', 'updated_at']
+    
+    def get_media_srcset(self, obj):
+        return variant_urls(obj, self.context.get('request'))
     
     def get_comments(self, obj):
-        """Get comments for this post"""
-        comments = obj.comments.select_related('author').all()[:10]  # Limit to 10 most recent
-        return PostCommentSerializer(comments, many=True).data
+        """The post's first comments, prefetched for a page by feed.prefetch_comments()"""
+        comments = getattr(obj, 'first_comments', None)
+        if comments is None:
+            comments = obj.comments.select_related('author').all()[:FULL_COMMENTS_SIZE]
+        return nested_data(PostCommentSerializer(comments, many=True), 'comments', self)
     
     def validate(self, attrs):
         """Ensure at least text, media_file, or link is provided"""
@@ -104,9 +229,35 @@ class TubongePostSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class PostCommentSerializer(serializers.ModelSerializer):
+class TubongeFeedSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Lean feed representation: no liker list, bounded comment previews"""
+    author = UserSummarySerializer(read_only=True)
+    liked_by_me = serializers.SerializerMethodField()
+    comments = serializers.SerializerMethodField()
+    media_srcset = serializers.SerializerMethodField()
+    sparse_requires = {'media_srcset': ['media_variants']}
+    
+    class Meta:
+        model = TubongePost
+        fields = ['id', 'author', 'text', 'media_file', 'media_type', 'media_status', 'media_srcset',
+                  'link', 'like_count', 'comments_count', 'liked_by_me', 'comments', 'created_at', 'updated_at']
+        read_only_fields = fields
+    
+    def get_media_srcset(self, obj):
+        return variant_urls(obj, self.context.get('request'))
+    
+    def get_liked_by_me(self, obj):
+        return obj.pk in self.context.get('liked_post_ids', ())
+    
+    def get_comments(self, obj):
+        """Latest comments, looked up for the whole page by build_feed_context"""
+        comments = self.context.get('comment_previews', {}).get(obj.pk, [])
+        return nested_data(PostCommentSerializer(comments, many=True), 'comments', self)
+
+
+class PostCommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for post comments"""
-    author = UserSerializer(read_only=True)
+    author = UserSummarySerializer(read_only=True)
     
     class Meta:
         model = PostComment
@@ -114,31 +265,53 @@ class PostCommentSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class GigSerializer(serializers.ModelSerializer):
+class GigSerializer(SparseFieldsMixin, UploadReferenceMixin, serializers.ModelSerializer):
     """Serializer for Gigs"""
-    client = UserSerializer(read_only=True)
+    upload_fields = {'document_upload_id': 'document'}
+    client = UserSummarySerializer(read_only=True)
+    bid_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Gig
         fields = ['id', 'client', 'title', 'description', 'price', 'timeframe', 
-                  'requirements', 'document', 'status', 'views', 'created_at', 'updated_at']
+                  'requirements', 'document', 'status', 'views', 'bid_count', 'created_at', 'updated_at']
         read_only_fields = ['id', 'views', 'created_at', 'updated_at']
 
 
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(SparseFieldsMixin, UploadReferenceMixin, serializers.ModelSerializer):
     """Serializer for Services"""
-    client = UserSerializer(read_only=True)
+    upload_fields = {'document_upload_id': 'document'}
+    client = UserSummarySerializer(read_only=True)
+    booking_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Service
         fields = ['id', 'client', 'title', 'description', 'price', 'duration', 
-                  'requirements', 'document', 'status', 'views', 'created_at', 'updated_at']
+                  'requirements', 'document', 'status', 'views', 'booking_count', 'created_at', 'updated_at']
         read_only_fields = ['id', 'views', 'created_at', 'updated_at']
 
 
-class BidSerializer(serializers.ModelSerializer):
+class ListingFilterSerializer(serializers.Serializer):
+    """Query parameters for filtering and ordering gig and service listings"""
+    status = serializers.ChoiceField(choices=Gig.STATUS_CHOICES, required=False)
+    client = serializers.IntegerField(required=False, error_messages={'invalid': 'Must be a user id.'})
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    ordering = serializers.ChoiceField(choices=list(ORDERINGS), default=DEFAULT_ORDERING)
+    
+    def validate(self, attrs):
+        if attrs.get('min_price') is not None and attrs.get('max_price') is not None:
+            if attrs['min_price'] > attrs['max_price']:
+                raise serializers.ValidationError({'max_price': 'Must not be below min_price.'})
+        return attrs
+
+
+class BidSerializer(SparseFieldsMixin, UploadReferenceMixin, serializers.ModelSerializer):
     """Serializer for Bids"""
-    bidder = UserSerializer(read_only=True)
+    upload_fields = {'document_upload_id': 'document'}
+    bidder = UserSummarySerializer(read_only=True)
     
     class Meta:
         model = Bid
@@ -146,9 +319,10 @@ class BidSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(SparseFieldsMixin, UploadReferenceMixin, serializers.ModelSerializer):
     """Serializer for Bookings"""
-    booker = UserSerializer(read_only=True)
+    upload_fields = {'document_upload_id': 'document'}
+    booker = UserSummarySerializer(read_only=True)
     
     class Meta:
         model = Booking
@@ -156,10 +330,11 @@ class BookingSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for Messages"""
-    sender = UserSerializer(read_only=True)
-    recipient = UserSerializer(read_only=True)
+    sender = UserSummarySerializer(read_only=True)
+    recipient = UserSummarySerializer(read_only=True)
+    is_read = serializers.BooleanField(read_only=True)
     
     class Meta:
         model = Message
@@ -167,9 +342,48 @@ class MessageSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class ConversationSerializer(serializers.Serializer):
+class ThreadMessageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Flat message row for thread windows; participants are sent as ids"""
+    is_read = serializers.BooleanField(read_only=True)
+    
+    class Meta:
+        model = Message
+        fields = ['id', 'sender', 'recipient', 'text', 'is_read', 'created_at']
+        read_only_fields = fields
+
+
+class ConversationSerializer(SparseFieldsMixin, serializers.Serializer):
     """Serializer for conversation between two users"""
-    user = UserSerializer()
+    user = UserSummarySerializer()
     last_message = MessageSerializer(required=False, allow_null=True)
     unread_count = serializers.IntegerField()
 
+
+
+class SearchResultSerializer(serializers.ModelSerializer):
+    """Compact, ranked search hit built from the search entry alone"""
+    type = serializers.CharField(source='kind')
+    id = serializers.IntegerField(source='object_id')
+    snippet = serializers.SerializerMethodField()
+    rank = serializers.FloatField()
+    
+    class Meta:
+        model = SearchEntry
+        fields = ['type', 'id', 'title', 'snippet', 'created_at', 'rank']
+    
+    def get_snippet(self, obj):
+        return snippet(obj.body)
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    """Serializer for resumable upload sessions"""
+    
+    class Meta:
+        model = Upload
+        fields = ['id', 'filename', 'size', 'offset', 'sha256', 'status', 'file', 'created_at']
+        read_only_fields = ['id', 'offset', 'sha256', 'status', 'file', 'created_at']
+    
+    def validate_size(self, value):
+        if value > uploads.get_max_size():
+            raise serializers.ValidationError(f'Uploads are limited to {uploads.get_max_size()} bytes.')
+        return value
@@ -0,0 +1,129 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import activity, cache, chat, counters, recommend, rollups, search, usercache
+from .models import Bid, Booking, Gig, Message, PostComment, Service, TubongePost, User
+
+
+@receiver(m2m_changed, sender=TubongePost.likes.through)
+def update_like_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep TubongePost.like_count in step with likes.add/remove/clear"""
+    if action == 'pre_clear' and reverse:
+        # Once the rows are gone there is no way to tell which posts they pointed at.
+        instance._cleared_liked_post_ids = list(
+            sender.objects.filter(user_id=instance.pk).values_list('tubongepost_id', flat=True)
+        )
+    elif action == 'post_add' and pk_set:
+        # Django only reports the rows it actually inserted on post_add.
+        if reverse:
+            counters.adjust_like_count(pk_set, 1)
+        else:
+            counters.adjust_like_count([instance.pk], len(pk_set))
+    elif action == 'post_remove' and pk_set:
+        # pk_set on remove may name rows that were never there, so recount.
+        counters.recount_likes(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        if reverse:
+            counters.recount_likes(instance.__dict__.pop('_cleared_liked_post_ids', []))
+        else:
+            counters.recount_likes([instance.pk])
+
+
+@receiver(post_save, sender=PostComment)
+def increment_comments_count(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=PostComment)
+def decrement_comments_count(sender, instance, **kwargs):
+    counters.adjust_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=TubongePost)
+@receiver(post_delete, sender=TubongePost)
+def invalidate_post_caches(sender, instance, **kwargs):
+    cache.invalidate_feed()
+    if kwargs.get('signal') is post_delete:
+        cache.invalidate_comments(instance.pk)
+
+
+@receiver(post_save, sender=PostComment)
+@receiver(post_delete, sender=PostComment)
+def invalidate_comment_caches(sender, instance, **kwargs):
+    # Feed counts and previews are read live (api/feed.py), so only the thread goes stale.
+    cache.invalidate_comments(instance.post_id)
+
+
+@receiver(post_save, sender=TubongePost)
+@receiver(post_save, sender=Gig)
+@receiver(post_save, sender=Service)
+def update_search_entry(sender, instance, **kwargs):
+    search.index_instance(instance)
+
+
+@receiver(post_delete, sender=TubongePost)
+@receiver(post_delete, sender=Gig)
+@receiver(post_delete, sender=Service)
+def delete_search_entry(sender, instance, **kwargs):
+    search.unindex_instance(instance)
+
+
+@receiver(post_save, sender=Gig)
+@receiver(post_save, sender=Service)
+def update_recommendation_index(sender, instance, **kwargs):
+    # A rolled-back save must not reach the in-process index.
+    transaction.on_commit(lambda: recommend.index_listing(instance))
+
+
+@receiver(post_delete, sender=Gig)
+@receiver(post_delete, sender=Service)
+def delete_recommendation_entry(sender, instance, **kwargs):
+    transaction.on_commit(lambda: recommend.unindex_listing(instance))
+
+
+@receiver(post_save, sender=Message)
+def publish_new_message(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: chat.publish_message(instance))
+        if instance.sender_id != instance.recipient_id:
+            transaction.on_commit(lambda: activity.counter_delta(
+                instance.recipient_id, 'unread', instance.sender_id
+            ))
+
+
+@receiver(post_save, sender=Bid)
+def publish_new_bid(sender, instance, created, **kwargs):
+    if created:
+        client_id = instance.gig.client_id
+        transaction.on_commit(lambda: activity.counter_delta(client_id, 'bids', instance.gig_id))
+        # Same transaction as the bid, so the rollup can never drift from it.
+        rollups.record_bid(instance)
+
+
+@receiver(post_save, sender=Booking)
+def publish_new_booking(sender, instance, created, **kwargs):
+    if created:
+        client_id = instance.service.client_id
+        transaction.on_commit(lambda: activity.counter_delta(client_id, 'bookings', instance.service_id))
+        rollups.record_booking(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    if transaction.get_connection().in_atomic_block:
+        # Drop it now too, but again on commit in case a request re-cached
+        # the old row in between.
+        usercache.invalidate(instance.pk)
+    transaction.on_commit(lambda: usercache.invalidate(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_summaries(sender, instance, created, update_fields=None, **kwargs):
+    """Listings and posts embed their owner's summary; a login only writes last_login"""
+    if created:
+        return
+    if update_fields is None or {'username', 'user_type', 'profile_picture'}.intersection(update_fields):
+        cache.invalidate_feed()
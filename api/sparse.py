@@ -0,0 +1,136 @@
+"""
+Sparse fieldsets: `?fields=` and `?expand=` on read endpoints.
+
+`?fields=id,title,client` limits a response to those top-level fields. In
+that mode a nested relation is sent as its id (or a list of ids) unless it
+is also named in `?expand=`, e.g. `?fields=id,title,client&expand=client`.
+Requests without `fields` keep the full representation.
+
+The same selection narrows the queryset. Only the selected columns are
+loaded, expanded relations are joined with `select_related` or fetched with
+a narrowed `Prefetch`, and relations that are not sent are not touched.
+Serializers opt in with SparseFieldsMixin (api/serializers.py). Method
+fields that read other columns list them in `sparse_requires`.
+"""
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def _names(request, param):
+    # Writes always validate and return every field.
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    # Serializers may be handed a plain HttpRequest in their context.
+    raw = getattr(request, 'query_params', request.GET).get(param)
+    if raw is None:
+        return None
+    return frozenset(name.strip() for name in raw.split(',') if name.strip())
+
+
+def requested(request):
+    """(fields, expand) from the query string; fields is None for a full response"""
+    return _names(request, FIELDS_PARAM), _names(request, EXPAND_PARAM) or frozenset()
+
+
+def wants(request, name):
+    """Whether a response to `request` includes the top-level field `name`"""
+    fields, _ = requested(request)
+    return fields is None or name in fields
+
+
+def _is_relation(field):
+    return isinstance(field, (serializers.BaseSerializer, serializers.RelatedField, serializers.ManyRelatedField))
+
+
+def select(fields, request):
+    """Cut a serializer's fields down to the request's fieldset, collapsing unexpanded relations"""
+    names, expand = requested(request)
+    if names is None:
+        return fields
+    readable = [name for name, field in fields.items() if not field.write_only]
+    unknown = sorted(names.difference(readable))
+    if unknown:
+        raise ValidationError({FIELDS_PARAM: f'Unknown field(s): {", ".join(unknown)}. '
+                                             f'Available: {", ".join(readable)}.'})
+    relations = [name for name in readable if _is_relation(fields[name])]
+    unknown = sorted(expand.difference(relations))
+    if unknown:
+        raise ValidationError({EXPAND_PARAM: f'Cannot expand: {", ".join(unknown)}. '
+                                             f'Relations: {", ".join(relations) or "none"}.'})
+
+    selected = {}
+    for name, field in fields.items():
+        if field.write_only:
+            # Kept so the serializer still accepts writes.
+            selected[name] = field
+        elif name not in names:
+            continue
+        elif isinstance(field, serializers.BaseSerializer) and name not in expand:
+            many = isinstance(field, serializers.ListSerializer)
+            selected[name] = serializers.PrimaryKeyRelatedField(read_only=True, many=many, source=field.source)
+        else:
+            selected[name] = field
+    return selected
+
+
+def _model_fields(model):
+    return {field.name: field for field in model._meta.concrete_fields}
+
+
+def _columns(serializer, model):
+    """Concrete columns a (nested) serializer reads"""
+    concrete = _model_fields(model)
+    columns = [model._meta.pk.name]
+    for field in serializer.fields.values():
+        if not field.write_only and field.source in concrete:
+            columns.append(field.source)
+    for extra in getattr(serializer, 'sparse_requires', {}).values():
+        columns.extend(extra)
+    return columns
+
+
+def narrow(queryset, serializer, request, always=()):
+    """Load only what `serializer`, already cut down by select(), will read, plus `always`"""
+    if requested(request)[0] is None:
+        return queryset
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    model = queryset.model
+    concrete = _model_fields(model)
+    only = [model._meta.pk.name, *always]
+    joins = []
+    prefetches = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        source = field.source
+        if isinstance(field, serializers.ListSerializer):
+            child_model = field.child.Meta.model
+            prefetches.append(Prefetch(source, queryset=child_model.objects.only(*_columns(field.child, child_model))))
+        elif isinstance(field, serializers.BaseSerializer):
+            related_model = model._meta.get_field(source).related_model
+            joins.append(source)
+            only.append(source)
+            only.extend(f'{source}__{column}' for column in _columns(field, related_model))
+        elif isinstance(field, serializers.ManyRelatedField):
+            related_model = model._meta.get_field(source).related_model
+            prefetches.append(Prefetch(source, queryset=related_model.objects.only('pk')))
+        elif source in concrete:
+            only.append(source)
+        else:
+            only.extend(getattr(serializer, 'sparse_requires', {}).get(name, ()))
+    # Pagination reads the ordering columns back from the last row.
+    ordering = list(queryset.query.order_by) or list(model._meta.ordering)
+    only.extend(
+        field.lstrip('-') for field in ordering if isinstance(field, str) and field.lstrip('-') in concrete
+    )
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if joins:
+        queryset = queryset.select_related(*joins)
+    return queryset.prefetch_related(*prefetches).only(*only)
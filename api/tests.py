@@ -0,0 +1,2000 @@
+import hashlib
+import io
+import itertools
+import json
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.testing import WebsocketCommunicator
+from django.contrib import admin
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import numpy as np
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError as DRFValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ableconnect_backend.asgi import application
+
+from . import fastpath, listings, recommend, rollups, sparse, uploads, usercache, viewcounts
+from .counters import LikeThrough, reconcile_post_counters, toggle_like
+from .models import (
+    Bid, Booking, ClientDailyStats, Conversation, Gig, ListingDailyStats, Message, PostComment, Service,
+    TubongePost, Upload, User,
+)
+from .renderers import FastJSONRenderer
+from .search import SNIPPET_LENGTH
+from .serializers import (
+    GigSerializer, LoginSerializer, TubongePostSerializer, UserRegistrationSerializer, UserSummarySerializer,
+)
+
+
+class ApiClientMixin:
+    """Logged-in client with empty caches, so versioned entries never leak between tests"""
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.user = self.make_user('alice', user_type='client')
+        self.client.force_authenticate(self.user)
+
+    def make_user(self, username, **fields):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com', password=None, **fields
+        )
+
+
+class ApiTestCase(ApiClientMixin, APITestCase):
+    """Each test runs in a transaction that is rolled back afterwards"""
+
+
+class PostCounterTests(ApiTestCase):
+    """like_count and comments_count stay in step with the rows they count"""
+
+    def setUp(self):
+        super().setUp()
+        self.post = TubongePost.objects.create(author=self.user, text='hello')
+
+    def assertCountersMatch(self, post):
+        post.refresh_from_db()
+        self.assertEqual(post.like_count, LikeThrough.objects.filter(tubongepost=post).count())
+        self.assertEqual(post.comments_count, PostComment.objects.filter(post=post).count())
+
+    def test_like_unlike_like(self):
+        url = f'/api/tubonge-posts/{self.post.pk}/like/'
+        for liked, like_count in [(True, 1), (False, 0), (True, 1)]:
+            response = self.client.post(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, {'liked': liked, 'like_count': like_count})
+            self.assertCountersMatch(self.post)
+
+    def test_likes_from_several_users(self):
+        others = [self.make_user(f'user{i}') for i in range(3)]
+        for user in others:
+            self.client.force_authenticate(user)
+            self.client.post(f'/api/tubonge-posts/{self.post.pk}/like/')
+        self.client.force_authenticate(others[0])
+        response = self.client.post(f'/api/tubonge-posts/{self.post.pk}/like/')
+        self.assertEqual(response.data, {'liked': False, 'like_count': 2})
+        self.assertCountersMatch(self.post)
+
+    def test_like_missing_post(self):
+        response = self.client.post('/api/tubonge-posts/999999/like/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_m2m_writes(self):
+        bob = self.make_user('bob')
+        self.post.likes.add(self.user, bob)
+        self.assertCountersMatch(self.post)
+        self.post.likes.add(bob)
+        self.assertCountersMatch(self.post)
+        self.post.likes.remove(bob)
+        self.assertCountersMatch(self.post)
+        self.user.liked_posts.clear()
+        self.assertCountersMatch(self.post)
+
+    def test_comments(self):
+        response = self.client.post(f'/api/tubonge-posts/{self.post.pk}/comment/', {'text': 'hi'})
+        self.assertEqual(response.status_code, 201)
+        self.assertCountersMatch(self.post)
+        PostComment.objects.get(pk=response.data['id']).delete()
+        self.assertCountersMatch(self.post)
+
+    def test_reconcile_repairs_drift(self):
+        self.post.likes.add(self.user)
+        TubongePost.objects.filter(pk=self.post.pk).update(like_count=7, comments_count=3)
+        self.assertEqual(reconcile_post_counters(), 1)
+        self.assertCountersMatch(self.post)
+        self.assertEqual(reconcile_post_counters(), 0)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'The single-statement toggle only runs on PostgreSQL')
+class ConcurrentLikeTests(TransactionTestCase):
+    """A double tap reports the like that exists, whichever statement won"""
+
+    def test_losing_tap_reports_like(self):
+        user = User.objects.create_user(username='alice', email='alice@example.com', password=None)
+        post = TubongePost.objects.create(author=user, text='hello')
+        results = []
+
+        def tap():
+            try:
+                results.append(toggle_like(post.pk, user.pk))
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            self.assertEqual(toggle_like(post.pk, user.pk), (True, 1))
+            loser = threading.Thread(target=tap)
+            loser.start()
+            # Commit only once the second insert is waiting on this one's row.
+            with connection.cursor() as cursor:
+                for _ in range(100):
+                    cursor.execute('SELECT COUNT(*) FROM pg_locks WHERE NOT granted')
+                    if cursor.fetchone()[0]:
+                        break
+                    time.sleep(0.05)
+        loser.join()
+        self.assertEqual(results, [(True, 1)])
+        self.assertEqual(LikeThrough.objects.filter(tubongepost=post).count(), 1)
+
+
+class FeedPaginationTests(ApiTestCase):
+    """Cursor pages neither repeat nor skip posts that share a created_at"""
+
+    def setUp(self):
+        super().setUp()
+        posts = [TubongePost.objects.create(author=self.user, text=f'post {i}') for i in range(5)]
+        TubongePost.objects.filter(pk__in=[post.pk for post in posts]).update(created_at=timezone.now())
+        self.ids = sorted((post.pk for post in posts), reverse=True)
+
+    def walk(self, url, link='next'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([post['id'] for post in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_equal_created_at(self):
+        for view in ['full', 'lean']:
+            with self.subTest(view=view):
+                pages = self.walk(f'/api/tubonge-posts/?view={view}&page_size=2')
+                self.assertEqual(pages, [self.ids[0:2], self.ids[2:4], self.ids[4:]])
+
+    def test_previous_links(self):
+        response = self.client.get('/api/tubonge-posts/?view=lean&page_size=2')
+        response = self.client.get(response.data['next'])
+        response = self.client.get(response.data['next'])
+        pages = self.walk(response.data['previous'], link='previous')
+        self.assertEqual(pages, [self.ids[2:4], self.ids[0:2]])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/tubonge-posts/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_lean_feed_per_post_fields(self):
+        TubongePost.objects.get(pk=self.ids[1]).likes.add(self.user)
+        PostComment.objects.create(post_id=self.ids[1], author=self.user, text='first')
+        response = self.client.get('/api/tubonge-posts/?view=lean&page_size=2')
+        liked = {post['id']: post['liked_by_me'] for post in response.data['results']}
+        self.assertEqual(liked, {self.ids[0]: False, self.ids[1]: True})
+        post = response.data['results'][1]
+        self.assertEqual((post['like_count'], post['comments_count']), (1, 1))
+        self.assertEqual([comment['text'] for comment in post['comments']], ['first'])
+
+
+class ResumableUploadTests(ApiTestCase):
+    """Chunks land at the committed offset whatever an earlier attempt left on disk"""
+
+    DATA = bytes(range(256)) * 40
+
+    def setUp(self):
+        super().setUp()
+        scratch = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, scratch)
+        settings = override_settings(RESUMABLE_UPLOAD_DIR=f'{scratch}/parts', MEDIA_ROOT=f'{scratch}/media')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        response = self.client.post('/api/uploads/', {'filename': 'cv.pdf', 'size': len(self.DATA)})
+        self.assertEqual(response.status_code, 201)
+        self.url = f'/api/uploads/{response.data["id"]}/'
+        self.upload = Upload.objects.get(pk=response.data['id'])
+
+    def put(self, start, end, body=None):
+        return self.client.put(
+            self.url, self.DATA[start:end + 1] if body is None else body,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.DATA)}',
+        )
+
+    def finalize(self):
+        return self.client.post(f'{self.url}finalize/', {'sha256': hashlib.sha256(self.DATA).hexdigest()})
+
+    def test_resume_after_failed_save(self):
+        self.assertEqual(self.put(0, 4095).data['offset'], 4096)
+        # The chunk reaches disk but its offset is never committed.
+        with mock.patch.object(Upload, 'save', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.put(4096, 8191)
+        self.assertEqual(self.client.get(self.url).data['offset'], 4096)
+        self.assertEqual(self.put(4096, 8191).data['offset'], 8192)
+        self.assertEqual(self.put(8192, len(self.DATA) - 1).status_code, 200)
+        response = self.finalize()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'complete')
+        upload = Upload.objects.get(pk=self.upload.pk)
+        with upload.file.open('rb') as fh:
+            self.assertEqual(fh.read(), self.DATA)
+
+    def test_resume_after_short_chunk(self):
+        response = self.put(0, 4095, body=self.DATA[:100])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['offset'], 0)
+        self.assertEqual(self.put(0, len(self.DATA) - 1).status_code, 200)
+        self.assertEqual(self.finalize().status_code, 200)
+
+    def test_finalize_rejects_mismatched_scratch_file(self):
+        self.put(0, len(self.DATA) - 1)
+        with open(uploads.part_path(self.upload, 0), 'r+b') as fh:
+            fh.truncate(1000)
+        response = self.finalize()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 1000)
+        self.put(1000, len(self.DATA) - 1)
+        self.assertEqual(self.finalize().status_code, 200)
+
+    def test_finalize_rejects_stray_bytes(self):
+        self.put(0, len(self.DATA) - 1)
+        with open(uploads.part_path(self.upload, 0), 'ab') as fh:
+            fh.write(b'stray')
+        response = self.finalize()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 0)
+        self.assertEqual(Upload.objects.get(pk=self.upload.pk).status, 'pending')
+
+    def test_no_transaction_while_streaming_or_storing(self):
+        outer = len(connection.atomic_blocks)
+        depths = []
+
+        class Stream:
+            def __init__(self, data):
+                self.data = io.BytesIO(data)
+
+            def read(self, size):
+                depths.append(len(connection.atomic_blocks))
+                return self.data.read(size)
+
+        range_header = f'bytes 0-{len(self.DATA) - 1}/{len(self.DATA)}'
+        uploads.write_chunk(self.upload.pk, self.user, Stream(self.DATA), range_header)
+        save = default_storage.save
+
+        def store(*args, **kwargs):
+            depths.append(len(connection.atomic_blocks))
+            return save(*args, **kwargs)
+
+        with mock.patch.object(default_storage, 'save', side_effect=store):
+            self.assertEqual(self.finalize().status_code, 200)
+        self.assertTrue(depths)
+        self.assertEqual(set(depths), {outer})
+
+    def test_concurrent_attempts_at_one_chunk(self):
+        range_header = f'bytes 0-{len(self.DATA) - 1}/{len(self.DATA)}'
+        retry = []
+
+        class SlowStream:
+            """Lets a retry of the same chunk commit while this attempt is still streaming"""
+            def __init__(self, data):
+                self.data = io.BytesIO(data)
+
+            def read(inner, size):
+                if not retry:
+                    retry.append(uploads.write_chunk(self.upload.pk, self.user, io.BytesIO(self.DATA), range_header))
+                return inner.data.read(size)
+
+        with self.assertRaises(uploads.UploadError) as raised:
+            uploads.write_chunk(self.upload.pk, self.user, SlowStream(b'x' * len(self.DATA)), range_header)
+        self.assertEqual((raised.exception.status_code, raised.exception.offset), (409, len(self.DATA)))
+        self.assertEqual(os.listdir(uploads.scratch_dir(self.upload)), ['0.part'])
+        self.assertEqual(self.finalize().status_code, 200)
+        with Upload.objects.get(pk=self.upload.pk).file.open('rb') as fh:
+            self.assertEqual(fh.read(), self.DATA)
+        self.assertFalse(os.path.exists(uploads.scratch_dir(self.upload)))
+
+
+@override_settings(MEDIA_PROCESSING_ASYNC=False, MEDIA_VARIANT_WIDTHS=[32, 64])
+class MediaProcessingTests(ApiTestCase):
+    """Stored originals lose their metadata and gain resized variants"""
+
+    GPS = {1: 'N', 2: (1.0, 17.0, 30.0), 3: 'E', 4: (36.0, 49.0, 0.0)}
+
+    def setUp(self):
+        super().setUp()
+        scratch = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, scratch)
+        settings = override_settings(MEDIA_ROOT=scratch)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def exif(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'Phone Maker'
+        exif[0x8825] = self.GPS
+        return exif.tobytes()
+
+    def encode(self, frames, fmt, **options):
+        buffer = io.BytesIO()
+        frames[0].save(buffer, fmt, save_all=len(frames) > 1, append_images=frames[1:], **options)
+        return buffer.getvalue()
+
+    def publish(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/tubonge-posts/', {'media_file': SimpleUploadedFile(name, content)}, format='multipart'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['media_status'], 'processing')
+        post = TubongePost.objects.get(pk=response.data['id'])
+        self.assertEqual((post.media_status, post.media_type), ('ready', 'image'))
+        return post
+
+    def stored(self, post):
+        with post.media_file.open('rb') as fh:
+            return fh.read()
+
+    def test_jpeg_gps_removed_and_variants_rendered(self):
+        content = self.encode([Image.new('RGB', (120, 80), 'red')], 'JPEG', exif=self.exif())
+        self.assertEqual(Image.open(io.BytesIO(content)).getexif().get_ifd(0x8825), self.GPS)
+        post = self.publish('holiday.jpg', content)
+        with Image.open(io.BytesIO(self.stored(post))) as original:
+            self.assertEqual((original.format, original.size), ('JPEG', (120, 80)))
+            self.assertEqual(dict(original.getexif()), {})
+            self.assertNotIn('exif', original.info)
+        self.assertEqual(set(post.media_variants), {'webp', 'jpeg'})
+        self.assertEqual(set(post.media_variants['jpeg']), {'32', '64'})
+        response = self.client.get(f'/api/tubonge-posts/{post.pk}/')
+        srcset = response.data['media_srcset']
+        self.assertEqual(set(srcset), {'webp', 'jpeg'})
+        self.assertTrue(srcset['webp']['64'].startswith('http://testserver/'))
+        for name in post.media_variants['webp'].values():
+            with default_storage.open(name) as fh, Image.open(fh) as variant:
+                self.assertEqual(variant.format, 'WEBP')
+                self.assertNotIn('exif', variant.info)
+
+    def test_animated_gif_keeps_frames_drops_comment(self):
+        frames = [Image.new('RGB', (40, 40), color) for color in ('red', 'green', 'blue')]
+        post = self.publish('wave.gif', self.encode(frames, 'GIF', comment=b'taken at home', duration=80, loop=0))
+        content = self.stored(post)
+        self.assertNotIn(b'taken at home', content)
+        with Image.open(io.BytesIO(content)) as original:
+            self.assertEqual((original.format, original.n_frames), ('GIF', 3))
+
+    def test_webp_exif_and_xmp_removed(self):
+        for frames in ([Image.new('RGB', (40, 40), 'blue')], [Image.new('RGB', (40, 40), c) for c in ('red', 'blue')]):
+            with self.subTest(frames=len(frames)):
+                # The type is sniffed from the contents, whatever the name says.
+                post = self.publish('clip.jpg', self.encode(frames, 'WEBP', exif=self.exif(), xmp=b'<gps/>'))
+                with Image.open(io.BytesIO(self.stored(post))) as original:
+                    self.assertEqual((original.format, getattr(original, 'n_frames', 1)), ('WEBP', len(frames)))
+                    self.assertFalse({'exif', 'xmp'} & set(original.info))
+
+    def test_other_formats_stored_as_png(self):
+        image = Image.new('RGB', (40, 40), 'green')
+        post = self.publish('scan.jpg', self.encode([image], 'TIFF', exif=self.exif()))
+        self.assertTrue(post.media_file.name.endswith('.png'))
+        with Image.open(io.BytesIO(self.stored(post))) as original:
+            self.assertEqual(original.format, 'PNG')
+            self.assertEqual(dict(original.getexif()), {})
+
+    @skipUnless(shutil.which('ffmpeg'), 'Remuxing videos needs ffmpeg')
+    def test_video_metadata_removed(self):
+        source = os.path.join(tempfile.mkdtemp(), 'clip.mp4')
+        self.addCleanup(shutil.rmtree, os.path.dirname(source))
+        subprocess.run(
+            ['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=64x48:duration=2', '-pix_fmt', 'yuv420p',
+             '-metadata', 'location=+01.2917+036.8167/', '-metadata', 'make=Phone Maker', source],
+            check=True,
+        )
+        with open(source, 'rb') as fh:
+            content = fh.read()
+        self.assertIn(b'Phone Maker', content)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/tubonge-posts/', {'media_file': SimpleUploadedFile('clip.mp4', content)}, format='multipart'
+            )
+        post = TubongePost.objects.get(pk=response.data['id'])
+        self.assertEqual((post.media_status, post.media_type), ('ready', 'video'))
+        stored = self.stored(post)
+        self.assertNotIn(b'Phone Maker', stored)
+        self.assertNotIn(b'+036.8167', stored)
+        self.assertIn('poster', post.media_variants)
+
+
+class InboxTests(ApiTestCase):
+    """The inbox merges both sides of the pair and tracks unread counts per side"""
+
+    def setUp(self):
+        # A lower id than alice, so alice is the high side of that conversation.
+        self.early = self.make_user('early')
+        super().setUp()
+        self.bob = self.make_user('bob')
+        self.carol = self.make_user('carol')
+
+    def send(self, sender, recipient, text='hi'):
+        return Message.objects.create(sender=sender, recipient=recipient, text=text)
+
+    def inbox(self, user, page_size=20):
+        self.client.force_authenticate(user)
+        rows, url = [], f'/api/messages/conversations/?page_size={page_size}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            rows.extend(response.data['results'])
+            url = response.data['next']
+        return rows
+
+    def test_both_sides_merged_newest_first(self):
+        for other in [self.bob, self.early, self.user, self.carol, self.early]:
+            self.send(self.user, other)
+        expected = [self.early.pk, self.carol.pk, self.user.pk, self.bob.pk]
+        for page_size in [1, 2, 20]:
+            with self.subTest(page_size=page_size):
+                rows = self.inbox(self.user, page_size)
+                self.assertEqual([row['user']['id'] for row in rows], expected)
+
+    def test_previous_link_walks_back_across_sides(self):
+        for other in [self.bob, self.early, self.carol]:
+            self.send(self.user, other)
+        response = self.client.get('/api/messages/conversations/?page_size=1')
+        response = self.client.get(response.data['next'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'][0]['user']['id'], self.bob.pk)
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(response.data['results'][0]['user']['id'], self.early.pk)
+
+    def test_unread_count_after_with_user(self):
+        self.send(self.bob, self.user, 'one')
+        last = self.send(self.bob, self.user, 'two')
+        self.send(self.early, self.user)
+        counts = {row['user']['id']: row['unread_count'] for row in self.inbox(self.user)}
+        self.assertEqual(counts, {self.bob.pk: 2, self.early.pk: 1})
+
+        response = self.client.get(f'/api/messages/with_user/?user_id={self.bob.pk}')
+        self.assertEqual([message['is_read'] for message in response.data['results']], [True, True])
+        counts = {row['user']['id']: row['unread_count'] for row in self.inbox(self.user)}
+        self.assertEqual(counts, {self.bob.pk: 0, self.early.pk: 1})
+
+        [row] = self.inbox(self.bob)
+        self.assertEqual(row['unread_count'], 0)
+        self.assertEqual(row['last_message']['id'], last.pk)
+        self.assertTrue(row['last_message']['is_read'])
+        conversation = Conversation.objects.get(user_low=self.user, user_high=self.bob)
+        self.assertEqual(conversation.low_last_read_message_id, last.pk)
+
+    def test_thread_windows(self):
+        ids = []
+        for n in range(7):
+            sender, recipient = (self.user, self.bob) if n % 2 else (self.bob, self.user)
+            ids.append(self.send(sender, recipient, f'message {n}').pk)
+            self.send(self.user, self.carol)
+
+        def window(query):
+            response = self.client.get(f'/api/messages/with_user/?user_id={self.bob.pk}&limit=3{query}')
+            self.assertEqual(response.status_code, 200)
+            return [message['id'] for message in response.data['results']], response.data['has_more']
+
+        self.assertEqual(window(''), (ids[4:], True))
+        self.assertEqual(window(f'&before_id={ids[4]}'), (ids[1:4], True))
+        self.assertEqual(window(f'&before_id={ids[1]}'), (ids[:1], False))
+        self.assertEqual(window(f'&since_id={ids[1]}'), (ids[2:5], True))
+        self.assertEqual(window(f'&since_id={ids[3]}'), (ids[4:], False))
+        self.assertEqual(window(f'&since_id={ids[-1]}'), ([], False))
+        self.assertEqual(window(f'&since_id={ids[0]}&before_id={ids[3]}'), (ids[1:3], False))
+        response = self.client.get(f'/api/messages/with_user/?user_id={self.bob.pk}&before_id=latest')
+        self.assertEqual(response.status_code, 400)
+
+    def test_new_message_after_read(self):
+        self.send(self.bob, self.user)
+        self.client.get(f'/api/messages/with_user/?user_id={self.bob.pk}')
+        self.send(self.bob, self.user)
+        [row] = self.inbox(self.user)
+        self.assertEqual(row['unread_count'], 1)
+        self.assertFalse(row['last_message']['is_read'])
+
+
+class ChatSocketTests(ApiClientMixin, APITransactionTestCase):
+    """
+    Chat sockets authenticate by token and deliver only to the two participants.
+
+    Consumers close a connection left inside a transaction before touching
+    the database, so these tests run in autocommit, where on_commit
+    callbacks fire straight away.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.bob = self.make_user('bob')
+        self.carol = self.make_user('carol')
+
+    async def connect(self, user=None, token=None):
+        if token is None:
+            token = await sync_to_async(lambda: str(AccessToken.for_user(user)))()
+        socket = WebsocketCommunicator(
+            application, f'/ws/chat/?token={token}', headers=[(b'origin', b'http://testserver')]
+        )
+        connected, _ = await socket.connect()
+        return socket if connected else None
+
+    def send(self, sender, recipient, text):
+        self.client.force_authenticate(sender)
+        response = self.client.post('/api/messages/', {'recipient': recipient.pk, 'text': text}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    async def test_token_auth(self):
+        socket = await self.connect(self.user)
+        self.assertIsNotNone(socket)
+        await socket.disconnect()
+        for token in ['not-a-token', '']:
+            with self.subTest(token=token):
+                self.assertIsNone(await self.connect(token=token))
+
+    async def test_message_fans_out_to_both_participants(self):
+        alice, bob, carol = [await self.connect(user) for user in (self.user, self.bob, self.carol)]
+        await sync_to_async(self.send)(self.user, self.bob, 'hello bob')
+        for socket in (alice, bob):
+            event = await socket.receive_json_from()
+            self.assertEqual(event['type'], 'message')
+            self.assertEqual(event['message']['text'], 'hello bob')
+        self.assertTrue(await carol.receive_nothing())
+        for socket in (alice, bob, carol):
+            await socket.disconnect()
+
+    async def test_non_participants_rejected(self):
+        await sync_to_async(self.send)(self.user, self.bob, 'hello bob')
+        alice, bob, carol = [await self.connect(user) for user in (self.user, self.bob, self.carol)]
+        for event_type in ('typing', 'read'):
+            with self.subTest(event_type=event_type):
+                await carol.send_json_to({'type': event_type, 'user': self.user.pk})
+                self.assertEqual(
+                    await carol.receive_json_from(), {'type': 'error', 'error': 'No conversation with that user'}
+                )
+                self.assertTrue(await alice.receive_nothing())
+        await bob.send_json_to({'type': 'typing', 'user': self.user.pk})
+        self.assertEqual(await alice.receive_json_from(), {'type': 'typing', 'user': self.bob.pk})
+        for socket in (alice, bob, carol):
+            await socket.disconnect()
+
+
+class ActivityStreamTests(ApiClientMixin, APITransactionTestCase):
+    """The badge stream snapshots counts, pushes changes and replays what a client missed"""
+
+    def setUp(self):
+        super().setUp()
+        self.bob = self.make_user('bob', user_type='pwd')
+        self.gig = Gig.objects.create(
+            client=self.user, title='Transcribe a talk', description='d', price=Decimal('100'),
+            timeframe='1 week', requirements='r',
+        )
+        self.service = Service.objects.create(
+            client=self.user, title='Sign interpreting', description='d', price=Decimal('80'),
+            duration='1 hour', requirements='r',
+        )
+
+    async def open(self, query='', headers=()):
+        token = await sync_to_async(lambda: str(AccessToken.for_user(self.user)))()
+        stream = ApplicationCommunicator(application, {
+            'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': '/api/events/', 'raw_path': b'/api/events/', 'query_string': query.encode(),
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode()), *headers],
+        })
+        await stream.send_input({'type': 'http.request', 'body': b''})
+        return stream
+
+    async def open_stream(self, headers=()):
+        stream = await self.open(headers=headers)
+        self.assertEqual((await stream.receive_output(2))['status'], 200)
+        return stream
+
+    async def events(self, stream):
+        """The `(id, name, data)` events in the next body chunk of an SSE stream"""
+        body = (await stream.receive_output(2))['body'].decode()
+        events = []
+        for block in body.split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line)
+            if 'event' in fields:
+                events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+        return events
+
+    async def response(self, stream):
+        self.assertEqual((await stream.receive_output(2))['status'], 200)
+        return json.loads((await stream.receive_output(2))['body'])
+
+    async def poll(self, query):
+        return await self.response(await self.open(f'mode=poll&{query}'))
+
+    async def close(self, stream):
+        await stream.send_input({'type': 'http.disconnect'})
+        await stream.wait(1)
+
+    def write(self, *kinds):
+        self.client.force_authenticate(self.bob)
+        for kind in kinds:
+            if kind == 'message':
+                response = self.client.post('/api/messages/', {'recipient': self.user.pk, 'text': 'hi'}, format='json')
+            elif kind == 'bid':
+                response = self.client.post(
+                    f'/api/gigs/{self.gig.pk}/bid/', {'gig': self.gig.pk, 'amount': '90', 'proposal': 'p'}
+                )
+            else:
+                response = self.client.post(
+                    f'/api/services/{self.service.pk}/book/', {'service': self.service.pk, 'proposal': 'p'}
+                )
+            self.assertEqual(response.status_code, 201)
+
+    async def test_requires_authentication(self):
+        stream = ApplicationCommunicator(application, {
+            'type': 'http', 'method': 'GET', 'path': '/api/events/', 'query_string': b'', 'headers': [],
+        })
+        await stream.send_input({'type': 'http.request', 'body': b''})
+        self.assertEqual((await stream.receive_output(2))['status'], 401)
+
+    async def test_snapshot_then_counter_events(self):
+        await sync_to_async(self.write)('message', 'message', 'bid', 'booking')
+        stream = await self.open_stream()
+        [(last_id, name, counts)] = await self.events(stream)
+        self.assertEqual(name, 'snapshot')
+        self.assertEqual(counts, {
+            'unread': {str(self.bob.pk): 2},
+            'bids': {str(self.gig.pk): 1},
+            'bookings': {str(self.service.pk): 1},
+        })
+        await sync_to_async(self.write)('bid')
+        self.assertEqual(await self.events(stream), [
+            (last_id + 1, 'counter', {'counter': 'bids', 'key': self.gig.pk, 'delta': 1, 'id': last_id + 1}),
+        ])
+        await self.close(stream)
+
+    async def test_reconnect_replays_missed_events(self):
+        stream = await self.open_stream()
+        [(last_id, _, _)] = await self.events(stream)
+        await self.close(stream)
+        await sync_to_async(self.write)('message', 'booking')
+
+        stream = await self.open_stream(headers=[(b'last-event-id', str(last_id).encode())])
+        events = await self.events(stream)
+        self.assertEqual([(event_id, name) for event_id, name, _ in events], [
+            (last_id + 1, 'counter'), (last_id + 2, 'counter'),
+        ])
+        self.assertEqual([data['counter'] for _, _, data in events], ['unread', 'bookings'])
+        # Live events carry on from the replayed ones.
+        await sync_to_async(self.write)('message')
+        self.assertEqual([event_id for event_id, _, _ in await self.events(stream)], [last_id + 3])
+        await self.close(stream)
+
+        with self.settings(ACTIVITY_REPLAY_SIZE=2):
+            stream = await self.open_stream(headers=[(b'last-event-id', str(last_id).encode())])
+            [(event_id, name, counts)] = await self.events(stream)
+            self.assertEqual((event_id, name), (last_id + 3, 'snapshot'))
+            self.assertEqual(counts['unread'], {str(self.bob.pk): 2})
+            await self.close(stream)
+
+    async def test_long_poll_since(self):
+        first = await self.poll('snapshot=1')
+        self.assertEqual(first['events'], [])
+        self.assertEqual(first['snapshot'], {'unread': {}, 'bids': {}, 'bookings': {}})
+        since = first['last_event_id']
+
+        # Events between two polls are answered straight away.
+        await sync_to_async(self.write)('message', 'bid')
+        caught_up = await self.poll(f'since={since}')
+        self.assertEqual([event['counter'] for event in caught_up['events']], ['unread', 'bids'])
+        self.assertEqual(caught_up['last_event_id'], since + 2)
+        self.assertNotIn('snapshot', caught_up)
+
+        stream = await self.open(f'mode=poll&since={since + 2}')
+        self.assertTrue(await stream.receive_nothing(0.1))
+        await sync_to_async(self.write)('booking')
+        waited = await self.response(stream)
+        self.assertEqual(waited['last_event_id'], since + 3)
+        self.assertEqual([event['id'] for event in waited['events']], [since + 3])
+
+        with self.settings(ACTIVITY_LONG_POLL_TIMEOUT=0.05):
+            self.assertEqual(await self.poll(f'since={since + 3}'), {'events': [], 'last_event_id': since + 3})
+
+
+@override_settings(VIEW_COUNT_ASYNC=False)
+class ViewCountTests(ApiTestCase):
+    """Views are deduplicated per user and applied in aggregated UPDATEs"""
+
+    def setUp(self):
+        super().setUp()
+        self.buffer = viewcounts.ViewBuffer()
+        patcher = mock.patch.object(viewcounts, 'buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.viewers = [self.make_user(f'viewer{n}') for n in range(3)]
+        self.gigs = [
+            Gig.objects.create(
+                client=self.user, title=f'Gig {n}', description='d', price=Decimal('100'),
+                timeframe='1 week', requirements='r',
+            )
+            for n in range(3)
+        ]
+        self.service = Service.objects.create(
+            client=self.user, title='Service', description='d', price=Decimal('80'),
+            duration='1 hour', requirements='r',
+        )
+
+    def views(self, instance):
+        instance.refresh_from_db(fields=['views'])
+        return instance.views
+
+    def test_repeat_views_counted_once(self):
+        gig = self.gigs[0]
+        for viewer in [self.viewers[0], self.viewers[0], self.viewers[1], self.user]:
+            self.client.force_authenticate(viewer)
+            self.assertEqual(self.client.get(f'/api/gigs/{gig.pk}/').status_code, 200)
+        self.assertEqual(self.views(gig), 2)
+        # The dedup marks live in the cache; once they expire the view counts again.
+        caches['default'].delete(viewcounts._seen_key('gig', gig.pk, self.viewers[0].pk))
+        self.client.force_authenticate(self.viewers[0])
+        self.client.get(f'/api/gigs/{gig.pk}/')
+        self.assertEqual(self.views(gig), 3)
+
+    def test_flush_aggregates_updates(self):
+        views = [(self.gigs[0], self.viewers), (self.gigs[1], self.viewers), (self.gigs[2], self.viewers[:1]),
+                 (self.service, self.viewers[:2])]
+        for instance, viewers in views:
+            for viewer in viewers + viewers:
+                self.buffer.record('gig' if isinstance(instance, Gig) else 'service', instance.pk, viewer.pk)
+        self.assertEqual(self.buffer.pending(), 18)
+        self.assertEqual([self.views(gig) for gig in self.gigs], [0, 0, 0])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.buffer.flush(), 9)
+        updates = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('UPDATE') and '"views"' in query['sql'].split('WHERE')[0]
+        ]
+        # One statement per model and increment size, never one per view.
+        self.assertEqual(len(updates), 3)
+        self.assertEqual([self.views(gig) for gig in self.gigs], [3, 3, 1])
+        self.assertEqual(self.views(self.service), 2)
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_counts_survive_flush(self):
+        gig = self.gigs[0]
+        for viewer in self.viewers:
+            self.buffer.record('gig', gig.pk, viewer.pk)
+        self.buffer.flush()
+        self.client.force_authenticate(self.viewers[0])
+        self.assertEqual(self.client.get(f'/api/gigs/{gig.pk}/').data['views'], 3)
+        self.buffer.record('gig', gig.pk, self.viewers[0].pk)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.views(gig), 3)
+
+
+class OwnerListingTests(ApiTestCase):
+    """`mine` pages the owner's listings in the list ordering, with live bid and booking counts"""
+
+    def setUp(self):
+        super().setUp()
+        self.other = self.make_user('other', user_type='client')
+        self.pwd = self.make_user('pwd', user_type='pwd')
+        self.gigs = [self.make_gig(self.user, price, views) for price, views in [(300, 5), (100, 9), (200, 9), (100, 1)]]
+        self.make_gig(self.other, 50, 50)
+
+    def make_gig(self, client, price, views=0):
+        return Gig.objects.create(
+            client=client, title=f'gig {price}', description='d', price=price,
+            timeframe='1 week', requirements='r', views=views,
+        )
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(gig['id'] for gig in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_mine_follows_ordering(self):
+        by_price = sorted(self.gigs, key=lambda gig: (gig.price, gig.pk))
+        by_views = sorted(self.gigs, key=lambda gig: (gig.views, gig.pk), reverse=True)
+        cases = {
+            '': [gig.pk for gig in reversed(self.gigs)],
+            'price': [gig.pk for gig in by_price],
+            '-price': [gig.pk for gig in reversed(by_price)],
+            '-views': [gig.pk for gig in by_views],
+            'created_at': [gig.pk for gig in self.gigs],
+        }
+        for ordering, expected in cases.items():
+            with self.subTest(ordering=ordering):
+                self.assertEqual(self.walk(f'/api/gigs/mine/?page_size=1&ordering={ordering}'), expected)
+                self.assertEqual(self.walk(f'/api/gigs/mine/?page_size=3&ordering={ordering}'), expected)
+
+    def test_mine_rejects_unknown_ordering(self):
+        response = self.client.get('/api/gigs/mine/?ordering=title')
+        self.assertEqual(response.status_code, 400)
+
+    def test_bid_counts(self):
+        gig = self.gigs[0]
+        self.client.force_authenticate(self.pwd)
+        for amount in [10, 20]:
+            response = self.client.post(f'/api/gigs/{gig.pk}/bid/', {'gig': gig.pk, 'amount': amount, 'proposal': 'p'})
+            self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(self.user)
+        counts = {row['id']: row['bid_count'] for row in self.client.get('/api/gigs/mine/').data['results']}
+        self.assertEqual(counts, {self.gigs[0].pk: 2, self.gigs[1].pk: 0, self.gigs[2].pk: 0, self.gigs[3].pk: 0})
+        Bid.objects.filter(gig=gig).first().delete()
+        response = self.client.get('/api/gigs/?fields=id,bid_count')
+        self.assertEqual({row['id']: row['bid_count'] for row in response.data['results']}[gig.pk], 1)
+
+    def test_booking_counts(self):
+        service = Service.objects.create(
+            client=self.user, title='s', description='d', price=10, duration='1h', requirements='r'
+        )
+        Service.objects.create(client=self.other, title='t', description='d', price=10, duration='1h', requirements='r')
+        self.client.force_authenticate(self.pwd)
+        response = self.client.post(f'/api/services/{service.pk}/book/', {'service': service.pk, 'proposal': 'p'})
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(self.user)
+        rows = self.client.get('/api/services/mine/').data['results']
+        self.assertEqual([(row['id'], row['booking_count']) for row in rows], [(service.pk, 1)])
+        self.assertEqual(Booking.objects.filter(service=service).count(), 1)
+
+
+@override_settings(RECOMMEND_SYNC_INTERVAL=0)
+class RecommendationTests(ApiTestCase):
+    """Recommendations fill the page past excluded candidates and see unsignalled writes"""
+
+    def setUp(self):
+        super().setUp()
+        for kind in recommend.MODELS:
+            recommend._indexes[kind] = recommend.ListingIndex()
+        self.user.skills = ['Python']
+        self.user.save()
+        self.other = self.make_user('other', user_type='client')
+
+    def make_gig(self, client, title, description='d'):
+        return Gig.objects.create(
+            client=client, title=title, description=description, price=10,
+            timeframe='1 week', requirements='r',
+        )
+
+    def recommended(self, limit):
+        response = self.client.get(f'/api/gigs/recommended/?limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_fills_limit_past_own_listings(self):
+        # The user's own gigs outrank everything else but are never recommended.
+        for i in range(20):
+            self.make_gig(self.user, f'python python {i}')
+        others = [self.make_gig(self.other, f'gig {i}', 'python') for i in range(3)]
+        others = {gig.pk for gig in others}
+        page = self.recommended(2)
+        self.assertEqual(len(page), 2)
+        self.assertLessEqual(set(page), others)
+        self.assertEqual(set(self.recommended(5)), others)
+
+    def test_ranks_title_matches_first(self):
+        weak = self.make_gig(self.other, 'gardening', 'python')
+        strong = self.make_gig(self.other, 'python developer')
+        self.make_gig(self.other, 'plumbing')
+        self.assertEqual(self.recommended(10), [strong.pk, weak.pk])
+
+    def test_top_matches_dense_scoring(self):
+        words = ['python', 'django', 'excel', 'braille', 'audio', 'design']
+        index = recommend.ListingIndex()
+        index.load(
+            (pk, {'title': ' '.join(words[pk % 6:pk % 6 + 2]), 'description': ' '.join(words[:pk % 4]),
+                  'requirements': words[pk % 5]})
+            for pk in range(1, 60)
+        )
+        for pk in range(1, 60, 7):
+            index.remove(pk)
+        index.upsert(8, {'title': 'python python', 'description': 'excel', 'requirements': ''})
+        terms = ['python', 'excel', 'unknown']
+
+        # Reference: accumulate over every slot, as a dense scan would.
+        live = len(index)
+        dense = np.zeros(index.size)
+        for term in terms:
+            if term in index.postings and index.doc_freq[term] > 0:
+                idf = math.log(1 + (live - index.doc_freq[term] + 0.5) / (index.doc_freq[term] + 0.5))
+                slots, weights = index.postings[term].arrays()
+                dense[slots] += idf * weights
+        dense[~index.active[:index.size]] = 0
+        expected = {int(index.ids[slot]): dense[slot] for slot in np.flatnonzero(dense)}
+
+        ranked = index.top(terms, len(expected) + 5)
+        self.assertEqual({pk for pk, _ in ranked}, set(expected))
+        for pk, score in ranked:
+            self.assertAlmostEqual(score, expected[pk], places=4)
+        self.assertEqual([score for _, score in ranked], sorted((score for _, score in ranked), reverse=True))
+        self.assertEqual(index.top(terms, 3), ranked[:3])
+        self.assertEqual(index.top(['unknown'], 3), [])
+
+    def test_sync_picks_up_unsignalled_writes(self):
+        gig = self.make_gig(self.other, 'plumbing')
+        self.assertEqual(self.recommended(10), [])
+        Gig.objects.filter(pk=gig.pk).update(title='python', updated_at=timezone.now())
+        self.assertEqual(self.recommended(10), [gig.pk])
+        Gig.objects.filter(pk=gig.pk).update(status='closed', updated_at=timezone.now())
+        self.assertEqual(self.recommended(10), [])
+
+
+class SearchTests(ApiTestCase):
+    """Full-text search ranks hits, pages through ties and backs the admin search box"""
+
+    def post(self, text, author=None):
+        return TubongePost.objects.create(author=author or self.user, text=text)
+
+    def search(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(hit['id'] for hit in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_denser_match_ranks_first(self):
+        once = self.post('Looking for a python tutor to help with spreadsheets and email every week')
+        often = self.post('python python python')
+        self.post('Nothing to see here')
+        self.assertEqual(self.search('/api/search/?q=python'), [often.pk, once.pk])
+
+    def test_pages_through_equal_ranks(self):
+        posts = [self.post('Sign language interpreter available') for _ in range(5)]
+        self.post('Unrelated post')
+        expected = sorted((post.pk for post in posts), reverse=True)
+        for page_size in [1, 2, 5]:
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.search(f'/api/search/?q=interpreter&page_size={page_size}'), expected)
+
+    def test_missing_terms(self):
+        response = self.client.get('/api/search/?q=%20!')
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_matches_fields_or_text(self):
+        bob = self.make_user('bob')
+        by_author = self.post('Morning walk', author=bob)
+        by_text = self.post('Bob Marley covers tonight')
+        self.post('Something else')
+        model_admin = admin.site._registry[TubongePost]
+        request = RequestFactory().get('/admin/api/tubongepost/', {'q': 'bob'})
+        request.user = User.objects.create_superuser('root', 'root@example.com', 'pw')
+        queryset, _ = model_admin.get_search_results(request, TubongePost.objects.all(), 'bob')
+        self.assertEqual(set(queryset.values_list('pk', flat=True)), {by_author.pk, by_text.pk})
+
+
+class MarketplaceTests(ApiTestCase):
+    """Open gigs and services come back as one compact stream, newest first"""
+
+    def setUp(self):
+        super().setUp()
+        self.listings = []
+        now = timezone.now()
+        for n in range(7):
+            model, term = (Gig, {'timeframe': '1 week'}) if n % 2 else (Service, {'duration': '1 hour'})
+            listing = model.objects.create(
+                client=self.user, title=f'{model.__name__} {n}', description='d' * 300, requirements='r' * 300,
+                price=Decimal('100.50'), **term,
+            )
+            self.listings.append(listing)
+        # Two rows share a timestamp across kinds, and one more within a kind.
+        stamps = [now - timedelta(minutes=n // 2) for n in range(7)]
+        for listing, stamp in zip(self.listings, stamps):
+            type(listing).objects.filter(pk=listing.pk).update(created_at=stamp)
+        Gig.objects.create(
+            client=self.user, title='Closed', description='d', requirements='r', price=1,
+            timeframe='1 week', status='closed',
+        )
+
+    def walk(self, url):
+        rows = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            rows.extend(response.data['results'])
+            url = response.data['next']
+        return rows
+
+    def expected(self, kinds=('gig', 'service')):
+        keyed = []
+        for listing in self.listings:
+            listing.refresh_from_db()
+            kind = 'gig' if isinstance(listing, Gig) else 'service'
+            if kind in kinds:
+                keyed.append(((listing.created_at, kind, listing.pk), (kind, listing.pk)))
+        return [key for _, key in sorted(keyed, reverse=True)]
+
+    def test_merged_newest_first_across_pages(self):
+        for page_size in [1, 2, 3, 20]:
+            with self.subTest(page_size=page_size):
+                rows = self.walk(f'/api/marketplace/?page_size={page_size}')
+                self.assertEqual([(row['type'], row['id']) for row in rows], self.expected())
+
+    def test_type_filter(self):
+        rows = self.walk('/api/marketplace/?type=gig&page_size=2')
+        self.assertEqual([(row['type'], row['id']) for row in rows], self.expected(['gig']))
+        self.assertEqual(self.client.get('/api/marketplace/?type=job').status_code, 400)
+
+    def test_compact_shape(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/marketplace/?page_size=2')
+        row = response.data['results'][0]
+        self.assertEqual(set(row), {
+            'type', 'id', 'title', 'price', 'client_id', 'client_name', 'created_at', 'summary', 'requirements',
+            'timeframe' if row['type'] == 'gig' else 'duration',
+        })
+        self.assertEqual(row['price'], '100.50')
+        self.assertEqual(row['client_name'], 'alice')
+        for field, letter in [('summary', 'd'), ('requirements', 'r')]:
+            self.assertEqual(row[field], letter * SNIPPET_LENGTH + '...')
+
+
+class ListingFilterTests(ApiTestCase):
+    """Listing filters and facets, and the actions that must ignore them"""
+
+    def setUp(self):
+        super().setUp()
+        self.pwd = self.make_user('pwd', user_type='pwd')
+        now = timezone.now()
+        self.gigs = {}
+        for name, price, status, age in [
+            ('cheap', 500, 'open', 1), ('mid', 3000, 'open', 10),
+            ('dear', 20000, 'open', 40), ('closed', 3000, 'closed', 5),
+        ]:
+            gig = Gig.objects.create(
+                client=self.user, title=name, description='d', price=price,
+                timeframe='1 week', requirements='r', status=status,
+            )
+            Gig.objects.filter(pk=gig.pk).update(created_at=now - timedelta(days=age))
+            self.gigs[name] = gig.pk
+
+    def titles(self, query):
+        response = self.client.get(f'/api/gigs/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [gig['title'] for gig in response.data['results']]
+
+    def test_filters(self):
+        after = (timezone.now() - timedelta(days=20)).isoformat().replace('+', '%2B')
+        cases = {
+            '': ['cheap', 'closed', 'mid', 'dear'],
+            'status=open': ['cheap', 'mid', 'dear'],
+            'status=closed': ['closed'],
+            'min_price=1000&max_price=5000': ['closed', 'mid'],
+            'status=open&min_price=1000': ['mid', 'dear'],
+            f'created_after={after}': ['cheap', 'closed', 'mid'],
+            f'created_before={after}': ['dear'],
+            # mid and closed share a price and fall back to id order.
+            'ordering=price': ['cheap', 'mid', 'closed', 'dear'],
+            'ordering=-price&status=open': ['dear', 'mid', 'cheap'],
+            'ordering=created_at': ['dear', 'mid', 'closed', 'cheap'],
+            f'client={self.pwd.pk}': [],
+        }
+        for query, expected in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(self.titles(query), expected)
+
+    def test_invalid_parameters(self):
+        for query in ['min_price=abc', 'ordering=title', 'status=archived', 'min_price=10&max_price=5']:
+            for url in ['/api/gigs/', '/api/gigs/mine/', '/api/gigs/facets/', '/api/gigs/recommended/']:
+                with self.subTest(url=url, query=query):
+                    self.assertEqual(self.client.get(f'{url}?{query}').status_code, 400)
+
+    def test_other_actions_ignore_listing_parameters(self):
+        closed = self.gigs['closed']
+        response = self.client.get(f'/api/gigs/{closed}/?status=open&min_price=abc')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(f'/api/gigs/{closed}/?ordering=bogus', {'title': 'renamed'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch('/api/gigs/bulk/?status=x', [{'id': closed, 'title': 'again'}], format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/api/gigs/bulk_close/?max_price=-1', {'ids': [self.gigs['mid']]}, format='json')
+        self.assertEqual(response.data, {'closed': 1})
+        self.client.force_authenticate(self.pwd)
+        response = self.client.post(
+            f'/api/gigs/{closed}/bid/?status=open', {'gig': closed, 'amount': 5, 'proposal': 'p'}
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_facets(self):
+        response = self.client.get('/api/gigs/facets/?status=open&min_price=1000&max_price=5000')
+        self.assertEqual(response.status_code, 200)
+        # Each facet ignores its own filter.
+        self.assertEqual(response.data['status'], {'open': 1, 'closed': 1})
+        buckets = {bucket['bucket']: bucket['count'] for bucket in response.data['price']}
+        self.assertEqual(buckets, {'0-1000': 1, '1000-5000': 1, '5000-10000': 0, '10000-50000': 1, '50000+': 0})
+        response = self.client.get(f'/api/services/facets/?client={self.user.pk}')
+        self.assertEqual(response.data['status'], {'open': 0, 'closed': 0})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plans are only checked on PostgreSQL')
+class ListingPlanTests(ApiTestCase):
+    """Every supported filter and ordering combination is served by an index"""
+
+    LISTINGS = {
+        'gig': lambda: Gig.objects.select_related('client').with_bid_count(),
+        'service': lambda: Service.objects.select_related('client').with_booking_count(),
+    }
+
+    def explain(self, queryset):
+        return self.explain_sql(*queryset.query.sql_with_params())
+
+    def explain_sql(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            document = cursor.fetchone()[0]
+        if isinstance(document, str):
+            document = json.loads(document)
+        return document[0]['Plan']
+
+    def plan_nodes(self, plan):
+        yield plan
+        for child in plan.get('Plans', []):
+            yield from self.plan_nodes(child)
+
+    def test_no_sequential_scans(self):
+        now = timezone.now()
+        price = {'min_price': Decimal('500'), 'max_price': Decimal('5000')}
+        created = {'created_after': now - timedelta(days=30), 'created_before': now}
+        ranges = {'none': {}, 'price': price, 'created': created, 'price+created': {**price, **created}}
+        with connection.cursor() as cursor:
+            for model in (Gig, Service):
+                cursor.execute('ANALYZE ' + connection.ops.quote_name(model._meta.db_table))
+            # Small test tables would otherwise always be scanned; this shows
+            # whether an index can serve each query at all.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for kind, status, range_name, ordering in itertools.product(
+            self.LISTINGS, [None, 'open', 'closed'], ranges, listings.ORDERINGS
+        ):
+            with self.subTest(kind=kind, status=status, range=range_name, ordering=ordering):
+                filters = {'status': status, 'ordering': ordering, **ranges[range_name]}
+                queryset = listings.filter_listings(self.LISTINGS[kind](), filters)[:20]
+                table = queryset.model._meta.db_table
+                scans = [
+                    node['Node Type'] for node in self.plan_nodes(self.explain(queryset))
+                    if node.get('Relation Name') == table
+                ]
+                self.assertNotIn('Seq Scan', scans)
+
+    def test_cursor_pages_start_an_index_range(self):
+        for n in range(5):
+            TubongePost.objects.create(author=self.user, text=f'post {n}')
+            Gig.objects.create(
+                client=self.user, title=f'Gig {n}', description='d', price=Decimal('100'),
+                timeframe='1 week', requirements='r',
+            )
+            Message.objects.create(sender=self.user, recipient=self.make_user(f'user{n}'), text='hi')
+        pages = {
+            '/api/tubonge-posts/?view=lean&page_size=2': (TubongePost, 'created_at'),
+            '/api/gigs/mine/?page_size=2': (Gig, 'created_at'),
+            '/api/messages/conversations/?page_size=2': (Conversation, 'last_activity'),
+        }
+        with connection.cursor() as cursor:
+            for model, _ in pages.values():
+                cursor.execute('ANALYZE ' + connection.ops.quote_name(model._meta.db_table))
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for url, (model, key) in pages.items():
+            with self.subTest(url=url):
+                next_url = self.client.get(url).data['next']
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(next_url).status_code, 200)
+                table = model._meta.db_table
+                seeks = [
+                    query['sql'] for query in queries
+                    if f'FROM {connection.ops.quote_name(table)}' in query['sql'] and 'ORDER BY' in query['sql']
+                ]
+                self.assertTrue(seeks)
+                for sql in seeks:
+                    # Bitmap index scans carry the index but not the relation name.
+                    conditions = [
+                        node['Index Cond'] for node in self.plan_nodes(self.explain_sql(sql))
+                        if 'Index Cond' in node
+                    ]
+                    # The seek starts the range scan rather than filtering rows read from the top.
+                    self.assertTrue(any(key in condition for condition in conditions), conditions)
+
+
+class BulkListingTests(ApiTestCase):
+    """Bulk listing writes are all or nothing and report failing items by index"""
+
+    def setUp(self):
+        super().setUp()
+        self.other = self.make_user('bob', user_type='client')
+        self.mine = [
+            Gig.objects.create(
+                client=self.user, title=f'gig {n}', description='d', price=100,
+                timeframe='1 week', requirements='r',
+            ).pk
+            for n in range(3)
+        ]
+        self.theirs = Gig.objects.create(
+            client=self.other, title='theirs', description='d', price=100,
+            timeframe='1 week', requirements='r',
+        ).pk
+
+    def item(self, n, **fields):
+        return {
+            'title': f'new {n}', 'description': 'd', 'price': '250.00',
+            'timeframe': '2 weeks', 'requirements': 'r', **fields,
+        }
+
+    def assertFailedAt(self, response, indexes):
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], indexes)
+
+    def test_create(self):
+        response = self.client.post('/api/gigs/bulk/', [self.item(n) for n in range(3)], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([gig['title'] for gig in response.data['results']], ['new 0', 'new 1', 'new 2'])
+        self.assertEqual(Gig.objects.filter(client=self.user, title__startswith='new').count(), 3)
+
+    def test_invalid_create_writes_nothing(self):
+        items = [self.item(0), self.item(1, price='abc'), self.item(2), self.item(3, title='')]
+        response = self.client.post('/api/gigs/bulk/', items, format='json')
+        self.assertFailedAt(response, [1, 3])
+        self.assertIn('price', response.data['errors'][0]['errors'])
+        self.assertIn('title', response.data['errors'][1]['errors'])
+        self.assertFalse(Gig.objects.filter(title__startswith='new').exists())
+
+    def test_failed_write_rolls_back_the_batch(self):
+        with mock.patch('api.search.index_instances', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.client.post('/api/gigs/bulk/', [self.item(n) for n in range(3)], format='json')
+        self.assertFalse(Gig.objects.filter(title__startswith='new').exists())
+
+    def test_update(self):
+        items = [{'id': pk, 'price': '999.00'} for pk in self.mine]
+        response = self.client.patch('/api/gigs/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Gig.objects.filter(pk__in=self.mine, price=999).count(), 3)
+
+    def test_invalid_update_writes_nothing(self):
+        cases = [
+            # Another client's listing, then a repeated id and a missing one.
+            ([self.mine[0], self.theirs, self.mine[1]], [1]),
+            ([self.mine[0], self.mine[1], self.mine[0], None], [2, 3]),
+        ]
+        for ids, indexes in cases:
+            with self.subTest(ids=ids):
+                items = [{'id': pk, 'title': 'edited'} for pk in ids]
+                self.assertFailedAt(self.client.patch('/api/gigs/bulk/', items, format='json'), indexes)
+        items = [{'id': self.mine[0], 'title': 'edited'}, {'id': self.mine[1], 'price': 'abc'}]
+        self.assertFailedAt(self.client.patch('/api/gigs/bulk/', items, format='json'), [1])
+        self.assertFalse(Gig.objects.filter(title='edited').exists())
+
+    def test_close(self):
+        response = self.client.post('/api/gigs/bulk_close/', {'ids': self.mine[:2]}, format='json')
+        self.assertEqual(response.data, {'closed': 2})
+        # Already closed listings are not counted again.
+        response = self.client.post('/api/gigs/bulk_close/', {'ids': self.mine}, format='json')
+        self.assertEqual(response.data, {'closed': 1})
+
+    def test_invalid_close_writes_nothing(self):
+        response = self.client.post(
+            '/api/gigs/bulk_close/', {'ids': [self.mine[0], self.theirs, self.mine[1], 0]}, format='json'
+        )
+        self.assertFailedAt(response, [3])
+        response = self.client.post(
+            '/api/gigs/bulk_close/', {'ids': [self.mine[0], self.theirs, self.mine[1]]}, format='json'
+        )
+        self.assertFailedAt(response, [1])
+        self.assertFalse(Gig.objects.filter(status='closed').exists())
+
+    def test_batch_shape(self):
+        for url, data in [
+            ('/api/gigs/bulk/', []), ('/api/gigs/bulk/', {'title': 'x'}),
+            ('/api/gigs/bulk_close/', {'ids': []}), ('/api/gigs/bulk_close/', [1]),
+        ]:
+            with self.subTest(url=url, data=data):
+                response = self.client.post(url, data, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['errors'], [])
+        with override_settings(BULK_LISTING_MAX_ITEMS=2):
+            response = self.client.post('/api/gigs/bulk/', [self.item(n) for n in range(3)], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AnalyticsRollupTests(ApiTestCase):
+    """The upserted daily rollups agree with counting the rows they summarise"""
+
+    def setUp(self):
+        super().setUp()
+        self.bidders = [self.make_user(f'pwd{n}', user_type='pwd') for n in range(4)]
+        self.gigs = [
+            Gig.objects.create(
+                client=self.user, title=f'Gig {n}', description='d', price=Decimal('100'),
+                timeframe='1 week', requirements='r',
+            )
+            for n in range(2)
+        ]
+        self.service = Service.objects.create(
+            client=self.user, title='Service', description='d', price=Decimal('80'),
+            duration='1 hour', requirements='r',
+        )
+        for gig, bidders in [(self.gigs[0], self.bidders), (self.gigs[1], self.bidders[:2])]:
+            for bidder in bidders:
+                Bid.objects.create(gig=gig, bidder=bidder, amount=Decimal('50'), proposal='p')
+        for booker in self.bidders[:3]:
+            Booking.objects.create(service=self.service, booker=booker, proposal='p')
+        rollups.record_views({('gig', self.gigs[0].pk): 5, ('service', self.service.pk): 2})
+        Gig.objects.filter(pk=self.gigs[0].pk).update(views=5)
+        Service.objects.filter(pk=self.service.pk).update(views=2)
+
+    def recounted(self):
+        """Per listing-day counters recomputed with COUNT(*) over bids and bookings"""
+        expected = Counter()
+        for model, fk_name, kind, counter in [(Bid, 'gig', 'gig', 'bids'), (Booking, 'service', 'service', 'bookings')]:
+            rows = (
+                model.objects.order_by().annotate(date=TruncDate('created_at'))
+                .values_list(f'{fk_name}_id', 'date').annotate(n=Count('*'))
+            )
+            for object_id, date, n in rows:
+                expected[kind, object_id, date, counter] = n
+        for model, kind in [(Gig, 'gig'), (Service, 'service')]:
+            for object_id, views, created_at in model.objects.filter(views__gt=0).values_list(
+                'pk', 'views', 'created_at'
+            ):
+                expected[kind, object_id, timezone.localdate(created_at), 'views'] += views
+        return expected
+
+    def rolled_up(self):
+        stored = Counter()
+        for row in ListingDailyStats.objects.values('kind', 'object_id', 'date', *rollups.COUNTERS):
+            for counter in rollups.COUNTERS:
+                if row[counter]:
+                    stored[row['kind'], row['object_id'], row['date'], counter] = row[counter]
+        return stored
+
+    def client_totals(self):
+        return {
+            (row['client_id'], row['date']): tuple(row[counter] for counter in rollups.COUNTERS)
+            for row in ClientDailyStats.objects.values('client_id', 'date', *rollups.COUNTERS)
+        }
+
+    def assertMatchesRecount(self):
+        self.assertEqual(self.rolled_up(), self.recounted())
+        summed = Counter()
+        for (kind, object_id, date, counter), n in self.recounted().items():
+            summed[self.user.pk, date, counter] += n
+        self.assertEqual(self.client_totals(), {
+            (client_id, date): tuple(summed[client_id, date, counter] for counter in rollups.COUNTERS)
+            for client_id, date, _ in summed
+        })
+
+    def test_incremental_rollups_match_recount(self):
+        self.assertMatchesRecount()
+
+    def test_backfill_twice_is_idempotent(self):
+        # Move some history to earlier days, which the incremental rollups never saw.
+        now = timezone.now()
+        Bid.objects.filter(gig=self.gigs[0], bidder__in=self.bidders[:2]).update(created_at=now - timedelta(days=3))
+        Booking.objects.filter(booker=self.bidders[0]).update(created_at=now - timedelta(days=1))
+        Gig.objects.filter(pk=self.gigs[1].pk).update(views=4, created_at=now - timedelta(days=2))
+        self.assertNotEqual(self.rolled_up(), self.recounted())
+
+        rollups.backfill()
+        self.assertMatchesRecount()
+        first = (self.rolled_up(), self.client_totals())
+        rollups.backfill()
+        self.assertMatchesRecount()
+        self.assertEqual((self.rolled_up(), self.client_totals()), first)
+
+    def test_upsert_adds_to_existing_rows(self):
+        today = timezone.localdate()
+        events = [('gig', self.gigs[1].pk, self.user.pk, today, 'views', 1)] * 3
+        rollups.record(events)
+        rollups.record(events[:1])
+        row = ListingDailyStats.objects.get(kind='gig', object_id=self.gigs[1].pk, date=today)
+        self.assertEqual((row.views, row.bids), (4, 2))
+        self.assertEqual(ClientDailyStats.objects.get(client=self.user, date=today).views, 5 + 2 + 4)
+
+
+class CachedUserAuthenticationTests(ApiTestCase):
+    """JWT requests read their user from the process cache until the user changes"""
+
+    def setUp(self):
+        super().setUp()
+        usercache.users.clear()
+        usercache.users.reset_stats()
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def me(self):
+        return self.client.get('/api/users/me/')
+
+    def test_warm_requests_skip_the_user_query(self):
+        with CaptureQueriesContext(connection) as cold:
+            self.assertEqual(self.me().status_code, 200)
+        with CaptureQueriesContext(connection) as warm:
+            self.assertEqual(self.me().status_code, 200)
+        self.assertEqual(len(warm), len(cold) - 1)
+        self.assertEqual(usercache.users.local_hits, 1)
+
+    def test_save_evicts_the_entry(self):
+        self.me()
+        generation = usercache.users.generation
+        self.assertIsNotNone(usercache.users.get(str(self.user.pk)))
+        self.user.skills = 'Braille transcription'
+        self.user.save()
+        self.assertGreater(usercache.users.generation, generation)
+        self.assertIsNone(usercache.users.get(str(self.user.pk)))
+        self.assertEqual(self.me().data['skills'], 'Braille transcription')
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.me().status_code, 200)
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        # Rejected both when the row is read and when it comes from the cache.
+        for _ in range(2):
+            response = self.me()
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response.data['code'], 'user_inactive')
+
+    def test_deleted_user_is_rejected(self):
+        self.me()
+        self.user.delete()
+        response = self.me()
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'user_not_found')
+
+    def test_lookup_racing_an_invalidation_is_not_stored(self):
+        key = str(self.user.pk)
+        generation = usercache.users.generation
+        usercache.invalidate(self.user.pk)
+        usercache.users.put(key, self.user, generation)
+        self.assertIsNone(usercache.users.get(key))
+
+    def test_cached_copies_are_independent(self):
+        user = usercache.get_user(self.user.pk, lambda pk: User.objects.get(pk=pk))
+        user.skills = 'changed'
+        self.assertNotEqual(usercache.users.get(str(self.user.pk)).skills, 'changed')
+
+
+class UserEmailTests(ApiTestCase):
+    """Emails are unique and matched regardless of letter case"""
+
+    def signup(self, username, email):
+        return {
+            'username': username, 'email': email, 'password': 'correct-horse',
+            'password_confirm': 'correct-horse', 'user_type': 'pwd',
+        }
+
+    def test_emails_unique_ignoring_case(self):
+        self.client.force_authenticate(None)
+        response = self.client.post('/api/users/register/', self.signup('alice2', 'ALICE@Example.COM'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.data)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(username='alice3', email='Alice@example.com', password=None)
+        # Accounts without an email are left out of the constraint.
+        for username in ['admin1', 'admin2']:
+            User.objects.create_user(username=username, email='', password=None)
+
+    def test_login_by_email_in_any_case(self):
+        self.user.set_password('correct-horse')
+        self.user.save()
+        self.assertEqual(list(User.objects.by_email('ALICE@example.com')), [self.user])
+        for email, password, valid in [
+            ('Alice@EXAMPLE.com', 'correct-horse', True),
+            ('alice@example.com', 'wrong-horse', False),
+            ('bob@example.com', 'correct-horse', False),
+        ]:
+            with self.subTest(email=email, password=password):
+                serializer = LoginSerializer(data={'email': email, 'password': password})
+                self.assertEqual(serializer.is_valid(), valid)
+                if valid:
+                    self.assertEqual(serializer.validated_data['user'], self.user)
+        self.assertFalse(User.objects.by_email('').exists())
+
+    def test_racing_signup_reports_the_taken_field(self):
+        # create() without validation stands in for a signup that won the race after ours validated.
+        for data, field in [
+            (self.signup('alice2', 'ALICE@example.com'), 'email'),
+            (self.signup('alice', 'alice2@example.com'), 'username'),
+        ]:
+            with self.subTest(field=field):
+                data = dict(data)
+                with self.assertRaises(DRFValidationError) as raised:
+                    UserRegistrationSerializer().create(data)
+                self.assertEqual(list(raised.exception.detail), [field])
+
+
+class EmailMigrationTests(TransactionTestCase):
+    """Migration 0013 refuses to add the constraint over emails that differ only in case"""
+    before = [('api', '0012_analytics_rollups')]
+    after = [('api', '0013_user_email_lower_unique')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicate_emails_stop_the_migration(self):
+        apps = self.migrate(self.before)
+        HistoricalUser = apps.get_model('api', 'User')
+        HistoricalUser.objects.create(username='one', email='Same@example.com')
+        HistoricalUser.objects.create(username='two', email='same@EXAMPLE.com')
+        with self.assertRaisesMessage(RuntimeError, 'same@example.com'):
+            self.migrate(self.after)
+        HistoricalUser.objects.filter(username='two').update(email='other@example.com')
+        self.migrate(self.after)
+
+
+@override_settings(FAST_LIST_SERIALIZATION=False)
+class UserSummaryMemoTests(ApiTestCase):
+    """Nested users are rendered once per response, never reused across responses"""
+
+    def setUp(self):
+        super().setUp()
+        self.others = [self.make_user(name) for name in ['bob', 'carol']]
+        for n in range(6):
+            other = self.others[n % 2]
+            sender, recipient = (self.user, other) if n % 3 else (other, self.user)
+            Message.objects.create(sender=sender, recipient=recipient, text=f'message {n}')
+
+    def rendered(self):
+        """Count UserSummarySerializer renders per user id during the block"""
+        counts = Counter()
+        original = serializers.ModelSerializer.to_representation
+
+        def spy(serializer, instance):
+            if isinstance(serializer, UserSummarySerializer):
+                counts[instance.pk] += 1
+            return original(serializer, instance)
+        return counts, mock.patch.object(serializers.ModelSerializer, 'to_representation', spy)
+
+    def test_each_user_rendered_once_per_response(self):
+        counts, spy = self.rendered()
+        with spy:
+            first = self.client.get('/api/messages/')
+            self.assertEqual(dict(counts), {user.pk: 1 for user in [self.user, *self.others]})
+            second = self.client.get('/api/messages/')
+        self.assertEqual(dict(counts), {user.pk: 2 for user in [self.user, *self.others]})
+        self.assertEqual(first.data, second.data)
+        rows = first.data['results']
+        self.assertEqual(len(rows), 6)
+        self.assertEqual({row['sender']['username'] for row in rows}, {'alice', 'bob', 'carol'})
+
+    def test_changes_show_in_the_next_response(self):
+        self.client.get('/api/messages/')
+        self.others[0].user_type = 'client'
+        self.others[0].save()
+        rows = self.client.get('/api/messages/').data['results']
+        types = {row['recipient']['username']: row['recipient']['user_type'] for row in rows}
+        self.assertEqual(types['bob'], 'client')
+
+
+@override_settings(FAST_LIST_SERIALIZATION=False)
+class SparseFieldsetTests(ApiTestCase):
+    """`?fields=` and `?expand=` cut both the response and the columns loaded for it"""
+
+    def setUp(self):
+        super().setUp()
+        self.fan = self.make_user('bob')
+        self.gig = Gig.objects.create(
+            client=self.user, title='Gig', description='d', price=Decimal('100'),
+            timeframe='1 week', requirements='r',
+        )
+        self.post = TubongePost.objects.create(author=self.user, text='hello')
+        self.post.likes.add(self.fan)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results'][0]
+
+    def test_unknown_names_rejected(self):
+        for query, param in [
+            ('fields=id,nope', 'fields'), ('fields=id,client&expand=title', 'expand'),
+            ('fields=id&expand=nope', 'expand'), ('fields=document_upload_id', 'fields'),
+        ]:
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/gigs/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.data), [param])
+
+    def test_relations_collapse_to_ids(self):
+        self.assertEqual(self.get('/api/gigs/?fields=id,client'), {'id': self.gig.pk, 'client': self.user.pk})
+        post = self.get('/api/tubonge-posts/?fields=author,likes')
+        self.assertEqual(post, {'author': self.user.pk, 'likes': [self.fan.pk]})
+
+    def test_expand(self):
+        gig = self.get('/api/gigs/?fields=title,client&expand=client')
+        self.assertEqual(gig['client']['username'], 'alice')
+        post = self.get('/api/tubonge-posts/?fields=author,likes&expand=likes')
+        self.assertEqual(post['author'], self.user.pk)
+        self.assertEqual([like['username'] for like in post['likes']], ['bob'])
+
+    def test_without_fields_everything_is_sent(self):
+        gig = self.get('/api/gigs/?expand=nope')
+        self.assertEqual(gig['client']['username'], 'alice')
+        self.assertIn('description', gig)
+
+    def narrowed(self, url, serializer_class, queryset):
+        request = Request(RequestFactory().get(url))
+        serializer = serializer_class(many=True, context={'request': request})
+        return sparse.narrow(queryset, serializer, request)
+
+    def test_narrow_loads_selected_columns(self):
+        queryset = self.narrowed('/api/gigs/?fields=title,client&expand=client', GigSerializer, Gig.objects.all())
+        with self.assertNumQueries(1):
+            gig, = queryset
+            self.assertEqual(gig.client.username, 'alice')
+        self.assertEqual(
+            gig.get_deferred_fields(),
+            {field.attname for field in Gig._meta.concrete_fields} - {'id', 'title', 'client_id', 'created_at'},
+        )
+        self.assertIn('email', gig.client.get_deferred_fields())
+        self.assertNotIn('username', gig.client.get_deferred_fields())
+
+        queryset = self.narrowed('/api/gigs/?fields=id', GigSerializer, Gig.objects.select_related('client'))
+        with self.assertNumQueries(1):
+            gig, = queryset
+        self.assertIn('client_id', gig.get_deferred_fields())
+        self.assertNotIn('client', gig._state.fields_cache)
+
+    def test_narrow_prefetches_ids_only(self):
+        queryset = self.narrowed(
+            '/api/tubonge-posts/?fields=likes', TubongePostSerializer, TubongePost.objects.all()
+        )
+        with self.assertNumQueries(2):
+            post, = queryset
+            fan, = post.likes.all()
+        self.assertIn('username', fan.get_deferred_fields())
+
+
+class FastPathTests(ApiTestCase):
+    """The values() fast path and orjson renderer give the serializers' exact bytes"""
+
+    ENDPOINTS = [
+        '/api/gigs/',
+        '/api/services/',
+        '/api/messages/',
+        '/api/tubonge-posts/?view=lean&page_size=15',
+        # Sparse fieldsets compile their own shapes (api/sparse.py).
+        '/api/gigs/?fields=id,title,client,bid_count,created_at',
+        '/api/services/?fields=id,price,client&expand=client',
+        '/api/messages/?fields=text,is_read,sender&expand=sender',
+        '/api/tubonge-posts/?view=lean&fields=id,text,liked_by_me,comments',
+    ]
+
+    def setUp(self):
+        super().setUp()
+        users = [self.user] + [
+            self.make_user(
+                f'user{n}', user_type='client' if n % 2 else 'pwd',
+                profile_picture=f'profiles/{n}.png' if n % 3 else '',
+            )
+            for n in range(1, 8)
+        ]
+        clients = users[1::2]
+        text = 'Caption interviews \u2028 in “plain” language — ok'
+        for n in range(25):
+            Gig.objects.create(
+                client=clients[n % len(clients)], title=f'Gig {n}', description=text, price=Decimal('1500.50'),
+                timeframe='2 weeks', requirements='r', document='gig_documents/brief.pdf' if n % 4 else '',
+            )
+            Service.objects.create(
+                client=clients[n % len(clients)], title=f'Service {n}', description=text, price=Decimal('800'),
+                duration='1 hour', requirements='r',
+            )
+        for n in range(45):
+            # Alice sends the even messages and receives the odd ones.
+            recipient = users[0] if n % 2 else users[2 + n % 3]
+            Message.objects.create(sender=users[n % 2], recipient=recipient, text=f'{text} {n}')
+        for n in range(25):
+            post = TubongePost.objects.create(
+                author=users[n % len(users)], text=f'{text} {n}',
+                media_variants={'webp': {'320': f'tubonge_media/{n}.webp'}} if n % 5 == 0 else {},
+            )
+            post.likes.add(*users[n % 3:n % 3 + 3])
+            for m in range(n % 5):
+                PostComment.objects.create(post=post, author=users[(n + m) % len(users)], text=f'Comment {m}')
+        Bid.objects.create(gig=Gig.objects.first(), bidder=users[2], amount=5, proposal='p')
+        self.client.get(f'/api/messages/with_user/?user_id={users[1].pk}')
+
+    def fetch_pages(self, url, fast):
+        """Every page of `url` with the fast path on or off, and the shapes it used"""
+        shapes = []
+        shape_for = fastpath.shape_for
+
+        def spy(*args):
+            shape = shape_for(*args)
+            shapes.append(shape)
+            return shape
+
+        pages = []
+        with override_settings(FAST_LIST_SERIALIZATION=fast), mock.patch.object(fastpath, 'shape_for', spy):
+            while url:
+                for cache in caches.all():
+                    cache.clear()
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                pages.append(response)
+                url = response.data['next']
+        return pages, shapes
+
+    def test_identical_output(self):
+        for url in self.ENDPOINTS:
+            with self.subTest(url=url):
+                slow, _ = self.fetch_pages(url, fast=False)
+                fast, shapes = self.fetch_pages(url, fast=True)
+                self.assertTrue(shapes and all(shape is not None for shape in shapes))
+                self.assertGreater(len(slow), 1)
+                self.assertEqual([page.content for page in slow], [page.content for page in fast])
+                for page in slow:
+                    self.assertEqual(FastJSONRenderer().render(page.data), JSONRenderer().render(page.data))
+
+    def test_renderer_non_finite_numbers(self):
+        for value in [float('nan'), float('inf'), -float('inf'), Decimal('NaN'), Decimal('-Infinity')]:
+            data = {'results': [{'id': 1, 'score': value}]}
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    JSONRenderer().render(data)
+                with self.assertRaises(ValueError):
+                    FastJSONRenderer().render(data)
+
+    def test_renderer_numbers(self):
+        data = {
+            'decimals': [Decimal('1500.50'), Decimal('0.00001'), Decimal('-3'), Decimal('1E+3')],
+            'floats': [0.1, 1e-05, 1e22, 123456789.123456789],
+            'text': 'line\u2028break',
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class ConditionalGetTests(ApiTestCase):
+    """ETag and Last-Modified are read from the rows and move when the rows do"""
+
+    def setUp(self):
+        super().setUp()
+        self.pwd = self.make_user('pwd', user_type='pwd')
+        self.gig = Gig.objects.create(
+            client=self.user, title='g', description='d', price=10, timeframe='1 week', requirements='r',
+        )
+        self.service = Service.objects.create(
+            client=self.user, title='s', description='d', price=10, duration='1 hour', requirements='r',
+        )
+        self.post = TubongePost.objects.create(author=self.user, text='p')
+
+    def revalidate(self, url, response, **headers):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], **headers)
+
+    def assertRevalidates(self, responses, status_code):
+        for url, response in responses.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url, response).status_code, status_code)
+
+    def fetch(self, *urls):
+        return {url: self.client.get(url) for url in urls}
+
+    def test_not_modified(self):
+        for url in ['/api/gigs/', f'/api/gigs/{self.gig.pk}/', '/api/services/', f'/api/services/{self.service.pk}/',
+                    '/api/tubonge-posts/?view=lean', f'/api/tubonge-posts/{self.post.pk}/']:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('private', response['Cache-Control'])
+                self.assertTrue(response['ETag'].startswith('W/'))
+                again = self.revalidate(url, response)
+                self.assertEqual(again.status_code, 304)
+                self.assertEqual(again.content, b'')
+                self.assertEqual(again['ETag'], response['ETag'])
+                again = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(again.status_code, 304)
+
+    def test_empty_list_has_no_last_modified(self):
+        response = self.client.get('/api/gigs/?status=closed')
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.revalidate('/api/gigs/?status=closed', response).status_code, 304)
+
+    def test_validators_survive_a_cold_cache(self):
+        # Another worker, or this one after a restart, has nothing cached.
+        response = self.client.get('/api/gigs/')
+        for cache in caches.all():
+            cache.clear()
+        self.assertEqual(self.revalidate('/api/gigs/', response).status_code, 304)
+
+    def test_validators_differ_per_user_and_url(self):
+        response = self.client.get('/api/gigs/')
+        self.assertEqual(self.revalidate('/api/gigs/?fields=id', response).status_code, 200)
+        self.client.force_authenticate(self.pwd)
+        self.assertEqual(self.revalidate('/api/gigs/', response).status_code, 200)
+
+    def test_revalidation_writes_nothing(self):
+        for url in ['/api/gigs/', '/api/tubonge-posts/?view=lean']:
+            response = self.client.get(url)
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.revalidate(url, response).status_code, 304)
+            # One aggregate over the listed rows, and nothing written.
+            self.assertEqual(len(queries), 1)
+            self.assertTrue(queries[0]['sql'].lstrip().upper().startswith('SELECT'))
+
+    def rename_owner(self):
+        # The owner's summary is embedded in every gig.
+        self.user.username = 'alicia'
+        self.user.save()
+
+    def test_row_changes_move_validators(self):
+        gig_urls = ['/api/gigs/', f'/api/gigs/{self.gig.pk}/']
+        writes = [
+            lambda: self.client.patch(f'/api/gigs/{self.gig.pk}/', {'title': 'renamed'}),
+            lambda: self.client.post('/api/gigs/bulk_close/', {'ids': [self.gig.pk]}, format='json'),
+            self.rename_owner,
+        ]
+        for write in writes:
+            responses = self.fetch(*gig_urls)
+            write()
+            self.assertRevalidates(responses, 200)
+
+        responses = self.fetch('/api/gigs/', '/api/tubonge-posts/?view=lean')
+        Gig.objects.filter(pk=self.gig.pk).delete()
+        TubongePost.objects.create(author=self.pwd, text='new')
+        self.assertRevalidates(responses, 200)
+
+    def test_list_validators_follow_filters(self):
+        responses = self.fetch('/api/gigs/?status=open', '/api/gigs/?status=closed')
+        self.client.patch(f'/api/gigs/{self.gig.pk}/', {'title': 'renamed'})
+        self.assertEqual(self.revalidate('/api/gigs/?status=open', responses['/api/gigs/?status=open']).status_code, 200)
+        self.assertEqual(
+            self.revalidate('/api/gigs/?status=closed', responses['/api/gigs/?status=closed']).status_code, 304
+        )
+
+    def test_counters_leave_validators(self):
+        urls = [
+            '/api/gigs/', f'/api/gigs/{self.gig.pk}/', '/api/services/',
+            '/api/tubonge-posts/?view=lean', f'/api/tubonge-posts/{self.post.pk}/',
+        ]
+        responses = self.fetch(*urls)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(self.pwd)
+            self.client.post(f'/api/gigs/{self.gig.pk}/bid/', {'gig': self.gig.pk, 'amount': 5, 'proposal': 'p'})
+            self.client.post(f'/api/services/{self.service.pk}/book/', {'service': self.service.pk, 'proposal': 'p'})
+            self.client.post(f'/api/tubonge-posts/{self.post.pk}/like/')
+            self.client.post(f'/api/tubonge-posts/{self.post.pk}/comment/', {'text': 'hi'})
+            self.client.force_authenticate(self.user)
+        Gig.objects.filter(pk=self.gig.pk).update(views=F('views') + 5)
+        self.assertRevalidates(responses, 304)
+
+
+class FeedCacheTests(ApiTestCase):
+    """Likes and comments leave the cached feed page in place; its live fields are read fresh"""
+
+    URLS = [
+        '/api/tubonge-posts/',
+        '/api/tubonge-posts/?view=lean',
+        '/api/tubonge-posts/?view=lean&fields=id,like_count,liked_by_me,comments',
+        '/api/tubonge-posts/?fields=id,likes,comments_count&expand=likes',
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.bob = self.make_user('bob')
+        self.posts = [TubongePost.objects.create(author=self.bob, text=f'post {n}') for n in range(3)]
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertMatchesFreshPage(self, url, response):
+        for cache in caches.all():
+            cache.clear()
+        fresh = self.get(url)
+        self.assertEqual(fresh['X-Cache'], 'MISS')
+        self.assertEqual(response.content, fresh.content)
+
+    def test_likes_and_comments_keep_cache(self):
+        post = self.posts[0]
+        writes = [
+            lambda: self.client.post(f'/api/tubonge-posts/{post.pk}/like/'),
+            lambda: self.client.post(f'/api/tubonge-posts/{post.pk}/comment/', {'text': 'first'}),
+            lambda: post.likes.add(self.bob),
+            lambda: PostComment.objects.filter(post=post).delete(),
+        ]
+        for url in self.URLS:
+            for write in writes:
+                with self.subTest(url=url, write=writes.index(write)):
+                    self.assertIn(self.get(url)['X-Cache'], ('HIT', 'MISS'))
+                    with self.captureOnCommitCallbacks(execute=True):
+                        write()
+                    response = self.get(url)
+                    self.assertEqual(response['X-Cache'], 'HIT')
+                    self.assertMatchesFreshPage(url, response)
+
+    def test_live_values_on_hit(self):
+        post = self.posts[-1]
+        self.get('/api/tubonge-posts/?view=lean')
+        self.client.post(f'/api/tubonge-posts/{post.pk}/like/')
+        self.client.post(f'/api/tubonge-posts/{post.pk}/comment/', {'text': 'hi'})
+        response = self.get('/api/tubonge-posts/?view=lean')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        first = response.data['results'][0]
+        self.assertEqual(first['id'], post.pk)
+        self.assertEqual((first['like_count'], first['comments_count'], first['liked_by_me']), (1, 1, True))
+        self.assertEqual([comment['text'] for comment in first['comments']], ['hi'])
+        self.client.force_authenticate(self.bob)
+        response = self.get('/api/tubonge-posts/?view=lean')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertFalse(response.data['results'][0]['liked_by_me'])
+
+    def test_post_writes_invalidate(self):
+        for write in [
+            lambda: TubongePost.objects.create(author=self.bob, text='new'),
+            lambda: TubongePost.objects.filter(pk=self.posts[0].pk).first().save(),
+            lambda: self.posts[1].delete(),
+            lambda: User.objects.filter(pk=self.bob.pk).first().save(),
+        ]:
+            self.get('/api/tubonge-posts/?view=lean')
+            write()
+            self.assertEqual(self.get('/api/tubonge-posts/?view=lean')['X-Cache'], 'MISS')
+
+    def test_pages_without_ids_are_not_shared(self):
+        url = '/api/tubonge-posts/?view=lean&fields=text,like_count'
+        self.get(url)
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.get('/api/tubonge-posts/?view=lean&fields=text')
+        self.assertEqual(self.get('/api/tubonge-posts/?view=lean&fields=text')['X-Cache'], 'HIT')
+
+    def test_full_page_queries_do_not_grow_with_posts(self):
+        for post in self.posts:
+            for n in range(12):
+                PostComment.objects.create(post=post, author=self.bob, text=f'comment {n}')
+
+        def queries(page_size):
+            url = f'/api/tubonge-posts/?page_size={page_size}'
+            counts = []
+            for expected in ('MISS', 'HIT'):
+                with CaptureQueriesContext(connection) as captured:
+                    response = self.get(url)
+                self.assertEqual(response['X-Cache'], expected)
+                self.assertEqual([len(post['comments']) for post in response.data['results']], [10] * page_size)
+                counts.append(len(captured))
+            return counts
+
+        # One request first, so per-process setup is not counted against either size.
+        self.get('/api/tubonge-posts/?page_size=2')
+        self.assertEqual(queries(1), queries(3))
+        response = self.get('/api/tubonge-posts/?page_size=1')
+        self.assertEqual(
+            [comment['text'] for comment in response.data['results'][0]['comments']],
+            [f'comment {n}' for n in range(10)],
+        )
@@ -0,0 +1,237 @@
+"""
+Resumable, chunked uploads.
+
+A client creates an Upload session with the total size, PUTs the file in
+chunks with `Content-Range: bytes <start>-<end>/<total>`, and finalizes it.
+Each chunk is copied from the request stream to its own scratch file in
+fixed-size blocks, so memory use stays flat whatever the chunk size, and no
+transaction or row lock is held while a slow client sends it. An optional
+`X-Chunk-SHA256` header is checked before the chunk is accepted. Only then is
+the session row locked, just long enough to check that the chunk starts at the
+recorded offset, rename the file into place as the part at that offset and
+advance the offset. A part whose commit failed is replaced when the client
+resumes from the offset returned by GET, and two attempts at the same chunk
+never write to the same file. Finalizing joins the parts, verifies their
+length and whole-file SHA-256, and streams the result into media storage
+before the row is locked again to mark it complete.
+
+Scratch files live on local disk (RESUMABLE_UPLOAD_DIR), so a session's chunks
+must reach the same node.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from django.db import transaction
+
+from .models import Upload
+
+
+BLOCK_SIZE = 64 * 1024
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadError(Exception):
+    def __init__(self, message, status_code=400, offset=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.offset = offset
+
+
+def get_max_size():
+    return getattr(settings, 'RESUMABLE_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+
+
+def get_upload_dir():
+    path = getattr(settings, 'RESUMABLE_UPLOAD_DIR', None) or os.path.join(
+        tempfile.gettempdir(), 'ableconnect_uploads'
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def scratch_dir(upload):
+    return os.path.join(get_upload_dir(), str(upload.pk))
+
+
+def part_path(upload, start):
+    """The scratch file holding the chunk that starts at byte `start`"""
+    return os.path.join(scratch_dir(upload), f'{start}.part')
+
+
+def parse_content_range(header):
+    """Return `(start, end, total)` from a Content-Range header"""
+    match = CONTENT_RANGE.match(header or '')
+    if not match:
+        raise UploadError('Content-Range header of the form "bytes start-end/total" is required.')
+    start, end, total = (int(group) for group in match.groups())
+    if end < start:
+        raise UploadError('Content-Range end must not be before start.')
+    return start, end, total
+
+
+def _part_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _check_pending(upload):
+    if upload.status != 'pending':
+        raise UploadError('Upload is already finalized.', status_code=409, offset=upload.offset)
+
+
+def _check_chunk(upload, start, end, total):
+    _check_pending(upload)
+    if total != upload.size or end >= upload.size:
+        raise UploadError('Content-Range does not match the upload size.')
+    if start != upload.offset:
+        raise UploadError('Chunk does not start at the current offset.', status_code=409, offset=upload.offset)
+
+
+def write_chunk(upload_id, owner, stream, content_range, chunk_sha256=None):
+    """Write one chunk at the session's offset and return the updated Upload"""
+    start, end, total = parse_content_range(content_range)
+    length = end - start + 1
+    if stream is None:
+        raise UploadError('Chunk body is empty.')
+
+    upload = Upload.objects.get(pk=upload_id, owner=owner)
+    _check_chunk(upload, start, end, total)
+    os.makedirs(scratch_dir(upload), exist_ok=True)
+    fd, staging = tempfile.mkstemp(suffix='.tmp', dir=scratch_dir(upload))
+    try:
+        digest = hashlib.sha256()
+        received = 0
+        with os.fdopen(fd, 'wb') as out:
+            while received < length:
+                block = stream.read(min(BLOCK_SIZE, length - received))
+                if not block:
+                    break
+                digest.update(block)
+                out.write(block)
+                received += len(block)
+        if received != length:
+            raise UploadError('Chunk body is shorter than its Content-Range.', offset=upload.offset)
+        if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+            raise UploadError('Chunk checksum mismatch.', offset=upload.offset)
+
+        with transaction.atomic():
+            # Row lock so only one attempt at this offset is committed.
+            upload = Upload.objects.select_for_update().get(pk=upload_id, owner=owner)
+            _check_chunk(upload, start, end, total)
+            os.replace(staging, part_path(upload, start))
+            upload.offset = end + 1
+            upload.save(update_fields=['offset', 'updated_at'])
+    finally:
+        _remove(staging)
+    return upload
+
+
+def _committed_length(upload):
+    """Bytes covered by the run of parts from the start that fits the upload"""
+    position = 0
+    while position < upload.size:
+        size = _part_size(part_path(upload, position))
+        if not size or position + size > upload.size:
+            break
+        position += size
+    return position
+
+
+def _join_parts(upload, path):
+    """Concatenate the parts into `path` and return their SHA-256"""
+    digest = hashlib.sha256()
+    position = 0
+    with open(path, 'wb') as out:
+        while position < upload.size:
+            with open(part_path(upload, position), 'rb') as part:
+                for block in iter(lambda: part.read(BLOCK_SIZE), b''):
+                    digest.update(block)
+                    out.write(block)
+                    position += len(block)
+    return digest.hexdigest()
+
+
+def finalize(upload_id, owner, expected_sha256=None):
+    """Verify a fully received upload and move it into media storage"""
+    upload = Upload.objects.get(pk=upload_id, owner=owner)
+    _check_pending(upload)
+    if upload.offset != upload.size:
+        raise UploadError('Upload is incomplete.', status_code=409, offset=upload.offset)
+
+    # Once every byte is committed no chunk is accepted, so the parts can be
+    # read and copied to storage without holding the row.
+    kept = _committed_length(upload)
+    if kept != upload.size:
+        # The parts disagree with the recorded offset (lost or extra bytes),
+        # so rewind to what can be kept and have the rest resent.
+        with transaction.atomic():
+            locked = Upload.objects.select_for_update().get(pk=upload_id, owner=owner)
+            _check_pending(locked)
+            locked.offset = kept
+            locked.save(update_fields=['offset', 'updated_at'])
+        raise UploadError('Upload data does not match its size.', status_code=409, offset=kept)
+
+    joined = os.path.join(scratch_dir(upload), 'joined')
+    os.makedirs(scratch_dir(upload), exist_ok=True)
+    checksum = _join_parts(upload, joined)
+    if expected_sha256 and checksum != expected_sha256.lower():
+        raise UploadError('File checksum mismatch.', offset=upload.offset)
+    with open(joined, 'rb') as fh:
+        upload.file.save(os.path.basename(upload.filename), File(fh), save=False)
+
+    with transaction.atomic():
+        locked = Upload.objects.select_for_update().get(pk=upload_id, owner=owner)
+        if locked.status != 'pending':
+            # A concurrent finalize got there first; keep its copy.
+            upload.file.delete(save=False)
+            _check_pending(locked)
+        locked.file = upload.file.name
+        locked.sha256 = checksum
+        locked.status = 'complete'
+        locked.save(update_fields=['file', 'sha256', 'status', 'updated_at'])
+    discard(locked)
+    return locked
+
+
+def discard(upload):
+    shutil.rmtree(scratch_dir(upload), ignore_errors=True)
+
+
+def claim(upload_id, owner, model, field_name):
+    """
+    Look up a finalized upload that `owner` may attach to `model.field_name`.
+
+    The model field's validators (e.g. allowed extensions) are applied to the
+    uploaded file. Returns the Upload; the caller marks it attached.
+    """
+    try:
+        upload = Upload.objects.get(pk=upload_id, owner=owner, status='complete')
+    except Upload.DoesNotExist:
+        raise UploadError('Upload not found or not finalized.')
+    for validator in model._meta.get_field(field_name).validators:
+        try:
+            validator(upload.file)
+        except DjangoValidationError as exc:
+            raise UploadError(' '.join(exc.messages))
+    return upload
+
+
+def mark_attached(uploads):
+    if uploads:
+        Upload.objects.filter(pk__in=[upload.pk for upload in uploads]).update(status='attached')
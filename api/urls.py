@@ -2,7 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     UserViewSet, TubongePostViewSet, GigViewSet,
-    ServiceViewSet, MessageViewSet
+    ServiceViewSet, MessageViewSet, SearchView, UploadViewSet, MarketplaceView,
+    AnalyticsView
 )
 
 router = DefaultRouter()
@@ -11,8 +12,12 @@ router.register(r'tubonge-posts', TubongePostViewSet, basename='tubonge-post')
 router.register(r'gigs', GigViewSet, basename='gig')
 router.register(r'services', ServiceViewSet, basename='service')
 router.register(r'messages', MessageViewSet, basename='message')
+router.register(r'uploads', UploadViewSet, basename='upload')
 
 urlpatterns = [
+    path('search/', SearchView.as_view(), name='search'),
+    path('marketplace/', MarketplaceView.as_view(), name='marketplace'),
+    path('analytics/', AnalyticsView.as_view(), name='analytics'),
     path('', include(router.urls)),
 ]
 
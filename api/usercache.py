@@ -0,0 +1,164 @@
+"""
+Per-process cache of authenticated users.
+
+Every JWT-authenticated request needs a User instance for `request.user`.
+Most requests are small GETs from the same set of active users, so loading
+that row each time is pure overhead. CachedJWTAuthentication (see
+api/authentication.py) resolves the token's user id here first.
+
+Entries live in a bounded LRU for AUTH_USER_CACHE_TTL seconds. When
+AUTH_USER_CACHE_ALIAS names a Django cache, a local miss tries that cache
+before the database, so a fresh worker starts warm. Callers always get
+their own copy of the user, so changes made while handling a request never
+leak into the cache.
+
+Saving or deleting a User drops its entry here and in the shared cache,
+both at once and again on commit (see api/signals.py). That covers password
+and `is_active` changes. Other processes keep their local copy until it
+expires, so the TTL bounds how long a deactivated user stays signed in
+elsewhere. Code that changes users with `QuerySet.update()` sends no signal
+and must call `invalidate()` itself.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+SHARED_PREFIX = 'auth:user'
+
+
+def get_max_size():
+    return getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000)
+
+
+def get_ttl():
+    return getattr(settings, 'AUTH_USER_CACHE_TTL', 30)
+
+
+def get_shared_cache():
+    alias = getattr(settings, 'AUTH_USER_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def _shared_key(user_id):
+    return f'{SHARED_PREFIX}:{user_id}'
+
+
+class UserCache:
+    """A thread-safe LRU of user instances with a per-entry expiry"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Bumped by every invalidation, so a lookup that raced one never
+        # stores the row it read before the change.
+        self.generation = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.local_hits = 0
+            self.shared_hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.invalidations = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                user, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(user_id)
+                    self.local_hits += 1
+                    return copy.deepcopy(user)
+                del self._entries[user_id]
+        return None
+
+    def put(self, user_id, user, generation):
+        max_size = get_max_size()
+        if max_size <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[user_id] = (copy.deepcopy(user), time.monotonic() + get_ttl())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, user_id):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def record(self, shared_hit):
+        with self._lock:
+            if shared_hit:
+                self.shared_hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        with self._lock:
+            hits = self.local_hits + self.shared_hits
+            total = hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': get_max_size(),
+                'ttl': get_ttl(),
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+users = UserCache()
+
+
+def get_user(user_id, load):
+    """
+    The user with `user_id`, from this process, the shared cache or `load()`.
+
+    `load(user_id)` reads the row and raises if it does not exist; failed
+    lookups are not cached.
+    """
+    # Token claims and primary keys can disagree on int vs str.
+    key = str(user_id)
+    user = users.get(key)
+    if user is not None:
+        return user
+
+    generation = users.generation
+    shared = get_shared_cache()
+    user = shared.get(_shared_key(key)) if shared is not None else None
+    users.record(user is not None)
+    if user is None:
+        user = load(user_id)
+        if shared is not None and users.generation == generation:
+            shared.set(_shared_key(key), user, get_ttl())
+    users.put(key, user, generation)
+    return user
+
+
+def invalidate(user_id):
+    key = str(user_id)
+    users.discard(key)
+    shared = get_shared_cache()
+    if shared is not None:
+        shared.delete(_shared_key(key))
@@ -0,0 +1,122 @@
+"""
+Buffered view counting for gigs and services.
+
+`record_view` only appends to an in-process buffer, so a detail request pays
+no database or cache round trip. A background thread drains the buffer every
+VIEW_COUNT_FLUSH_INTERVAL seconds, or as soon as VIEW_COUNT_FLUSH_THRESHOLD
+views are waiting. It drops repeat views by the same user within
+VIEW_COUNT_DEDUP_WINDOW using cache.add, which is shared across workers when
+the cache is, then applies what is left as one `views = views + n` UPDATE
+per model and increment size, plus the daily rollups in api/rollups.py.
+
+Counts are eventually consistent: views still buffered when a process is
+killed are lost.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+from . import rollups
+from .models import Gig, Service
+
+
+logger = logging.getLogger(__name__)
+
+MODELS = {
+    'gig': Gig,
+    'service': Service,
+}
+
+
+def get_flush_interval():
+    return getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 10)
+
+
+def get_flush_threshold():
+    return getattr(settings, 'VIEW_COUNT_FLUSH_THRESHOLD', 500)
+
+
+def get_dedup_window():
+    return getattr(settings, 'VIEW_COUNT_DEDUP_WINDOW', 1800)
+
+
+def _seen_key(kind, object_id, user_id):
+    return f'views:seen:{kind}:{object_id}:{user_id}'
+
+
+class ViewBuffer:
+    """Pending views for this process and the thread that flushes them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def record(self, kind, object_id, user_id):
+        with self._lock:
+            self._pending.append((kind, object_id, user_id))
+            waiting = len(self._pending)
+            if self._thread is None and getattr(settings, 'VIEW_COUNT_ASYNC', True):
+                self._thread = threading.Thread(target=self._run, name='viewcounts', daemon=True)
+                self._thread.start()
+        if waiting >= get_flush_threshold():
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Apply buffered views; returns the number of views counted"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+
+        window = get_dedup_window()
+        increments = Counter()
+        for kind, object_id, user_id in set(pending):
+            if cache.add(_seen_key(kind, object_id, user_id), 1, window):
+                increments[kind, object_id] += 1
+
+        # Objects that gained the same number of views share one UPDATE.
+        batches = defaultdict(list)
+        for (kind, object_id), count in increments.items():
+            batches[kind, count].append(object_id)
+        with transaction.atomic():
+            for (kind, count), object_ids in batches.items():
+                MODELS[kind].objects.filter(pk__in=object_ids).update(views=F('views') + count)
+            rollups.record_views(increments)
+        return sum(increments.values())
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(get_flush_interval())
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing view counts failed')
+            finally:
+                close_old_connections()
+
+
+buffer = ViewBuffer()
+atexit.register(buffer.flush)
+
+
+def record_view(instance, user):
+    """Count a detail view of a gig or service; owners' own views are ignored"""
+    if not user.is_authenticated or instance.client_id == user.pk:
+        return
+    kind = 'gig' if isinstance(instance, Gig) else 'service'
+    buffer.record(kind, instance.pk, user.pk)
+    if not getattr(settings, 'VIEW_COUNT_ASYNC', True):
+        buffer.flush()
@@ -1,24 +1,51 @@
-from rest_framework import viewsets, status
+from datetime import timedelta
+
+from rest_framework import generics, mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from django.contrib.auth import login
-from django.db.models import Q, Count, Max
+from django.db.models import Q
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from .models import (
     User, TubongePost, PostComment, Gig, Service,
-    Bid, Booking, Message
+    Bid, Booking, Message, Upload, Conversation
+)
+from . import cache as feed_cache
+from .counters import toggle_like
+from .feed import build_feed_context
+from . import (
+    bulk, chat, conditional, fastpath, feed, listings, marketplace, media, recommend, rollups, search, sparse,
+    uploads, usercache, viewcounts
+)
+from .pagination import (
+    FeedPagination, InboxPagination, ListingPagination, MergedKeysetPagination, SearchPagination,
+    ThreadPagination
 )
 from .serializers import (
     UserSerializer, UserRegistrationSerializer, LoginSerializer,
-    TubongePostSerializer, PostCommentSerializer,
-    GigSerializer, ServiceSerializer,
+    TubongePostSerializer, TubongeFeedSerializer, PostCommentSerializer,
+    GigSerializer, ServiceSerializer, ListingFilterSerializer,
     BidSerializer, BookingSerializer,
-    MessageSerializer, ConversationSerializer
+    MessageSerializer, ThreadMessageSerializer, ConversationSerializer, SearchResultSerializer,
+    UploadSerializer
 )
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class SparseQuerysetMixin:
+    """Narrow read querysets to the `?fields=` and `?expand=` of the request (see api/sparse.py)"""
+    # Model fields the view itself reads, loaded whatever the fieldset.
+    always_load = ()
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return sparse.narrow(queryset, self.get_serializer(), self.request, self.always_load)
+
+
+class UserViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for User operations"""
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -26,6 +53,8 @@ class UserViewSet(viewsets.ModelViewSet):
     def get_permissions(self):
         if self.action == 'create' or self.action == 'register':
             return [AllowAny()]
+        if self.action == 'auth_cache_stats':
+            return [IsAdminUser()]
         return [IsAuthenticated()]
     
     @action(detail=False, methods=['post'], permission_classes=[AllowAny])
@@ -59,31 +88,148 @@ class UserViewSet(viewsets.ModelViewSet):
         """Get current user"""
         serializer = UserSerializer(request.user)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def auth_cache_stats(self, request):
+        """Hit, miss and eviction counters for the authenticated-user cache in this process"""
+        return Response(usercache.users.as_dict())
 
 
-class TubongePostViewSet(viewsets.ModelViewSet):
+class TubongePostViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for Tubonge posts"""
     queryset = TubongePost.objects.all()
     serializer_class = TubongePostSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = FeedPagination
+    owner_field = 'author'
+    always_load = ['updated_at']
+    
+    def is_lean_feed(self):
+        """`?view=lean` swaps embedded like lists for a liked_by_me flag"""
+        return self.action == 'list' and self.request.query_params.get('view') == 'lean'
     
     def get_queryset(self):
-        queryset = TubongePost.objects.select_related('author').prefetch_related('likes', 'comments')
-        return queryset.annotate(comments_count=Count('comments')).order_by('-created_at')
+        queryset = TubongePost.objects.select_related('author')
+        if not self.is_lean_feed():
+            queryset = queryset.prefetch_related('likes')
+            if sparse.wants(self.request, 'comments'):
+                queryset = queryset.prefetch_related(feed.prefetch_comments())
+        return queryset.order_by('-created_at', '-id')
+    
+    def get_validator_queryset(self):
+        """The rows a list shows, for conditional.list_validators()"""
+        return TubongePost.objects.all()
+    
+    def get_serializer_class(self):
+        if self.is_lean_feed():
+            return TubongeFeedSerializer
+        return super().get_serializer_class()
+    
+    def get_serializer(self, *args, **kwargs):
+        if kwargs.get('many') and self.is_lean_feed():
+            context = self.get_serializer_context()
+            context.update(build_feed_context(args[0], self.request.user))
+            kwargs['context'] = context
+        return super().get_serializer(*args, **kwargs)
+    
+    @conditional.list_action
+    def list(self, request, *args, **kwargs):
+        """Serve the shared feed body from the versioned cache, with live counters layered on"""
+        lean = self.is_lean_feed()
+        key = feed_cache.request_key(feed_cache.FEED_NAMESPACE, request, 'lean' if lean else 'full')
+        live = any(sparse.wants(request, field) for field in feed.LIVE_FIELDS)
+        # Live fields are layered on by post id, so a page without ids is not shared.
+        shareable = sparse.wants(request, 'id') or not live
+        data = feed_cache.fetch(key) if shareable else None
+        hit = data is not None
+        if not hit:
+            shape = fastpath.shape_for(fastpath.LEAN_FEED, self.get_serializer(), request) if lean else None
+            if shape is not None:
+                data = self.fast_lean_list(request, shape).data
+            else:
+                data = super().list(request, *args, **kwargs).data
+            if shareable:
+                # Live fields keep their place in each post but are stored blank.
+                shared = [
+                    {field: None if field in feed.LIVE_FIELDS else value for field, value in post.items()}
+                    for post in data['results']
+                ]
+                feed_cache.store(key, {**data, 'results': shared})
+        elif live:
+            self.layer_live_fields(request, data['results'])
+        response = Response(data)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+    
+    def layer_live_fields(self, request, results):
+        """Fill a cached page's counters, likes, comments and liked_by_me from the database"""
+        posts = TubongePost.objects.filter(pk__in=[post['id'] for post in results]).only(
+            'id', 'like_count', 'comments_count'
+        )
+        if not self.is_lean_feed():
+            if sparse.wants(request, 'likes'):
+                posts = posts.prefetch_related('likes')
+            if sparse.wants(request, 'comments'):
+                posts = posts.prefetch_related(feed.prefetch_comments())
+        posts = list(posts)
+        context = self.get_serializer_context()
+        if self.is_lean_feed():
+            context.update(build_feed_context(posts, request.user))
+        live = feed.live_fields(self.get_serializer_class()(context=context), posts)
+        for post in results:
+            post.update(live.get(post['id'], {}))
+    
+    def fast_lean_list(self, request, shape):
+        """The lean feed page through api/fastpath.py, with the per-post lookups filled in"""
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = self.paginate_queryset(shape.values(queryset, paginator_columns(self)))
+        data = shape.render(rows, request)
+        context = self.get_serializer_context()
+        if shape.computed & {'liked_by_me', 'comments'}:
+            context.update(build_feed_context([TubongePost(pk=row['id']) for row in rows], request.user))
+        serializer = TubongeFeedSerializer(context=context)
+        for post, row in zip(data, rows):
+            if 'media_srcset' in shape.computed:
+                post['media_srcset'] = media.srcset(row['media_variants'], request)
+            if 'liked_by_me' in shape.computed:
+                post['liked_by_me'] = row['id'] in context['liked_post_ids']
+            if 'comments' in shape.computed:
+                post['comments'] = serializer.get_comments(TubongePost(pk=row['id']))
+        return self.get_paginated_response(data)
+    
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return conditional.respond(
+            request, conditional.detail_validators(request, instance, self.owner_field),
+            lambda: Response(self.get_serializer(instance).data),
+        )
     
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user, **self._media_state(serializer))
+        self._schedule_media(post)
+    
+    def perform_update(self, serializer):
+        post = serializer.save(**self._media_state(serializer))
+        self._schedule_media(post)
+    
+    def _media_state(self, serializer):
+        """New uploads wait for api.media to detect their type and render variants"""
+        if serializer.validated_data.get('media_file'):
+            return {'media_status': 'processing', 'media_type': None, 'media_variants': {}}
+        return {}
+    
+    def _schedule_media(self, post):
+        if post.media_status == 'processing':
+            media.schedule(post.pk)
     
     @action(detail=True, methods=['post'])
     def like(self, request, pk=None):
         """Like/unlike a post"""
-        post = self.get_object()
-        if post.likes.filter(id=request.user.id).exists():
-            post.likes.remove(request.user)
-            return Response({'liked': False, 'like_count': post.like_count})
-        else:
-            post.likes.add(request.user)
-            return Response({'liked': True, 'like_count': post.like_count})
+        try:
+            liked, like_count = toggle_like(int(pk), request.user.id)
+        except (TubongePost.DoesNotExist, ValueError):
+            raise Http404
+        return Response({'liked': liked, 'like_count': like_count})
     
     @action(detail=True, methods=['post'])
     def comment(self, request, pk=None):
@@ -100,27 +246,178 @@ class TubongePostViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def comments(self, request, pk=None):
         """Get all comments for a post"""
-        post = self.get_object()
-        comments = post.comments.select_related('author').all()
-        serializer = PostCommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        key = feed_cache.request_key(feed_cache.comments_namespace(pk), request)
+        data = feed_cache.fetch(key)
+        hit = data is not None
+        if not hit:
+            post = get_object_or_404(TubongePost.objects.only('id'), pk=pk)
+            comments = post.comments.select_related('author').all()
+            data = PostCommentSerializer(comments, many=True).data
+            feed_cache.store(key, list(data))
+        response = Response(data)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        """Hit and miss counters for the feed cache in this process"""
+        return Response(feed_cache.stats.as_dict())
+
+
+def listing_filters(request):
+    """Validated listing query parameters; raises a 400 for bad values"""
+    serializer = ListingFilterSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
 
+# Actions whose querysets take the listing filters and ordering; `facets`
+# reads them itself and every other action ignores them.
+LISTING_FILTER_ACTIONS = {'list', 'mine', 'recommended'}
 
-class GigViewSet(viewsets.ModelViewSet):
+
+def filter_listing_queryset(view, queryset):
+    """Apply the listing query parameters to the actions that read them"""
+    if view.action not in LISTING_FILTER_ACTIONS:
+        return queryset
+    return listings.filter_listings(queryset, listing_filters(view.request))
+
+
+def paginator_columns(view):
+    """Columns a keyset paginator reads back from the last row of a page"""
+    return [field.lstrip('-') for field in getattr(view.paginator, 'ordering', ())]
+
+
+def fast_list_response(view, request, shape):
+    """A paginated list action served through a shape from fastpath.shape_for()"""
+    queryset = shape.values(view.filter_queryset(view.get_queryset()), paginator_columns(view))
+    page = view.paginate_queryset(queryset)
+    if page is None:
+        return Response(shape.render(queryset, request))
+    return view.get_paginated_response(shape.render(page, request))
+
+
+def mine_response(view, request):
+    """Shared body of the gig and service `mine` actions, paged in the list's ordering"""
+    queryset = view.filter_queryset(view.get_queryset()).filter(client=request.user)
+    paginator = ListingPagination(ordering=listings.ordering(listing_filters(request)))
+    page = paginator.paginate_queryset(queryset, request, view=view)
+    serializer = view.get_serializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+
+def recommended_response(view, request):
+    """Shared body of the gig and service `recommended` actions"""
+    try:
+        limit = min(int(request.query_params.get('limit', 20)), 100)
+    except ValueError:
+        raise ValidationError({'limit': 'Must be an integer.'})
+    if limit < 1:
+        raise ValidationError({'limit': 'Must be at least 1.'})
+    queryset = view.filter_queryset(view.get_queryset()).exclude(client=request.user)
+    ranked = recommend.recommend(queryset, request.user.skills, limit=limit)
+    serializer = view.get_serializer([instance for instance, _ in ranked], many=True)
+    results = serializer.data
+    for item, (_, score) in zip(results, ranked):
+        item['score'] = round(score, 4)
+    return Response({'results': results})
+
+
+def bulk_response(view, request):
+    """Shared body of the gig and service `bulk` actions: POST creates, PATCH edits"""
+    context = view.get_serializer_context()
+    serializer_class = view.get_serializer_class()
+    try:
+        if request.method == 'POST':
+            instances = bulk.create_listings(serializer_class, request.data, request.user, context)
+            for instance in instances:
+                setattr(instance, view.count_field, 0)
+            response_status = status.HTTP_201_CREATED
+        else:
+            instances = bulk.update_listings(
+                serializer_class, view.get_queryset(), request.data, request.user, context
+            )
+            response_status = status.HTTP_200_OK
+    except bulk.BulkError as exc:
+        return Response({'error': exc.message, 'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = view.get_serializer(instances, many=True)
+    return Response({'results': serializer.data}, status=response_status)
+
+
+def bulk_close_response(view, request):
+    """Shared body of the gig and service `bulk_close` actions"""
+    model = view.get_queryset().model
+    try:
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        closed = bulk.close_listings(model, ids, request.user)
+    except bulk.BulkError as exc:
+        return Response({'error': exc.message, 'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'closed': closed})
+
+
+class GigViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for Gigs"""
     queryset = Gig.objects.all()
     serializer_class = GigSerializer
     permission_classes = [IsAuthenticated]
+    count_field = 'bid_count'
+    owner_field = 'client'
+    always_load = ['client', 'updated_at']
     
     def get_queryset(self):
         queryset = Gig.objects.select_related('client')
-        status_filter = self.request.query_params.get('status', None)
-        if status_filter:
-            queryset = queryset.filter(status=status_filter)
-        return queryset
+        if sparse.wants(self.request, 'bid_count'):
+            queryset = queryset.with_bid_count()
+        return filter_listing_queryset(self, queryset)
+    
+    def get_validator_queryset(self):
+        """The filtered rows a list shows, without the join and count its page reads"""
+        return filter_listing_queryset(self, Gig.objects.all())
+    
+    @conditional.list_action
+    def list(self, request, *args, **kwargs):
+        shape = fastpath.shape_for(fastpath.GIGS, self.get_serializer(), request)
+        if shape is not None:
+            return fast_list_response(self, request, shape)
+        return super().list(request, *args, **kwargs)
     
     def perform_create(self, serializer):
-        serializer.save(client=self.request.user)
+        instance = serializer.save(client=self.request.user)
+        instance.bid_count = 0
+    
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        # Buffered in memory and flushed in batches off the request thread
+        viewcounts.record_view(instance, request.user)
+        return conditional.respond(
+            request, conditional.detail_validators(request, instance, self.owner_field),
+            lambda: Response(self.get_serializer(instance).data),
+        )
+    
+    @action(detail=False, methods=['get'])
+    def mine(self, request):
+        """The current user's gigs in the requested ordering, with bid counts"""
+        return mine_response(self, request)
+    
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        """Create (POST) or edit (PATCH) a list of gigs in one transaction"""
+        return bulk_response(self, request)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_close(self, request):
+        """Close several of the current user's gigs: {"ids": [...]}"""
+        return bulk_close_response(self, request)
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Counts per status and price bucket for the filtered gigs"""
+        return Response(listings.facet_counts(Gig, listing_filters(request)))
+    
+    @action(detail=False, methods=['get'])
+    def recommended(self, request):
+        """Open gigs ranked against the current user's skills"""
+        return recommended_response(self, request)
     
     @action(detail=True, methods=['post'])
     def bid(self, request, pk=None):
@@ -130,28 +427,76 @@ class GigViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Only PWD users can place bids'}, 
                           status=status.HTTP_403_FORBIDDEN)
         
-        serializer = BidSerializer(data=request.data)
+        serializer = BidSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             serializer.save(gig=gig, bidder=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for Services"""
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
     permission_classes = [IsAuthenticated]
+    count_field = 'booking_count'
+    owner_field = 'client'
+    always_load = ['client', 'updated_at']
     
     def get_queryset(self):
         queryset = Service.objects.select_related('client')
-        status_filter = self.request.query_params.get('status', None)
-        if status_filter:
-            queryset = queryset.filter(status=status_filter)
-        return queryset
+        if sparse.wants(self.request, 'booking_count'):
+            queryset = queryset.with_booking_count()
+        return filter_listing_queryset(self, queryset)
+    
+    def get_validator_queryset(self):
+        """The filtered rows a list shows, without the join and count its page reads"""
+        return filter_listing_queryset(self, Service.objects.all())
+    
+    @conditional.list_action
+    def list(self, request, *args, **kwargs):
+        shape = fastpath.shape_for(fastpath.SERVICES, self.get_serializer(), request)
+        if shape is not None:
+            return fast_list_response(self, request, shape)
+        return super().list(request, *args, **kwargs)
     
     def perform_create(self, serializer):
-        serializer.save(client=self.request.user)
+        instance = serializer.save(client=self.request.user)
+        instance.booking_count = 0
+    
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        # Buffered in memory and flushed in batches off the request thread
+        viewcounts.record_view(instance, request.user)
+        return conditional.respond(
+            request, conditional.detail_validators(request, instance, self.owner_field),
+            lambda: Response(self.get_serializer(instance).data),
+        )
+    
+    @action(detail=False, methods=['get'])
+    def mine(self, request):
+        """The current user's services in the requested ordering, with booking counts"""
+        return mine_response(self, request)
+    
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        """Create (POST) or edit (PATCH) a list of services in one transaction"""
+        return bulk_response(self, request)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_close(self, request):
+        """Close several of the current user's services: {"ids": [...]}"""
+        return bulk_close_response(self, request)
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Counts per status and price bucket for the filtered services"""
+        return Response(listings.facet_counts(Service, listing_filters(request)))
+    
+    @action(detail=False, methods=['get'])
+    def recommended(self, request):
+        """Open services ranked against the current user's skills"""
+        return recommended_response(self, request)
     
     @action(detail=True, methods=['post'])
     def book(self, request, pk=None):
@@ -161,14 +506,14 @@ class ServiceViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Only PWD users can book services'}, 
                           status=status.HTTP_403_FORBIDDEN)
         
-        serializer = BookingSerializer(data=request.data)
+        serializer = BookingSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             serializer.save(service=service, booker=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for Messages"""
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
@@ -176,78 +521,85 @@ class MessageViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         # Users can only see messages they sent or received
-        return Message.objects.filter(
+        queryset = Message.objects.filter(
             Q(sender=self.request.user) | Q(recipient=self.request.user)
         ).select_related('sender', 'recipient')
+        if sparse.wants(self.request, 'is_read'):
+            queryset = queryset.with_read_state()
+        return queryset
+    
+    def list(self, request, *args, **kwargs):
+        shape = fastpath.shape_for(fastpath.MESSAGES, self.get_serializer(), request)
+        if shape is not None:
+            return fast_list_response(self, request, shape)
+        return super().list(request, *args, **kwargs)
+    
+    def create(self, request, *args, **kwargs):
+        recipient_id = str(request.data.get('recipient', ''))
+        if not recipient_id.isdigit():
+            return Response({'error': 'recipient user id is required'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        return super().create(request, *args, **kwargs)
     
     def perform_create(self, serializer):
-        serializer.save(sender=self.request.user)
+        # The post_save signal pushes the new message to both participants' sockets.
+        recipient = get_object_or_404(User, id=self.request.data.get('recipient'))
+        serializer.save(sender=self.request.user, recipient=recipient)
     
     @action(detail=False, methods=['get'])
     def conversations(self, request):
-        """Get all conversations for the current user"""
+        """Get all conversations for the current user, most recent first"""
         user = request.user
-        
-        # Get all unique users the current user has conversed with
-        conversations = Message.objects.filter(
-            Q(sender=user) | Q(recipient=user)
-        ).values('sender', 'recipient').annotate(
-            last_message_time=Max('created_at')
+        conversations = Conversation.objects.select_related(
+            'user_low', 'user_high', 'last_message__sender', 'last_message__recipient'
         )
         
+        # Each side is read on its own (user_x, -last_activity, -id) index and
+        # the two runs are merged; an OR of the sides could use neither.
+        paginator = InboxPagination()
+        page = paginator.paginate_querysets([
+            conversations.filter(user_low=user),
+            conversations.filter(user_high=user).exclude(user_low=user),
+        ], request, view=self)
         conversation_list = []
-        user_ids = set()
-        
-        for conv in conversations:
-            other_user_id = conv['recipient'] if conv['sender'] == user.id else conv['sender']
-            if other_user_id not in user_ids:
-                user_ids.add(other_user_id)
-                other_user = User.objects.get(id=other_user_id)
-                
-                # Get last message
-                last_message = Message.objects.filter(
-                    Q(sender=user, recipient=other_user) | Q(sender=other_user, recipient=user)
-                ).order_by('-created_at').first()
-                
-                # Get unread count
-                unread_count = Message.objects.filter(
-                    sender=other_user, recipient=user, is_read=False
-                ).count()
-                
-                conversation_data = {
-                    'user': UserSerializer(other_user).data,
-                    'last_message': MessageSerializer(last_message).data if last_message else None,
-                    'unread_count': unread_count
-                }
-                conversation_list.append(conversation_data)
-        
-        # Serialize each conversation
-        serialized_conversations = []
-        for conv in conversation_list:
-            serializer = ConversationSerializer(conv)
-            serialized_conversations.append(serializer.data)
-        
-        return Response(serialized_conversations)
+        for conversation in page:
+            if conversation.last_message is not None:
+                conversation.last_message.is_read = conversation.is_read(conversation.last_message)
+            conversation_list.append({
+                'user': conversation.other_user(user),
+                'last_message': conversation.last_message,
+                'unread_count': conversation.unread_for(user),
+            })
+        serializer = ConversationSerializer(conversation_list, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def with_user(self, request):
-        """Get messages with a specific user"""
+        """
+        Get a window of messages with a specific user.
+        
+        Returns the newest messages by default; `before_id` scrolls back and
+        `since_id` fetches only messages newer than the client's last one.
+        """
         user_id = request.query_params.get('user_id')
         if not user_id:
             return Response({'error': 'user_id parameter required'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
         other_user = get_object_or_404(User, id=user_id)
-        messages = Message.objects.filter(
-            Q(sender=request.user, recipient=other_user) |
-            Q(sender=other_user, recipient=request.user)
-        ).select_related('sender', 'recipient').order_by('created_at')
+        paginator = ThreadPagination()
+        page = paginator.paginate_queryset(Message.thread(request.user.id, other_user.id), request, view=self)
         
-        # Mark messages as read
-        Message.objects.filter(sender=other_user, recipient=request.user, is_read=False).update(is_read=True)
+        # Mark the thread read (a no-op when it already is) and send a receipt
+        chat.mark_read(request.user.id, other_user.id)
+        low, high = Conversation.pair(request.user.id, other_user.id)
+        conversation = Conversation.objects.filter(user_low_id=low, user_high_id=high).first()
+        if conversation is not None:
+            for message in page:
+                message.is_read = conversation.is_read(message)
         
-        serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        serializer = ThreadMessageSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
     def admin_send(self, request):
@@ -267,3 +619,116 @@ class MessageViewSet(viewsets.ModelViewSet):
         serializer = MessageSerializer(message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+
+
+class SearchView(generics.ListAPIView):
+    """Ranked full-text search across posts, gigs and services"""
+    serializer_class = SearchResultSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = SearchPagination
+    
+    def get_queryset(self):
+        text = self.request.query_params.get('q', '')
+        if not search.has_terms(text):
+            raise ValidationError({'q': 'A search term is required.'})
+        
+        kinds = None
+        type_filter = self.request.query_params.get('type')
+        if type_filter:
+            kinds = [kind.strip() for kind in type_filter.split(',') if kind.strip()]
+            valid = set(search.KINDS.values())
+            if not set(kinds) <= valid:
+                raise ValidationError({'type': f"Choose from: {', '.join(sorted(valid))}."})
+        return search.search_entries(text, kinds)
+
+
+class MarketplaceView(generics.GenericAPIView):
+    """Open gigs and services interleaved newest first, in compact form"""
+    permission_classes = [IsAuthenticated]
+    pagination_class = MergedKeysetPagination
+    
+    def get(self, request):
+        kinds = None
+        type_filter = request.query_params.get('type')
+        if type_filter:
+            kinds = [kind.strip() for kind in type_filter.split(',') if kind.strip()]
+            valid = set(marketplace.KINDS)
+            if not set(kinds) <= valid:
+                raise ValidationError({'type': f"Choose from: {', '.join(sorted(valid))}."})
+        paginator = self.paginator
+        page = paginator.paginate_streams(marketplace.streams(kinds), request)
+        return paginator.get_paginated_response([marketplace.compact(row) for row in page])
+
+
+class AnalyticsView(generics.GenericAPIView):
+    """Daily views, bids and bookings for the current client's listings"""
+    permission_classes = [IsAuthenticated]
+    max_days = 365
+    
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            raise ValidationError({'days': 'Must be an integer.'})
+        if not 1 <= days <= self.max_days:
+            raise ValidationError({'days': f'Must be between 1 and {self.max_days}.'})
+        
+        listing = None
+        listing_param = request.query_params.get('listing')
+        if listing_param:
+            kind, _, object_id = listing_param.partition(':')
+            if kind not in rollups.MODELS or not object_id.isdigit():
+                raise ValidationError({'listing': 'Use "gig:<id>" or "service:<id>".'})
+            listing = (kind, int(object_id))
+        
+        end = timezone.localdate()
+        start = end - timedelta(days=days - 1)
+        return Response(rollups.dashboard(request.user.pk, start, end, listing))
+
+
+class UploadViewSet(mixins.CreateModelMixin,
+                    mixins.RetrieveModelMixin,
+                    mixins.DestroyModelMixin,
+                    viewsets.GenericViewSet):
+    """Resumable uploads: create a session, PUT chunks, then finalize"""
+    serializer_class = UploadSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return Upload.objects.filter(owner=self.request.user)
+    
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+    
+    def perform_destroy(self, instance):
+        uploads.discard(instance)
+        instance.delete()
+    
+    def _upload_error(self, error):
+        body = {'error': error.message}
+        if error.offset is not None:
+            body['offset'] = error.offset
+        return Response(body, status=error.status_code)
+    
+    def update(self, request, pk=None):
+        """Append a chunk; the raw request body is streamed straight to disk"""
+        get_object_or_404(self.get_queryset().only('id'), pk=pk)
+        try:
+            upload = uploads.write_chunk(
+                pk, request.user, request.stream,
+                request.headers.get('Content-Range'),
+                request.headers.get('X-Chunk-SHA256'),
+            )
+        except uploads.UploadError as error:
+            return self._upload_error(error)
+        return Response(UploadSerializer(upload, context={'request': request}).data)
+    
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """Check length and checksum, then move the file into media storage"""
+        get_object_or_404(self.get_queryset().only('id'), pk=pk)
+        try:
+            upload = uploads.finalize(pk, request.user, request.data.get('sha256'))
+        except uploads.UploadError as error:
+            return self._upload_error(error)
+        return Response(UploadSerializer(upload, context={'request': request}).data)
@@ -18,6 +18,33 @@ function getCSRFToken() {
   return null;
 }
 
+// Conditional GETs: bodies that came with validators are kept for the session
+// and revalidated, so an unchanged list or post comes back as an empty 304
+const VALIDATED_PREFIX = 'ableConnect:validated:';
+
+function readValidated(url) {
+  try {
+    const stored = window.sessionStorage.getItem(VALIDATED_PREFIX + url);
+    return stored ? JSON.parse(stored) : null;
+  } catch (error) {
+    return null;
+  }
+}
+
+function storeValidated(url, response, data) {
+  const etag = response.headers.get('ETag');
+  const lastModified = response.headers.get('Last-Modified');
+  if (!etag && !lastModified) return;
+  try {
+    window.sessionStorage.setItem(VALIDATED_PREFIX + url, JSON.stringify({ etag, lastModified, data }));
+  } catch (error) {
+    // Storage is full: drop the kept bodies and start over
+    Object.keys(window.sessionStorage)
+      .filter((key) => key.startsWith(VALIDATED_PREFIX))
+      .forEach((key) => window.sessionStorage.removeItem(key));
+  }
+}
+
 // Helper function for API calls
 async function apiCall(endpoint, options = {}) {
   const url = `${API_BASE_URL}${endpoint}`;
@@ -43,8 +70,17 @@ async function apiCall(endpoint, options = {}) {
     }
   }
   
+  const validated = method === 'GET' ? readValidated(url) : null;
+  if (validated) {
+    if (validated.etag) config.headers['If-None-Match'] = validated.etag;
+    if (validated.lastModified) config.headers['If-Modified-Since'] = validated.lastModified;
+  }
+  
   try {
     const response = await fetch(url, config);
+    if (response.status === 304 && validated) {
+      return validated.data;
+    }
     
     // Handle non-JSON responses (like connection errors)
     let data;
@@ -62,6 +98,9 @@ async function apiCall(endpoint, options = {}) {
       throw new Error(data.error || data.detail || `Request failed: ${response.status}`);
     }
     
+    if (method === 'GET') {
+      storeValidated(url, response, data);
+    }
     return data;
   } catch (error) {
     // Check if it's a connection error
@@ -77,6 +116,133 @@ async function apiCall(endpoint, options = {}) {
   }
 }
 
+// Resumable uploads: files go up in checksummed chunks and are then referenced by id
+const UPLOAD_CHUNK_SIZE = 1024 * 1024;
+
+async function sha256Hex(buffer) {
+  if (!(window.crypto && window.crypto.subtle)) return null;
+  const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function uploadResumable(file, { chunkSize = UPLOAD_CHUNK_SIZE, maxRetries = 5 } = {}) {
+  const session = await apiCall('/uploads/', {
+    method: 'POST',
+    body: JSON.stringify({ filename: file.name, size: file.size }),
+  });
+  let offset = session.offset;
+  let retries = 0;
+  
+  while (offset < file.size) {
+    const end = Math.min(offset + chunkSize, file.size);
+    const chunk = await file.slice(offset, end).arrayBuffer();
+    const headers = {
+      'Content-Type': 'application/octet-stream',
+      'Content-Range': `bytes ${offset}-${end - 1}/${file.size}`,
+    };
+    const checksum = await sha256Hex(chunk);
+    if (checksum) headers['X-Chunk-SHA256'] = checksum;
+    
+    try {
+      const result = await apiCall(`/uploads/${session.id}/`, { method: 'PUT', headers, body: chunk });
+      offset = result.offset;
+      retries = 0;
+    } catch (error) {
+      retries += 1;
+      if (retries > maxRetries) throw error;
+      // The server drops a failed chunk; ask where to resume from
+      const status = await apiCall(`/uploads/${session.id}/`);
+      offset = status.offset;
+    }
+  }
+  
+  const finalized = await apiCall(`/uploads/${session.id}/finalize/`, {
+    method: 'POST',
+    body: JSON.stringify({}),
+  });
+  return finalized.id;
+}
+
+// Chat socket: the server pushes new messages, read receipts and typing events
+function chatSocketURL() {
+  const base = API_BASE_URL.startsWith('http') ? new URL(API_BASE_URL) : window.location;
+  const scheme = base.protocol === 'https:' ? 'wss:' : 'ws:';
+  return `${scheme}//${base.host}/ws/chat/`;
+}
+
+function connectChat(onEvent, { onOpen = null, maxDelay = 30000 } = {}) {
+  let socket = null;
+  let delay = 1000;
+  let closed = false;
+  
+  const open = () => {
+    if (closed || typeof WebSocket === 'undefined') return;
+    socket = new WebSocket(chatSocketURL());
+    socket.onopen = () => {
+      delay = 1000;
+      if (onOpen) onOpen();
+    };
+    socket.onmessage = (event) => {
+      try {
+        onEvent(JSON.parse(event.data));
+      } catch (error) {
+        console.error('Error handling chat event:', error);
+      }
+    };
+    socket.onclose = () => {
+      socket = null;
+      if (closed) return;
+      // Reconnect with backoff; onOpen lets the page fetch what it missed
+      setTimeout(open, delay);
+      delay = Math.min(delay * 2, maxDelay);
+    };
+  };
+  open();
+  
+  const isOpen = () => socket !== null && socket.readyState === WebSocket.OPEN;
+  return {
+    isOpen,
+    send: (event) => {
+      if (isOpen()) socket.send(JSON.stringify(event));
+    },
+    close: () => {
+      closed = true;
+      if (socket) socket.close();
+    },
+  };
+}
+
+// Badge counters: Server-Sent Events, or a long-poll loop where EventSource is missing.
+// onEvent receives { type: 'snapshot', unread } and { type: 'counter', counter, key, delta | value }.
+function subscribeActivity(onEvent) {
+  const url = `${API_BASE_URL}/events/`;
+  if (typeof EventSource !== 'undefined') {
+    // EventSource reconnects by itself and gets a fresh snapshot each time
+    const source = new EventSource(url, { withCredentials: true });
+    source.addEventListener('snapshot', (e) => onEvent({ type: 'snapshot', ...JSON.parse(e.data) }));
+    source.addEventListener('counter', (e) => onEvent({ type: 'counter', ...JSON.parse(e.data) }));
+    return { close: () => source.close() };
+  }
+  
+  let closed = false;
+  const poll = async () => {
+    let wantSnapshot = true;
+    while (!closed) {
+      try {
+        const data = await apiCall(`/events/?mode=poll${wantSnapshot ? '&snapshot=1' : ''}`);
+        if (data.snapshot) onEvent({ type: 'snapshot', ...data.snapshot });
+        data.events.forEach((event) => onEvent({ type: 'counter', ...event }));
+        wantSnapshot = false;
+      } catch (error) {
+        wantSnapshot = true;
+        await new Promise((resolve) => setTimeout(resolve, 5000));
+      }
+    }
+  };
+  poll();
+  return { close: () => { closed = true; } };
+}
+
 // Authentication API
 const authAPI = {
   register: async (userData) => {
@@ -109,26 +275,24 @@ const authAPI = {
 // Tubonge Posts API
 const tubongeAPI = {
   getPosts: async () => {
-    const data = await apiCall('/tubonge-posts/');
+    const data = await apiCall('/tubonge-posts/?view=lean');
     return data.results || data;
   },
   
   createPost: async (postData) => {
-    const formData = new FormData();
-    formData.append('text', postData.text || '');
+    const payload = { text: postData.text || '' };
     
     if (postData.mediaFile) {
-      formData.append('media_file', postData.mediaFile);
-      formData.append('media_type', postData.mediaType || 'image');
+      payload.media_upload_id = await uploadResumable(postData.mediaFile);
     }
     
     if (postData.link) {
-      formData.append('link', postData.link);
+      payload.link = postData.link;
     }
     
     return apiCall('/tubonge-posts/', {
       method: 'POST',
-      body: formData,
+      body: JSON.stringify(payload),
     });
   },
   
@@ -161,52 +325,103 @@ const messageAPI = {
   },
   
   getConversations: async () => {
-    return apiCall('/messages/conversations/');
+    const data = await apiCall('/messages/conversations/');
+    return data.results || data;
   },
   
-  getMessagesWithUser: async (userId) => {
-    return apiCall(`/messages/with_user/?user_id=${userId}`);
+  // Returns { results, has_more }: the newest window, or older/newer rows around an id
+  getMessagesWithUser: async (userId, { beforeId = null, sinceId = null, limit = null } = {}) => {
+    const params = new URLSearchParams({ user_id: userId });
+    if (beforeId !== null) params.set('before_id', beforeId);
+    if (sinceId !== null) params.set('since_id', sinceId);
+    if (limit !== null) params.set('limit', limit);
+    return apiCall(`/messages/with_user/?${params.toString()}`);
   },
+  
+  connect: connectChat,
 };
 
+// Follow keyset `next` links until every page of a listing has been read
+async function fetchAllPages(endpoint) {
+  const results = [];
+  let next = endpoint;
+  while (next) {
+    const data = await apiCall(next);
+    results.push(...data.results);
+    next = data.next ? `${endpoint.split('?')[0]}${new URL(data.next).search}` : null;
+  }
+  return results;
+}
+
+// Query string for the listing filters; empty values are left out
+function listingParams(status, filters = {}) {
+  const params = new URLSearchParams();
+  Object.entries({ status, ...filters }).forEach(([key, value]) => {
+    if (value !== null && value !== undefined && value !== '') {
+      params.set(key, value);
+    }
+  });
+  return params.toString();
+}
+
 // Gigs API
 const gigAPI = {
-  getGigs: async (status = null) => {
-    const endpoint = status ? `/gigs/?status=${status}` : '/gigs/';
-    const data = await apiCall(endpoint);
+  // filters: { min_price, max_price, created_after, created_before, ordering }
+  getGigs: async (status = null, filters = {}) => {
+    const params = listingParams(status, filters);
+    const data = await apiCall(params ? `/gigs/?${params}` : '/gigs/');
     return data.results || data;
   },
   
+  // Counts per status and price bucket for the same filters
+  getGigFacets: async (status = null, filters = {}) => {
+    const params = listingParams(status, filters);
+    return apiCall(params ? `/gigs/facets/?${params}` : '/gigs/facets/');
+  },
+  
+  // Open gigs ranked against the current user's skills, best match first
+  getRecommendedGigs: async (limit = 20) => {
+    const data = await apiCall(`/gigs/recommended/?limit=${limit}`);
+    return data.results;
+  },
+  
+  // The current user's gigs with bid_count, filtered on the server
+  getMyGigs: async (status = null) => {
+    return fetchAllPages(status ? `/gigs/mine/?page_size=100&status=${status}` : '/gigs/mine/?page_size=100');
+  },
+  
   createGig: async (gigData) => {
-    const formData = new FormData();
-    formData.append('title', gigData.title);
-    formData.append('description', gigData.description);
-    formData.append('price', gigData.price);
-    formData.append('timeframe', gigData.timeframe);
-    formData.append('requirements', gigData.requirements);
+    const payload = {
+      title: gigData.title,
+      description: gigData.description,
+      price: gigData.price,
+      timeframe: gigData.timeframe,
+      requirements: gigData.requirements,
+    };
     
     if (gigData.document) {
-      formData.append('document', gigData.document);
+      payload.document_upload_id = await uploadResumable(gigData.document);
     }
     
     return apiCall('/gigs/', {
       method: 'POST',
-      body: formData,
+      body: JSON.stringify(payload),
     });
   },
   
   placeBid: async (gigId, bidData) => {
-    const formData = new FormData();
-    formData.append('amount', bidData.amount);
-    formData.append('proposal', bidData.proposal);
+    const payload = {
+      amount: bidData.amount,
+      proposal: bidData.proposal,
+    };
     
     if (bidData.document) {
-      formData.append('document', bidData.document);
+      payload.document_upload_id = await uploadResumable(bidData.document);
     }
     
     return apiCall(`/gigs/${gigId}/bid/`, {
       method: 'POST',
-      body: formData,
+      body: JSON.stringify(payload),
     });
   },
 
@@ -220,41 +435,59 @@ const gigAPI = {
 
 // Services API
 const serviceAPI = {
-  getServices: async (status = null) => {
-    const endpoint = status ? `/services/?status=${status}` : '/services/';
-    const data = await apiCall(endpoint);
+  // filters: { min_price, max_price, created_after, created_before, ordering }
+  getServices: async (status = null, filters = {}) => {
+    const params = listingParams(status, filters);
+    const data = await apiCall(params ? `/services/?${params}` : '/services/');
     return data.results || data;
   },
   
+  // Counts per status and price bucket for the same filters
+  getServiceFacets: async (status = null, filters = {}) => {
+    const params = listingParams(status, filters);
+    return apiCall(params ? `/services/facets/?${params}` : '/services/facets/');
+  },
+  
+  // Open services ranked against the current user's skills, best match first
+  getRecommendedServices: async (limit = 20) => {
+    const data = await apiCall(`/services/recommended/?limit=${limit}`);
+    return data.results;
+  },
+  
+  // The current user's services with booking_count, filtered on the server
+  getMyServices: async (status = null) => {
+    return fetchAllPages(status ? `/services/mine/?page_size=100&status=${status}` : '/services/mine/?page_size=100');
+  },
+  
   createService: async (serviceData) => {
-    const formData = new FormData();
-    formData.append('title', serviceData.title);
-    formData.append('description', serviceData.description);
-    formData.append('price', serviceData.price);
-    formData.append('duration', serviceData.duration);
-    formData.append('requirements', serviceData.requirements);
+    const payload = {
+      title: serviceData.title,
+      description: serviceData.description,
+      price: serviceData.price,
+      duration: serviceData.duration,
+      requirements: serviceData.requirements,
+    };
     
     if (serviceData.document) {
-      formData.append('document', serviceData.document);
+      payload.document_upload_id = await uploadResumable(serviceData.document);
     }
     
     return apiCall('/services/', {
       method: 'POST',
-      body: formData,
+      body: JSON.stringify(payload),
     });
   },
   
   bookService: async (serviceId, bookingData) => {
-    const formData = new FormData();
-    formData.append('proposal', bookingData.proposal);
+    const payload = { proposal: bookingData.proposal };
     
     if (bookingData.document) {
-      formData.append('document', bookingData.document);
+      payload.document_upload_id = await uploadResumable(bookingData.document);
     }
     
     return apiCall(`/services/${serviceId}/book/`, {
       method: 'POST',
-      body: formData,
+      body: JSON.stringify(payload),
     });
   },
 
@@ -267,11 +500,43 @@ const serviceAPI = {
 };
 
 // Export for use in other files
+// Marketplace API: open gigs and services in one newest-first stream
+const marketplaceAPI = {
+  // Items carry `type` ('gig' or 'service') and a shortened `summary`;
+  // pass the returned `next` URL back as `cursor` for the following page.
+  getPage: async ({ pageSize = 50, type = null, cursor = null } = {}) => {
+    if (cursor) {
+      return apiCall(`/marketplace/${new URL(cursor).search}`);
+    }
+    const params = new URLSearchParams({ page_size: pageSize });
+    if (type) {
+      params.set('type', type);
+    }
+    return apiCall(`/marketplace/?${params}`);
+  },
+};
+
+// Analytics API: daily rollups for the current client's listings
+const analyticsAPI = {
+  // listing: optional 'gig:<id>' or 'service:<id>' to chart a single listing
+  get: async ({ days = 30, listing = null } = {}) => {
+    const params = new URLSearchParams({ days });
+    if (listing) {
+      params.set('listing', listing);
+    }
+    return apiCall(`/analytics/?${params}`);
+  },
+};
+
 window.ableConnectAPI = {
   auth: authAPI,
+  uploads: { upload: uploadResumable },
+  activity: { subscribe: subscribeActivity },
   tubonge: tubongeAPI,
   messages: messageAPI,
   gigs: gigAPI,
   services: serviceAPI,
+  marketplace: marketplaceAPI,
+  analytics: analyticsAPI,
 };
 
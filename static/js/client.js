@@ -298,12 +298,11 @@ async function fetchClientContent() {
   
   try {
     const [gigs, services] = await Promise.all([
-      window.ableConnectAPI.gigs.getGigs(),
-      window.ableConnectAPI.services.getServices(),
+      window.ableConnectAPI.gigs.getMyGigs(),
+      window.ableConnectAPI.services.getMyServices(),
     ]);
     
     const filteredGigs = gigs
-      .filter(gig => gig.client && gig.client.id === currentUser.id)
       .map(gig => ({
         id: gig.id,
         title: gig.title,
@@ -319,7 +318,6 @@ async function fetchClientContent() {
       }));
     
     const filteredServices = services
-      .filter(service => service.client && service.client.id === currentUser.id)
       .map(service => ({
         id: service.id,
         title: service.title,
@@ -368,6 +366,35 @@ function renderHistory() {
   if (bidCountEl) bidCountEl.textContent = history.bids;
 }
 
+// Daily views and bids/bookings from /api/analytics/, which reads rollups only
+async function renderTrends() {
+  const totalsEl = document.getElementById('trendTotals');
+  const chartEl = document.getElementById('trendChart');
+  if (!(totalsEl && chartEl && window.ableConnectAPI && window.ableConnectAPI.analytics && contentSyncedFromAPI)) return;
+  
+  let report;
+  try {
+    report = await window.ableConnectAPI.analytics.get({ days: 30 });
+  } catch (error) {
+    console.error('Unable to load analytics', error);
+    return;
+  }
+  
+  const { views, bids, bookings } = report.totals;
+  totalsEl.textContent = `${views} views, ${bids} bids, ${bookings} bookings`;
+  chartEl.innerHTML = '';
+  const busiest = Math.max(1, ...report.daily.map(day => day.views + day.bids + day.bookings));
+  report.daily.forEach((day) => {
+    const total = day.views + day.bids + day.bookings;
+    const li = document.createElement('li');
+    li.className = 'trend-day';
+    li.title = `${day.date}: ${day.views} views, ${day.bids} bids, ${day.bookings} bookings`;
+    li.setAttribute('aria-label', li.title);
+    li.style.setProperty('--trend-height', `${Math.round((total / busiest) * 100)}%`);
+    chartEl.appendChild(li);
+  });
+}
+
 function renderActivity() {
   const activityList = document.getElementById('activityList');
   if (!activityList) return;
@@ -726,6 +753,111 @@ async function handleTubongeClick() {
 
 // Chat Modal Functions
 let currentChatUserId = null;
+let chatSocket = null;
+let typingTimer = null;
+
+let chatThread = { oldestId: null, newestId: null, hasOlder: false };
+
+function createChatBubble(text, isOutgoing) {
+  const msgDiv = document.createElement('div');
+  msgDiv.style.cssText = `
+    margin: 8px 0;
+    padding: 8px 12px;
+    border-radius: 8px;
+    max-width: 70%;
+    word-wrap: break-word;
+    ${isOutgoing 
+      ? 'background: #00450d; color: white; margin-left: auto; text-align: right;' 
+      : 'background: #e0e0e0; color: #333;'}
+  `;
+  msgDiv.textContent = text;
+  return msgDiv;
+}
+
+function appendChatMessage(chatContent, text, isOutgoing) {
+  // Drop the "No messages yet" placeholder before the first bubble
+  if (!chatContent.querySelector('div[style*="max-width"]')) {
+    chatContent.innerHTML = '';
+  }
+  chatContent.appendChild(createChatBubble(text, isOutgoing));
+}
+
+// Append a message from the API unless it is already on screen
+function appendThreadMessage(chatContent, msg) {
+  if (chatThread.newestId !== null && msg.id <= chatThread.newestId) return;
+  appendChatMessage(chatContent, msg.text, !isCurrentChatUser(msg.sender));
+  chatThread.newestId = msg.id;
+  if (chatThread.oldestId === null) chatThread.oldestId = msg.id;
+}
+
+// Fetch only the messages newer than the last one shown
+async function syncNewChatMessages() {
+  const chatContent = document.getElementById('chatContent');
+  if (!currentChatUserId || !chatContent || chatThread.newestId === null) return;
+  let page;
+  do {
+    page = await window.ableConnectAPI.messages.getMessagesWithUser(currentChatUserId, { sinceId: chatThread.newestId });
+    page.results.forEach(msg => appendThreadMessage(chatContent, msg));
+  } while (page.has_more && page.results.length);
+  chatContent.scrollTop = chatContent.scrollHeight;
+}
+
+// Prepend the window before the oldest message shown, keeping the scroll position
+async function loadOlderChatMessages() {
+  const chatContent = document.getElementById('chatContent');
+  if (!currentChatUserId || !chatContent || !chatThread.hasOlder || chatThread.loading) return;
+  chatThread.loading = true;
+  try {
+    const page = await window.ableConnectAPI.messages.getMessagesWithUser(currentChatUserId, { beforeId: chatThread.oldestId });
+    const previousHeight = chatContent.scrollHeight;
+    const firstChild = chatContent.firstChild;
+    page.results.forEach(msg => {
+      chatContent.insertBefore(createChatBubble(msg.text, !isCurrentChatUser(msg.sender)), firstChild);
+    });
+    if (page.results.length) chatThread.oldestId = page.results[0].id;
+    chatThread.hasOlder = page.has_more;
+    chatContent.scrollTop = chatContent.scrollHeight - previousHeight;
+  } catch (error) {
+    console.error('Error loading older messages:', error);
+  } finally {
+    chatThread.loading = false;
+  }
+}
+
+function isCurrentChatUser(userId) {
+  return currentChatUserId !== null && String(userId) === String(currentChatUserId);
+}
+
+function handleChatEvent(event) {
+  const chatContent = document.getElementById('chatContent');
+  if (event.type === 'message') {
+    const msg = event.message;
+    if (!chatContent || !(isCurrentChatUser(msg.sender.id) || isCurrentChatUser(msg.recipient.id))) return;
+    appendThreadMessage(chatContent, { ...msg, sender: msg.sender.id });
+    chatContent.scrollTop = chatContent.scrollHeight;
+    if (isCurrentChatUser(msg.sender.id)) {
+      chatSocket.send({ type: 'read', user: msg.sender.id });
+    }
+  } else if (event.type === 'typing' && isCurrentChatUser(event.user)) {
+    const titleEl = document.getElementById('chatModalTitle');
+    if (!titleEl) return;
+    if (!titleEl.dataset.title) titleEl.dataset.title = titleEl.textContent;
+    titleEl.textContent = `${titleEl.dataset.title} (typing...)`;
+    clearTimeout(typingTimer);
+    typingTimer = setTimeout(() => {
+      titleEl.textContent = titleEl.dataset.title;
+      delete titleEl.dataset.title;
+    }, 3000);
+  }
+}
+
+function ensureChatSocket() {
+  if (!chatSocket && window.ableConnectAPI && window.ableConnectAPI.messages && window.ableConnectAPI.messages.connect) {
+    chatSocket = window.ableConnectAPI.messages.connect(handleChatEvent, {
+      onOpen: () => syncNewChatMessages().catch(error => console.error('Error syncing messages:', error)),
+    });
+  }
+}
 
 async function openChatModal(pwdUserEmail) {
   if (!pwdUserEmail) {
@@ -738,6 +870,7 @@ async function openChatModal(pwdUserEmail) {
   }
   
   currentChatUserId = pwdUserEmail;
+  ensureChatSocket();
   
   // Ensure both users are registered in allUsers
   const allUsers = JSON.parse(localStorage.getItem('allUsers')) || {};
@@ -805,7 +938,9 @@ async function renderChatMessages() {
   // Try API first
   if (window.ableConnectAPI && window.ableConnectAPI.messages) {
     try {
-      const messages = await window.ableConnectAPI.messages.getMessagesWithUser(currentChatUserId);
+      const page = await window.ableConnectAPI.messages.getMessagesWithUser(currentChatUserId);
+      const messages = page.results;
+      chatThread = { oldestId: null, newestId: null, hasOlder: page.has_more };
       
       if (!messages || messages.length === 0) {
         chatContent.innerHTML = '<div style="text-align: center; color: #666; padding: 20px;">No messages yet. Start the conversation!</div>';
@@ -814,22 +949,7 @@ async function renderChatMessages() {
       
       chatContent.innerHTML = '';
       
-      messages.forEach(msg => {
-        const msgDiv = document.createElement('div');
-        const isOutgoing = msg.sender.id === currentUser.id;
-        msgDiv.style.cssText = `
-          margin: 8px 0;
-          padding: 8px 12px;
-          border-radius: 8px;
-          max-width: 70%;
-          word-wrap: break-word;
-          ${isOutgoing 
-            ? 'background: #00450d; color: white; margin-left: auto; text-align: right;' 
-            : 'background: #e0e0e0; color: #333;'}
-        `;
-        msgDiv.textContent = msg.text;
-        chatContent.appendChild(msgDiv);
-      });
+      messages.forEach(msg => appendThreadMessage(chatContent, msg));
       
       chatContent.scrollTop = chatContent.scrollHeight;
       return;
@@ -907,8 +1027,14 @@ async function sendChatMessage() {
       // Clear input
       input.value = '';
       
-      // Re-render messages
-      await renderChatMessages();
+      // The chat socket delivers our own message back; otherwise fetch just the new rows
+      if (!(chatSocket && chatSocket.isOpen())) {
+        if (chatThread.newestId === null) {
+          await renderChatMessages();
+        } else {
+          await syncNewChatMessages();
+        }
+      }
       return;
     } catch (error) {
       console.error('Error sending message via API:', error);
@@ -999,16 +1125,27 @@ function getChatConversation(userId) {
 document.addEventListener('DOMContentLoaded', () => {
   const sendBtn = document.getElementById('sendMessageBtn');
   const chatInput = document.getElementById('chatModalInput');
+  const chatContent = document.getElementById('chatContent');
+  
+  if (chatContent) {
+    chatContent.addEventListener('scroll', () => {
+      if (chatContent.scrollTop === 0) loadOlderChatMessages();
+    });
+  }
   
   if (sendBtn) {
     sendBtn.addEventListener('click', sendChatMessage);
   }
   
   if (chatInput) {
+    let lastTypingSent = 0;
     chatInput.addEventListener('keydown', (e) => {
       if (e.key === 'Enter' && !e.shiftKey) {
         e.preventDefault();
         sendChatMessage();
+      } else if (chatSocket && currentChatUserId && Date.now() - lastTypingSent > 2000) {
+        lastTypingSent = Date.now();
+        chatSocket.send({ type: 'typing', user: currentChatUserId });
       }
     });
   }
@@ -1023,6 +1160,22 @@ document.addEventListener('DOMContentLoaded', async () => {
   if (!currentUser) return;
   await fetchClientContent();
   renderHistory();
+  renderTrends();
   renderActivity();
   renderPostedItems();
-});
\ No newline at end of file
+  subscribeToPostedItemCounters();
+});
+
+// Bump bid/booking counts on posted items as they arrive instead of re-fetching lists
+function subscribeToPostedItemCounters() {
+  if (!(window.ableConnectAPI && window.ableConnectAPI.activity && contentSyncedFromAPI)) return;
+  window.ableConnectAPI.activity.subscribe((event) => {
+    if (event.type !== 'counter' || !('delta' in event)) return;
+    const type = { bids: 'gig', bookings: 'service' }[event.counter];
+    if (!type) return;
+    const item = postedItems.find((i) => i.type === type && i.id == event.key);
+    if (!item) return;
+    item.bids = (item.bids || 0) + event.delta;
+    renderPostedItems();
+  });
+}
\ No newline at end of file
@@ -115,16 +115,17 @@ async function syncCurrentUserWithBackend() {
   return JSON.parse(localStorage.getItem('userData') || 'null');
 }
 
+// Accepts both full serializer output and compact marketplace items
 function formatGigFromApi(gig) {
   return {
     id: gig.id,
     title: gig.title,
-    description: gig.description,
+    description: gig.description ?? gig.summary,
     price: gig.price,
     timeframe: gig.timeframe,
     requirements: gig.requirements || 'See description',
-    client: gig.client,
-    clientName: gig.client?.username || gig.client?.email || 'Client',
+    client: gig.client ?? gig.client_id,
+    clientName: gig.client_name || gig.client?.username || gig.client?.email || 'Client',
     status: gig.status || 'open',
   };
 }
@@ -133,40 +134,45 @@ function formatServiceFromApi(service) {
   return {
     id: service.id,
     title: service.title,
-    description: service.description,
+    description: service.description ?? service.summary,
     price: service.price,
     duration: service.duration,
     requirements: service.requirements || 'Contact provider for details',
-    client: service.client,
-    clientName: service.client?.username || service.client?.email || 'Client',
+    client: service.client ?? service.client_id,
+    clientName: service.client_name || service.client?.username || service.client?.email || 'Client',
     status: service.status || 'open',
   };
 }
 
-async function fetchGigsFromAPI() {
-  if (!(window.ableConnectAPI && window.ableConnectAPI.gigs)) {
-    return;
-  }
-
-  try {
-    const gigs = await window.ableConnectAPI.gigs.getGigs();
-    availableGigs = gigs.map(formatGigFromApi);
-  } catch (error) {
-    console.error('Unable to load gigs from the API. Using fallback data.', error);
-    availableGigs = [...sampleGigs];
-  }
+// Skill matches lead, in rank order; the remaining listings keep their order
+function recommendedFirst(items, recommended) {
+  const recommendedIds = new Set(recommended.map(item => item.id));
+  return [...recommended, ...items.filter(item => !recommendedIds.has(item.id))];
 }
 
-async function fetchServicesFromAPI() {
-  if (!(window.ableConnectAPI && window.ableConnectAPI.services)) {
+// One request for the newest open gigs and services; skill matches are
+// fetched alongside only for users who listed skills
+async function fetchMarketplaceFromAPI() {
+  if (!(window.ableConnectAPI && window.ableConnectAPI.marketplace)) {
     return;
   }
 
+  const user = getStoredUser();
+  const hasSkills = Boolean(user && Array.isArray(user.skills) && user.skills.length);
+
   try {
-    const services = await window.ableConnectAPI.services.getServices();
-    availableServices = services.map(formatServiceFromApi);
+    const [page, recommendedGigs, recommendedServices] = await Promise.all([
+      window.ableConnectAPI.marketplace.getPage({ pageSize: 50 }),
+      hasSkills ? window.ableConnectAPI.gigs.getRecommendedGigs().catch(() => []) : [],
+      hasSkills ? window.ableConnectAPI.services.getRecommendedServices().catch(() => []) : [],
+    ]);
+    const gigs = page.results.filter(item => item.type === 'gig');
+    const services = page.results.filter(item => item.type === 'service');
+    availableGigs = recommendedFirst(gigs, recommendedGigs).map(formatGigFromApi);
+    availableServices = recommendedFirst(services, recommendedServices).map(formatServiceFromApi);
   } catch (error) {
-    console.error('Unable to load services from the API. Using fallback data.', error);
+    console.error('Unable to load the marketplace from the API. Using fallback data.', error);
+    availableGigs = [...sampleGigs];
     availableServices = [...sampleServices];
   }
 }
@@ -919,7 +925,7 @@ document.addEventListener('DOMContentLoaded', async () => {
   renderServices();
   
   // Load API data in background (non-blocking)
-  Promise.all([fetchGigsFromAPI(), fetchServicesFromAPI()]).then(() => {
+  fetchMarketplaceFromAPI().then(() => {
     // Re-render with API data when available
     renderGigs();
     renderServices();
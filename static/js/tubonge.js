@@ -113,9 +113,12 @@ async function getPosts() {
         text: post.text || '',
         mediaUrl: post.media_file ? post.media_file : null,
         mediaType: post.media_type,
+        mediaStatus: post.media_status,
+        mediaSrcset: post.media_srcset || {},
         link: post.link,
         timestamp: post.created_at,
         likes: post.likes ? post.likes.map(u => u.id || u) : [],
+        likedByMe: post.liked_by_me, // Lean feed flag instead of full like list
         like_count: post.like_count, // Keep API like_count
         comments: post.comments ? post.comments.map(c => ({
           id: c.id,
@@ -289,10 +292,10 @@ function createPostElement(post, index) {
   
   const postAuthor = { name: authorName };
   // Check if current user liked the post - handle both array of IDs and array of user objects
-  const isLiked = currentUser && post.likes && (
+  const isLiked = currentUser && (post.likedByMe === true || post.likes && (
     post.likes.includes(currentUser.id) || 
     (Array.isArray(post.likes) && post.likes.some(u => (typeof u === 'object' ? u.id : u) === currentUser.id))
-  );
+  ));
   // Get like count - handle both array length and like_count property from API
   const likeCount = post.like_count !== undefined ? post.like_count : (post.likes ? post.likes.length : 0);
   // Get comment count - handle both array length and comments_count property from API
@@ -301,10 +304,14 @@ function createPostElement(post, index) {
   const timeAgo = getTimeAgo(new Date(post.timestamp));
   
   let mediaContent = '';
-  if (post.mediaType === 'image' && post.mediaUrl) {
-    mediaContent = `<img src="${post.mediaUrl}" alt="Post image">`;
+  const srcset = post.mediaSrcset || {};
+  if (post.mediaStatus === 'processing') {
+    mediaContent = `<div class="media-processing">Processing media...</div>`;
+  } else if (post.mediaType === 'image' && post.mediaUrl) {
+    mediaContent = buildResponsiveImage(post.mediaUrl, srcset);
   } else if (post.mediaType === 'video' && post.mediaUrl) {
-    mediaContent = `<video controls><source src="${post.mediaUrl}" type="video/mp4">Your browser does not support the video tag.</video>`;
+    const poster = srcset.poster ? ` poster="${srcset.poster}" preload="none"` : '';
+    mediaContent = `<video controls${poster}><source src="${post.mediaUrl}" type="video/mp4">Your browser does not support the video tag.</video>`;
   }
   
   let linkContent = '';
@@ -346,6 +353,23 @@ function createPostElement(post, index) {
   return postDiv;
 }
 
+// Build an <img> (or <picture> with a WebP source) from the server's resized variants
+function buildResponsiveImage(originalUrl, srcset) {
+  const toSrcset = (variants) => Object.keys(variants || {})
+    .map(width => `${variants[width]} ${width}w`)
+    .join(', ');
+  const jpeg = toSrcset(srcset.jpeg);
+  if (!jpeg) {
+    return `<img src="${originalUrl}" alt="Post image" loading="lazy">`;
+  }
+  const webp = toSrcset(srcset.webp);
+  const sizes = '(max-width: 700px) 100vw, 640px';
+  return `<picture>
+      ${webp ? `<source type="image/webp" srcset="${webp}" sizes="${sizes}">` : ''}
+      <img src="${originalUrl}" srcset="${jpeg}" sizes="${sizes}" alt="Post image" loading="lazy">
+    </picture>`;
+}
+
 // Render comments
 function renderComments(postIndex, comments) {
   const commentsList = document.getElementById(`comments-list-${postIndex}`);